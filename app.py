@@ -8,7 +8,12 @@ from flask import send_from_directory
 
 # Import configuration and database
 from config import SECRET_KEY, DATABASE_URL, PACKAGE_DATA_PATH, LATEX_RENDERER, QIMAGE_PATH
+from config import IMAGE_CACHE_SIZE, IMAGE_CACHE_MB, IMAGE_PRINT_WIDTH
+from config import KATEX_POOL_SIZE, KATEX_TIMEOUT, RENDER_CACHE_PATH, RENDER_CACHE_SIZE, VIEW_FLUSH_SECONDS
+from config import EQUIV_POOL_SIZE, EQUIV_MAX_QUEUE, EQUIV_TIMEOUT, EQUIV_CACHE_SIZE, EQUIV_TIMEOUT_TTL
+from config import FEVAL_POOL_SIZE, FEVAL_MAX_QUEUE, FEVAL_TIMEOUT, FEVAL_CPU_SECONDS, FEVAL_MEMORY_MB
 from db import db
+from view_counter import view_counter
 from models import UserTable
 
 # Import blueprints
@@ -36,9 +41,28 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_reset_on_return": "rollback",  # rollback any open transaction when connection returns to pool
 }
 app.config["LATEX_RENDERER"] = LATEX_RENDERER
+app.config["KATEX_POOL_SIZE"] = KATEX_POOL_SIZE
+app.config["KATEX_TIMEOUT"] = KATEX_TIMEOUT
+app.config["RENDER_CACHE_PATH"] = RENDER_CACHE_PATH
+app.config["RENDER_CACHE_SIZE"] = RENDER_CACHE_SIZE
+app.config["VIEW_FLUSH_SECONDS"] = VIEW_FLUSH_SECONDS
+app.config["EQUIV_POOL_SIZE"] = EQUIV_POOL_SIZE
+app.config["EQUIV_MAX_QUEUE"] = EQUIV_MAX_QUEUE
+app.config["EQUIV_TIMEOUT"] = EQUIV_TIMEOUT
+app.config["EQUIV_CACHE_SIZE"] = EQUIV_CACHE_SIZE
+app.config["EQUIV_TIMEOUT_TTL"] = EQUIV_TIMEOUT_TTL
+app.config["FEVAL_POOL_SIZE"] = FEVAL_POOL_SIZE
+app.config["FEVAL_MAX_QUEUE"] = FEVAL_MAX_QUEUE
+app.config["FEVAL_TIMEOUT"] = FEVAL_TIMEOUT
+app.config["FEVAL_CPU_SECONDS"] = FEVAL_CPU_SECONDS
+app.config["FEVAL_MEMORY_MB"] = FEVAL_MEMORY_MB
+app.config["IMAGE_CACHE_SIZE"] = IMAGE_CACHE_SIZE
+app.config["IMAGE_CACHE_MB"] = IMAGE_CACHE_MB
+app.config["IMAGE_PRINT_WIDTH"] = IMAGE_PRINT_WIDTH
 
 # Initialize database
 db.init_app(app)
+view_counter.init_app(app)
 
 
 @app.teardown_appcontext
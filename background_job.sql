@@ -0,0 +1,24 @@
+-- DDL for prod.background_job
+-- Progress and result of background jobs (qb/jobs.py). Kept in the database
+-- so a poll of /quiz/api/jobs/<job_id> works on whichever gunicorn worker it
+-- lands on. The partial unique index makes start_job single-flight per name
+-- across workers; updated_at is the heartbeat used to expire jobs whose
+-- worker died.
+
+CREATE TABLE prod.background_job (
+    id          VARCHAR(32) PRIMARY KEY,
+    name        TEXT NOT NULL,
+    status      VARCHAR(20) NOT NULL,
+    done        INTEGER NOT NULL DEFAULT 0,
+    total       INTEGER NOT NULL DEFAULT 0,
+    message     TEXT,
+    result      JSON,
+    error       TEXT,
+    created_at  TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at  TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP
+);
+
+CREATE UNIQUE INDEX uq_background_job_active_name
+    ON prod.background_job (name)
+    WHERE status IN ('queued', 'running');
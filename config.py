@@ -22,6 +22,10 @@ CURRENT_SCHEMA = os.getenv("APP_SCHEMA", "prod")
 # Math renderer: 'katex' (default, uses node katex_render.js) or 'mathml' (fallback, no node needed)
 LATEX_RENDERER = os.getenv("LATEX_RENDERER", "katex")
 
+# KaTeX worker pool: node processes kept alive per gunicorn worker, and per-render timeout (seconds)
+KATEX_POOL_SIZE = int(os.getenv("KATEX_POOL_SIZE", "2"))
+KATEX_TIMEOUT = float(os.getenv("KATEX_TIMEOUT", "10"))
+
 SECRET_KEY = os.getenv("SECRET_KEY", "devsecret")
 
 # Package data path - use local test directory in development, /data/mont on render
@@ -39,3 +43,32 @@ if _on_render:
     QIMAGE_PATH = os.getenv("QIMAGE_PATH", "/data/qimage")
 else:
     QIMAGE_PATH = os.getenv("QIMAGE_PATH", r"C:\OneDrive--MEInc\OneDrive\0000 - Montessori Online\qimage")
+
+# Images inlined into sheets and review pages (qb/images.py): encoded-payload LRU and print width
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+IMAGE_CACHE_MB = int(os.getenv("IMAGE_CACHE_MB", "64"))            # total encoded payload per worker
+IMAGE_PRINT_WIDTH = int(os.getenv("IMAGE_PRINT_WIDTH", "1200"))   # px; wider images are downscaled (0 = never)
+
+# Rendered-math cache — SQLite file shared by all gunicorn workers, plus an in-process LRU
+if _on_render:
+    RENDER_CACHE_PATH = os.getenv("RENDER_CACHE_PATH", "/data/cache/render_cache.sqlite3")
+else:
+    RENDER_CACHE_PATH = os.getenv("RENDER_CACHE_PATH", "./test_data/cache/render_cache.sqlite3")
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+
+# View counters are buffered in memory and flushed in bulk this often (0 = write through)
+VIEW_FLUSH_SECONDS = float(os.getenv("VIEW_FLUSH_SECONDS", "5"))
+
+# sympy equivalence checks run in a pool of warm worker processes
+EQUIV_POOL_SIZE = int(os.getenv("EQUIV_POOL_SIZE", "2"))
+EQUIV_MAX_QUEUE = int(os.getenv("EQUIV_MAX_QUEUE", "8"))   # waiting calls beyond this get 503
+EQUIV_TIMEOUT = float(os.getenv("EQUIV_TIMEOUT", "5"))     # seconds; worker is killed and replaced
+EQUIV_CACHE_SIZE = int(os.getenv("EQUIV_CACHE_SIZE", "4096"))      # in-process verdict LRU
+EQUIV_TIMEOUT_TTL = int(os.getenv("EQUIV_TIMEOUT_TTL", "120"))     # seconds a timeout stays cached
+
+# FEVAL rules run in a sandboxed pool of worker processes (qb/feval_sandbox.py)
+FEVAL_POOL_SIZE = int(os.getenv("FEVAL_POOL_SIZE", "2"))
+FEVAL_MAX_QUEUE = int(os.getenv("FEVAL_MAX_QUEUE", "16"))
+FEVAL_TIMEOUT = float(os.getenv("FEVAL_TIMEOUT", "2"))           # seconds; worker is killed and replaced
+FEVAL_CPU_SECONDS = int(os.getenv("FEVAL_CPU_SECONDS", "1"))     # CPU budget per rule (RLIMIT_CPU)
+FEVAL_MEMORY_MB = int(os.getenv("FEVAL_MEMORY_MB", "256"))       # worker address space (RLIMIT_AS)
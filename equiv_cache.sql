@@ -0,0 +1,29 @@
+-- DDL for prod.equiv_cache
+-- Shared memo of algebra equivalence verdicts (POST /quiz/api/check-expr-equiv),
+-- written by qb/equiv_cache.py. key = sha256 of the chain version and the
+-- whitespace-normalised user/correct expressions and sorted variables. Rows
+-- with expires_at set are cached timeouts and stop counting once expired.
+
+CREATE TABLE prod.equiv_cache (
+    key          VARCHAR(64) PRIMARY KEY,
+    user_expr    TEXT NOT NULL,
+    correct_expr TEXT NOT NULL,
+    variables    TEXT NOT NULL DEFAULT '',
+    equivalent   BOOLEAN NOT NULL,
+    stage        VARCHAR(20),
+    error        TEXT,
+    elapsed_ms   DOUBLE PRECISION,
+    chain_version INTEGER NOT NULL DEFAULT 0,
+    created_at   TIMESTAMPTZ DEFAULT now(),
+    expires_at   TIMESTAMPTZ
+);
+
+-- Expired negative entries can be cleared at any time:
+-- DELETE FROM prod.equiv_cache WHERE expires_at < now();
+
+-- Tables created before chain_version existed:
+-- ALTER TABLE prod.equiv_cache ADD COLUMN chain_version INTEGER NOT NULL DEFAULT 0;
+
+-- Verdicts from an older chain (qb/equivalence.py CHAIN_VERSION) never match
+-- a key again and can be deleted:
+-- DELETE FROM prod.equiv_cache WHERE chain_version < <CHAIN_VERSION>;
@@ -1,24 +1,70 @@
 /**
  * KaTeX server-side renderer.
- * Called by Python via subprocess. Reads a JSON payload from stdin:
+ *
+ * One-shot mode (default): reads a JSON payload from stdin:
  *   { "latex": "...", "displayMode": true|false }
  * Writes rendered HTML to stdout, exits 0 on success or 1 on error.
+ *
+ * Server mode (--server): long-lived worker used by the Python KaTeX pool.
+ * Reads one JSON request per line from stdin and writes one JSON response
+ * per line to stdout:
+ *   { "id": 1, "latex": "...", "displayMode": false } -> { "id": 1, "ok": true, "html": "..." }
+ *   { "id": 2, "ping": true }                         -> { "id": 2, "ok": true, "version": "0.16.x" }
+ *   { "id": 3, "batch": [{ "latex": "...", "displayMode": false }, ...] }
+ *        -> { "id": 3, "ok": true, "results": [{ "ok": true, "html": "..." } | { "ok": false, "error": "..." }, ...] }
+ * Errors are reported as { "id": ..., "ok": false, "error": "..." }.
  */
 const katex = require('katex');
-const chunks = [];
-process.stdin.on('data', d => chunks.push(d));
-process.stdin.on('end', () => {
-    try {
-        const { latex, displayMode } = JSON.parse(chunks.join(''));
-        const html = katex.renderToString(latex, {
-            displayMode: !!displayMode,
-            throwOnError: false,
-            output: 'html'
-        });
-        process.stdout.write(html);
-        process.exit(0);
-    } catch (e) {
-        process.stderr.write(e.message || String(e));
-        process.exit(1);
-    }
-});
+
+function render(latex, displayMode) {
+    return katex.renderToString(latex, {
+        displayMode: !!displayMode,
+        throwOnError: false,
+        output: 'html'
+    });
+}
+
+if (process.argv.includes('--server')) {
+    const readline = require('readline');
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+    rl.on('line', line => {
+        if (!line.trim()) return;
+        let id = null;
+        let response;
+        try {
+            const req = JSON.parse(line);
+            id = req.id === undefined ? null : req.id;
+            if (req.ping) {
+                response = { id, ok: true, version: katex.version };
+            } else if (Array.isArray(req.batch)) {
+                const results = req.batch.map(item => {
+                    try {
+                        return { ok: true, html: render(item.latex, item.displayMode) };
+                    } catch (e) {
+                        return { ok: false, error: e.message || String(e) };
+                    }
+                });
+                response = { id, ok: true, results };
+            } else {
+                response = { id, ok: true, html: render(req.latex, req.displayMode) };
+            }
+        } catch (e) {
+            response = { id, ok: false, error: e.message || String(e) };
+        }
+        process.stdout.write(JSON.stringify(response) + '\n');
+    });
+    rl.on('close', () => process.exit(0));
+} else {
+    const chunks = [];
+    process.stdin.on('data', d => chunks.push(d));
+    process.stdin.on('end', () => {
+        try {
+            const { latex, displayMode } = JSON.parse(chunks.join(''));
+            process.stdout.write(render(latex, displayMode));
+            process.exit(0);
+        } catch (e) {
+            process.stderr.write(e.message || String(e));
+            process.exit(1);
+        }
+    });
+}
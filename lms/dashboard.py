@@ -0,0 +1,225 @@
+"""Materialized /student-new dashboards — one stored snapshot per student.
+
+The student home page used to load every my_work_list row for the student
+and query a_unit, quiz, video, interaction and user_streak on every visit.
+build_dashboard() does that work once; the result (units with their ordered
+items, progress counts and stats) is stored in student_dashboard and served
+by dashboard_snapshot() with a single primary-key read until something
+invalidates it.
+
+    data = dashboard_snapshot(student)            # {'units': [...], 'stats': {...}}
+    invalidate_dashboards(user_ids=[student.id])  # in the same transaction as the change
+
+Writers call invalidate_dashboards() for every event that changes what a
+student sees: assignment, status changes, submitted and completed answers,
+quiz resets, unit content edits, quiz edits and view-counter flushes. It
+bumps the row's generation and clears the data; a page load that built a
+snapshot from older data only stores it if the generation is unchanged, so
+a concurrent change is never overwritten by a stale snapshot.
+"""
+
+import json
+import logging
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from db import db
+from models import AUnit, Interaction, MyWorkList, Quiz, StudentDashboard, UserStreak, UserTable, Video
+
+logger = logging.getLogger(__name__)
+
+_TABLE = StudentDashboard.__table__.fullname
+
+_READ_SQL = f"SELECT data, generation FROM {_TABLE} WHERE user_id = :user_id"
+
+_UPDATE_SQL = f"""
+UPDATE {_TABLE}
+SET data = CAST(:data AS json), built_at = now()
+WHERE user_id = :user_id AND generation = :generation
+"""
+
+_INSERT_SQL = f"""
+INSERT INTO {_TABLE} (user_id, generation, data, built_at)
+VALUES (:user_id, 0, CAST(:data AS json), now())
+ON CONFLICT (user_id) DO NOTHING
+"""
+
+# Upsert rather than UPDATE, so a student whose first snapshot is still being
+# built gets a row with a newer generation and that build is discarded. Rows
+# are locked in user id order, so two overlapping invalidations can't deadlock.
+_INVALIDATE_SQL = f"""
+INSERT INTO {_TABLE} AS d (user_id, generation)
+SELECT u.id, 1
+FROM {UserTable.__table__.fullname} u
+WHERE u.id = ANY(CAST(:user_ids AS int[]))
+   OR u.username = ANY(CAST(:usernames AS text[]))
+   OR u.username IN (SELECT m."user"
+                     FROM {MyWorkList.__table__.fullname} m
+                     WHERE m.item_code = ANY(CAST(:item_codes AS text[]))
+                        OR m.au_name = ANY(CAST(:au_names AS text[])))
+ORDER BY u.id
+ON CONFLICT (user_id) DO UPDATE
+    SET generation = d.generation + 1,
+        data       = NULL
+"""
+
+
+def invalidate_dashboards(user_ids=(), usernames=(), item_codes=(), au_names=(), conn=None):
+    """Mark stale the dashboards of students matching any of the filters.
+
+    Students are matched by id, by username, or by holding a my_work_list
+    row for one of ``item_codes`` or in one of the units ``au_names``. Runs
+    on ``conn`` if given, else db.session. Does not commit.
+    """
+    params = {
+        'user_ids':   [int(u) for u in user_ids],
+        'usernames':  list(usernames),
+        'item_codes': list(item_codes),
+        'au_names':   list(au_names),
+    }
+    if not any(params.values()):
+        return
+    (conn or db.session).execute(text(_INVALIDATE_SQL), params)
+
+
+def dashboard_snapshot(student):
+    """The stored dashboard for ``student`` (a UserTable), rebuilding and storing it if stale.
+
+    Commits when it stores a new snapshot. A failure to store is logged and
+    the freshly built dashboard is returned anyway.
+    """
+    row = db.session.execute(text(_READ_SQL), {'user_id': student.id}).first()
+    if row is not None and row.data is not None:
+        return row.data
+
+    data = build_dashboard(student)
+    params = {'user_id': student.id, 'data': json.dumps(data)}
+    try:
+        if row is None:
+            db.session.execute(text(_INSERT_SQL), params)
+        else:
+            db.session.execute(text(_UPDATE_SQL), dict(params, generation=row.generation))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("[DASHBOARD] could not store snapshot for user_id=%s: %s", student.id, e)
+    return data
+
+
+def build_dashboard(student):
+    """Units, ordered assigned items, per-unit quiz progress and stats for one student.
+
+    Only assigned items are listed, and only units with at least one
+    assigned quiz are shown; videos and interactions ride along.
+    """
+    all_rows = MyWorkList.query.filter_by(user=student.username).all()
+
+    # Per-unit quiz progress (all statuses, for progress bar)
+    q_progress = defaultdict(lambda: {'total': 0, 'done': 0})
+    for r in all_rows:
+        if r.item_code.startswith('Q-') and r.status in ('assigned', 'done'):
+            q_progress[r.au_name]['total'] += 1
+            if r.status == 'done':
+                q_progress[r.au_name]['done'] += 1
+
+    # Achievement stats
+    total_done      = sum(1 for r in all_rows if r.status == 'done')
+    total_remaining = sum(1 for r in all_rows if r.status == 'assigned' and r.item_code.startswith('Q-'))
+    streak_row = UserStreak.query.get(student.id)
+    stats = {'done': total_done, 'remaining': total_remaining, 'streak': streak_row.streak if streak_row else 0}
+
+    work_rows = [r for r in all_rows if r.status == 'assigned']
+    if not work_rows:
+        return {'units': [], 'stats': stats}
+
+    # ── Unit ordering from a_unit, item ordering from au_content ───────────
+    au_names = list({row.au_name for row in work_rows})
+    unit_rows = (AUnit.query
+                 .filter(AUnit.au_name.in_(au_names))
+                 .order_by(AUnit.au_id)
+                 .all())
+
+    ordered_au_names = [u.au_name for u in unit_rows]
+    for name in au_names:
+        if name not in ordered_au_names:
+            ordered_au_names.append(name)
+
+    au_content_order = {}
+    for unit in unit_rows:
+        codes = [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
+        au_content_order[unit.au_name] = {code: i for i, code in enumerate(codes)}
+
+    work_by_unit = defaultdict(list)
+    for row in work_rows:
+        work_by_unit[row.au_name].append(row)
+
+    for au_name in work_by_unit:
+        order = au_content_order.get(au_name, {})
+        work_by_unit[au_name].sort(key=lambda r: order.get(r.item_code, 9999))
+
+    # ── Item lookup maps ───────────────────────────────────────────────────
+    q_codes = {r.item_code for r in work_rows if r.item_code.startswith('Q-')}
+    v_codes = {r.item_code for r in work_rows if r.item_code.startswith('V-')}
+    i_codes = {r.item_code for r in work_rows if r.item_code.startswith('I-')}
+
+    quiz_titles, quiz_ids, quiz_total_q = {}, {}, {}
+    if q_codes:
+        for q in Quiz.query.filter(Quiz.quiz_code.in_(q_codes)).all():
+            quiz_titles[q.quiz_code]  = q.title
+            quiz_ids[q.quiz_code]     = q.id
+            quiz_total_q[q.quiz_code] = q.question_count or 0
+
+    video_names = {}
+    if v_codes:
+        for v in Video.query.filter(Video.lesson_code.in_(v_codes)).all():
+            video_names[v.lesson_code] = v.display_name
+
+    interaction_names = {}
+    if i_codes:
+        for i in Interaction.query.filter(Interaction.lesson_code.in_(i_codes)).all():
+            interaction_names[i.lesson_code] = i.display_name
+
+    # ── Template-ready structure ───────────────────────────────────────────
+    units = []
+    for au_name in ordered_au_names:
+        rows = work_by_unit.get(au_name, [])
+        if not any(r.item_code.startswith('Q-') for r in rows):
+            continue
+        items = []
+        for row in rows:
+            if row.item_code.startswith('Q-'):
+                items.append({
+                    'code':     row.item_code,
+                    'type':     'quiz',
+                    'name':     quiz_titles.get(row.item_code, row.item_code),
+                    'url':      None,
+                    'quiz_id':  quiz_ids.get(row.item_code),
+                    'views':    row.views or 0,
+                    'answered': row.questions_answered or 0,
+                    'total_q':  quiz_total_q.get(row.item_code, 0),
+                })
+            elif row.item_code.startswith('V-'):
+                items.append({
+                    'code':  row.item_code,
+                    'type':  'video',
+                    'name':  video_names.get(row.item_code, row.item_code),
+                    'url':   row.item_detail,
+                    'views': row.views or 0,
+                })
+            elif row.item_code.startswith('I-'):
+                items.append({
+                    'code':  row.item_code,
+                    'type':  'interaction',
+                    'name':  interaction_names.get(row.item_code, row.item_code),
+                    'url':   row.item_detail,
+                    'views': row.views or 0,
+                })
+            else:
+                items.append({'code': row.item_code, 'type': 'unknown',
+                              'name': row.item_code, 'url': None, 'views': row.views or 0})
+        prog = q_progress[au_name]
+        units.append({'au_name': au_name, 'work_items': items,
+                      'done_q': prog['done'], 'total_q': prog['total']})
+
+    return {'units': units, 'stats': stats}
@@ -0,0 +1,154 @@
+"""Legacy pack assignment (user_works) for any number of students at once.
+
+A pack (mx_work_packs) lists its works as pipe-separated mx_works ids in
+pack_contents. Assigning it copies each work into user_works for the
+student; a work the student already has from another pack is a conflict,
+which the admin either accepts (the copy is marked Past) or skips.
+
+    pack = load_pack(pack_id)                             # None if the pack doesn't exist
+    conflicts = find_conflicts(pack, usernames)           # {username: [conflict, ...]}
+    added = assign_pack(pack, usernames, conflicts, on_conflict='past')   # {username: rows added}
+
+The pack is resolved once per request, conflicts for every student come
+from one query, and all user_works rows go in with one INSERT, so assigning
+to a whole class costs the same handful of round trips as one student.
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from db import db
+from models import MXWorkPacks, MXWorks, UserWorks
+
+logger = logging.getLogger(__name__)
+
+# Work names starting with this are videos — never counted as conflicts
+VIDEO_PREFIX = 'V-'
+
+_CONFLICTS_SQL = f"""
+SELECT DISTINCT ON (uw.username, uw.work_id) uw.username, uw.work_id, uw.pack_id
+FROM {UserWorks.__table__.fullname} uw
+WHERE uw.username = ANY(CAST(:usernames AS text[]))
+  AND uw.work_id = ANY(CAST(:work_ids AS int[]))
+  AND uw.pack_id != :pack_id
+ORDER BY uw.username, uw.work_id, uw.pack_id
+"""
+
+_INSERT_SQL = f"""
+INSERT INTO {UserWorks.__table__.fullname}
+    (username, pack_id, work_id, work_level, work_name, work_link, work_rank, pack_desc,
+     work_score, incorrect, work_views, work_status, last_updated)
+SELECT p.username, :pack_id, w.work_id, w.work_level, w.work_name, w.work_link, p.work_rank, :pack_desc,
+       NULL, NULL, NULL, p.status, CURRENT_TIMESTAMP
+FROM unnest(CAST(:usernames AS text[]), CAST(:work_ids AS int[]), CAST(:ranks AS int[]),
+            CAST(:statuses AS text[])) AS p(username, work_id, work_rank, status)
+JOIN {MXWorks.__table__.fullname} w ON w.work_id = p.work_id
+ON CONFLICT (username, pack_id, work_id) DO NOTHING
+RETURNING username
+"""
+
+
+class Pack:
+    """A pack with its works resolved, in pack_contents order (rank = position + 1)."""
+
+    __slots__ = ('pack_id', 'pack_desc', 'works')
+
+    def __init__(self, pack_id, pack_desc, works):
+        self.pack_id = pack_id
+        self.pack_desc = pack_desc
+        self.works = works
+
+
+def load_pack(pack_id):
+    """The Pack for ``pack_id`` (works may be empty), or None if there is no such pack."""
+    pack = MXWorkPacks.query.get(pack_id)
+    if pack is None:
+        return None
+
+    work_ids = []
+    for part in (pack.pack_contents or '').split('|'):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            work_ids.append(int(part))
+        except ValueError:
+            logger.warning(f"Non-integer work_id in pack {pack_id}: {part} (skipped)")
+    work_ids = list(dict.fromkeys(work_ids))
+
+    by_id = {w.work_id: w for w in MXWorks.query.filter(MXWorks.work_id.in_(work_ids)).all()} if work_ids else {}
+    return Pack(pack_id, pack.pack_desc, [by_id[wid] for wid in work_ids if wid in by_id])
+
+
+def find_conflicts(pack, usernames):
+    """Works of ``pack`` each student already has from another pack (videos excluded).
+
+    Returns {username: [{'work_id', 'work_name', 'existing_pack_id'}, ...]} for
+    students with at least one conflict, in pack order.
+    """
+    names = {w.work_id: w.work_name for w in pack.works if not (w.work_name or '').startswith(VIDEO_PREFIX)}
+    usernames = list(dict.fromkeys(usernames))
+    if not names or not usernames:
+        return {}
+
+    rows = db.session.execute(text(_CONFLICTS_SQL), {
+        'usernames': usernames,
+        'work_ids':  list(names),
+        'pack_id':   pack.pack_id,
+    }).all()
+
+    existing = {(r.username, r.work_id): r.pack_id for r in rows}
+    conflicts = {}
+    for username in usernames:
+        found = [{'work_id': wid, 'work_name': name, 'existing_pack_id': existing[(username, wid)]}
+                 for wid, name in names.items() if (username, wid) in existing]
+        if found:
+            conflicts[username] = found
+    return conflicts
+
+
+def assign_pack(pack, usernames, conflicts=None, on_conflict='past'):
+    """Copy the pack's works into user_works for every student in one statement.
+
+    ``conflicts`` maps username to the conflicting work ids (or the dicts
+    find_conflicts returns). ``on_conflict`` decides what happens to those:
+    'past' adds them as Past, 'skip' leaves them out, 'ignore' adds them as
+    Future like any other work. Works the student already has in this pack
+    are left alone. Does not commit.
+
+    Returns {username: rows added}.
+    """
+    if on_conflict not in ('past', 'skip', 'ignore'):
+        raise ValueError(f"on_conflict must be 'past', 'skip' or 'ignore', not {on_conflict!r}")
+    conflicts = conflicts or {}
+    usernames = list(dict.fromkeys(usernames))
+
+    rows = []
+    for username in usernames:
+        conflict_ids = {c['work_id'] if isinstance(c, dict) else int(c) for c in conflicts.get(username, ())}
+        for rank, work in enumerate(pack.works, start=1):
+            status = 'Future'
+            if work.work_id in conflict_ids:
+                if on_conflict == 'skip':
+                    continue
+                if on_conflict == 'past':
+                    status = 'Past'
+            rows.append((username, work.work_id, rank, status))
+
+    added = dict.fromkeys(usernames, 0)
+    if not rows:
+        return added
+
+    names, work_ids, ranks, statuses = (list(col) for col in zip(*rows))
+    inserted = db.session.execute(text(_INSERT_SQL), {
+        'pack_id':   pack.pack_id,
+        'pack_desc': pack.pack_desc,
+        'usernames': names,
+        'work_ids':  work_ids,
+        'ranks':     ranks,
+        'statuses':  statuses,
+    }).scalars().all()
+    for username in inserted:
+        added[username] += 1
+    return added
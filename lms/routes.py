@@ -7,8 +7,11 @@ from datetime import datetime, timedelta
 import logging
 import os
 from db import db
-from models import UserTable, UserWorks, MXWorks, MXWorkPacks, EmailMessage, DonePacks, ContactSubmission, Video, Interaction, AUnit, Quiz, MyWorkList, UserStreak, ParkedUnit
+from models import UserTable, UserWorks, MXWorks, MXWorkPacks, EmailMessage, DonePacks, ContactSubmission, Video, Interaction, AUnit, Quiz, MyWorkList, ParkedUnit
+from lms.dashboard import dashboard_snapshot, invalidate_dashboards
+from lms.packs import assign_pack, find_conflicts, load_pack
 from lms.utils import parse_email_content, update_work_with_result
+from view_counter import view_counter
 
 logger = logging.getLogger(__name__)
 
@@ -161,16 +164,8 @@ def log_click():
     pack_id = data['pack_id']
     work_id = data['work_id']
 
-    db.session.execute(text("""
-        UPDATE prod.user_works
-        SET work_views = COALESCE(work_views, 0) + 1,
-            last_updated = CURRENT_TIMESTAMP
-        WHERE username = :u
-          AND pack_id = :p
-          AND work_id = :w
-    """), {'u': username, 'p': int(pack_id), 'w': int(work_id)})
-
-    db.session.commit()
+    # Buffered — flushed to user_works.work_views in bulk by view_counter
+    view_counter.hit_user_work(username, int(pack_id), int(work_id))
     return jsonify(success=True)
 
 
@@ -439,148 +434,57 @@ def update_pack_works(pack_id):
 @lms_bp.route('/assignwork', methods=['POST'])
 @login_required
 def assign_work():
-    from sqlalchemy.sql import bindparam
-    
-    students = request.form.getlist('student')
+    students = list(dict.fromkeys(request.form.getlist('student')))
     pack_id = int(request.form['package_id'])
     force = (request.form.get('force') == 'true')
-    results = []
-
-    for student in students:
-        logger.info(f"Assigning pack_id={pack_id} to student={student}")
-
-        fetch_ids_sql = text("""
-            SELECT unnest(string_to_array(pack_contents, '|')) AS work_id
-            FROM prod.mx_work_packs
-            WHERE pack_id = :pack_id
-        """)
-        work_ids_raw = db.session.execute(fetch_ids_sql, {"pack_id": pack_id}).mappings().all()
-        work_ids = []
-        for r in work_ids_raw:
-            s = (r['work_id'] or '').strip()
-            if not s:
-                continue
-            try:
-                work_ids.append(int(s))
-            except ValueError:
-                logger.warning(f"Non-integer work_id in pack {pack_id}: {s} (skipped)")
-        work_ids = list(dict.fromkeys(work_ids))
-
-        logger.info(f"Fetched work_ids for pack_id={pack_id}: {work_ids}")
-        if not work_ids:
-            results.append({
-                "student": student,
-                "conflict": True,
-                "conflict_items": [],
-                "can_assign": False,
-                "message": f"❌ No valid work_ids found for package {pack_id}."
-            })
-            continue
-
-        conflict_sql = text("""
-            SELECT work_id, pack_id, work_name
-            FROM prod.user_works
-            WHERE username = :username
-              AND work_id IN :work_ids
-              AND pack_id != :pack_id
-              AND COALESCE(work_name,'') NOT LIKE 'V%%'
-        """).bindparams(bindparam("work_ids", expanding=True))
-
-        conflicts = db.session.execute(
-            conflict_sql, {"username": student, "work_ids": work_ids, "pack_id": pack_id}
-        ).mappings().all()
-
-        conflict_items = [{"id": str(row['work_id']), "name": row['work_name']} for row in conflicts]
-
-        if conflicts and not force:
-            results.append({
-                "student": student,
-                "conflict": True,
-                "conflict_items": conflict_items,
-                "can_assign": False,
-                "message": f"Student {student}: {len(conflicts)} conflicts"
-            })
-            continue
+    logger.info(f"Assigning pack_id={pack_id} to students={students}")
+
+    def failed(student, message, conflict_items=()):
+        return {
+            "student": student,
+            "conflict": True,
+            "conflict_items": list(conflict_items),
+            "can_assign": False,
+            "message": message,
+        }
 
-        fetch_sql = text("""
-            SELECT 
-                m.pack_id,
-                m.pack_desc,
-                r.work_id,
-                r.work_level,
-                r.work_name,
-                r.work_link,
-                ROW_NUMBER() OVER () AS work_rank
-            FROM prod.mx_works r
-            JOIN (
-                SELECT pack_id, pack_desc, unnest(string_to_array(pack_contents, '|')) AS work_id
-                FROM prod.mx_work_packs
-                WHERE pack_id = :pack_id
-            ) m ON r.work_id = m.work_id::int
-        """)
-        works = db.session.execute(fetch_sql, {"pack_id": pack_id}).mappings().all()
-        if not works:
-            results.append({
-                "student": student,
-                "conflict": True,
-                "conflict_items": [],
-                "can_assign": False,
-                "message": f"❌ No works found for package {pack_id}."
-            })
-            continue
+    pack = load_pack(pack_id)
+    if pack is None or not pack.works:
+        return jsonify(results=[failed(s, f"❌ No works found for package {pack_id}.") for s in students])
 
-        conflict_ids = {int(c['work_id']) for c in conflicts} if conflicts else set()
-
-        insert_sql = text("""
-            INSERT INTO prod.user_works (
-                username, pack_id, work_id,
-                work_level, work_name, work_link,
-                work_rank, pack_desc,
-                work_score, incorrect, work_views, work_status, last_updated
-            ) VALUES (
-                :username, :pack_id, :work_id,
-                :work_level, :work_name, :work_link,
-                :work_rank, :pack_desc,
-                NULL, NULL, NULL, :work_status, CURRENT_TIMESTAMP
-            )
-            ON CONFLICT (username, pack_id, work_id) DO NOTHING;
-        """)
+    conflicts = find_conflicts(pack, students)
+    results = {}
+    assignable = []
+    for student in students:
+        found = conflicts.get(student, [])
+        if found and not force:
+            results[student] = failed(student, f"Student {student}: {len(found)} conflicts",
+                                      [{"id": str(c['work_id']), "name": c['work_name']} for c in found])
+        else:
+            assignable.append(student)
 
+    if assignable:
         try:
-            with db.engine.begin() as conn:
-                for w in works:
-                    status = 'Past' if int(w["work_id"]) in conflict_ids else 'Future'
-                    conn.execute(insert_sql, {
-                        "username": student,
-                        "pack_id": int(w["pack_id"]),
-                        "work_id": int(w["work_id"]),
-                        "work_level": w["work_level"],
-                        "work_name": w["work_name"],
-                        "work_link": w["work_link"],
-                        "work_rank": int(w["work_rank"]),
-                        "pack_desc": w["pack_desc"],
-                        "work_status": status
-                    })
-            results.append({
-                "student": student,
-                "conflict": False,
-                "conflict_items": [],
-                "can_assign": True,
-                "message": f"✅ Assigned package {pack_id} to {student} "
-                           f"({len(works)} works added; {len(conflict_ids)} Past, "
-                           f"{len(works) - len(conflict_ids)} Future)"
-            })
+            assign_pack(pack, assignable, conflicts, on_conflict='past')
+            db.session.commit()
+            for student in assignable:
+                n_past = len(conflicts.get(student, []))
+                results[student] = {
+                    "student": student,
+                    "conflict": False,
+                    "conflict_items": [],
+                    "can_assign": True,
+                    "message": f"✅ Assigned package {pack_id} to {student} "
+                               f"({len(pack.works)} works added; {n_past} Past, "
+                               f"{len(pack.works) - n_past} Future)"
+                }
         except Exception as e:
+            db.session.rollback()
             logger.exception("Assign failed")
-            results.append({
-                "student": student,
-                "conflict": True,
-                "conflict_items": [],
-                "can_assign": False,
-                "message": f"❌ Assign failed: {e}"
-            })
+            for student in assignable:
+                results[student] = failed(student, f"❌ Assign failed: {e}")
 
-    return jsonify(results=results)
+    return jsonify(results=[results[s] for s in students])
 
 
 @lms_bp.route('/mark_complete', methods=['POST'])
@@ -879,43 +783,9 @@ def check_assignment_conflicts():
     data = request.get_json()
     student = data.get('student')
     pack_id = int(data.get('pack_id'))
-    
-    pack_works = db.session.execute(
-        text("""
-            SELECT mw.work_id, mw.work_name 
-            FROM prod.mx_works mw
-            JOIN (
-                SELECT UNNEST(string_to_array(pack_contents, '|'))::int as work_id 
-                FROM prod.mx_work_packs 
-                WHERE pack_id = :pack_id
-            ) pw ON mw.work_id = pw.work_id
-        """), 
-        {"pack_id": pack_id}
-    ).mappings().all()
-    
-    conflicts = []
-    
-    for work in pack_works:
-        if work['work_name'].startswith('V-'):
-            continue
-            
-        existing = db.session.execute(
-            text("""
-                SELECT pack_id FROM prod.user_works 
-                WHERE username = :student 
-                AND work_id = :work_id 
-                AND pack_id != :pack_id
-            """),
-            {"student": student, "work_id": work['work_id'], "pack_id": pack_id}
-        ).mappings().first()
-        
-        if existing:
-            conflicts.append({
-                "work_id": work['work_id'],
-                "work_name": work['work_name'],
-                "existing_pack_id": existing['pack_id']
-            })
-    
+
+    pack = load_pack(pack_id)
+    conflicts = find_conflicts(pack, [student]).get(student, []) if pack else []
     return jsonify({"conflicts": conflicts})
 
 
@@ -923,97 +793,32 @@ def check_assignment_conflicts():
 @login_required
 def process_assignment():
     import json
-    
+
     student = request.form.get('student')
     pack_id = int(request.form.get('package_id'))
     mode = request.form.get('assignment_mode', 'normal')
     conflicts_json = request.form.get('conflicts', '[]')
-    
+
     try:
         conflicts = json.loads(conflicts_json) if conflicts_json else []
         conflict_work_ids = [c['workId'] for c in conflicts]
-        
-        pack_info = db.session.execute(
-            text("""
-                SELECT pack_desc FROM prod.mx_work_packs 
-                WHERE pack_id = :pack_id
-            """),
-            {"pack_id": pack_id}
-        ).mappings().first()
-        
-        if not pack_info:
+
+        pack = load_pack(pack_id)
+        if pack is None:
             return jsonify({
                 "success": False,
                 "message": f"❌ Pack {pack_id} not found"
             })
-        
-        pack_works = db.session.execute(
-            text("""
-                SELECT mw.work_id, mw.work_name, mw.work_link, mw.work_level,
-                       ROW_NUMBER() OVER() as work_rank
-                FROM prod.mx_works mw
-                JOIN (
-                    SELECT UNNEST(string_to_array(pack_contents, '|'))::int as work_id
-                    FROM prod.mx_work_packs 
-                    WHERE pack_id = :pack_id
-                ) pw ON mw.work_id = pw.work_id
-            """), 
-            {"pack_id": pack_id}
-        ).mappings().all()
-        
-        existing_works = db.session.execute(
-            text("""
-                SELECT work_id FROM prod.user_works 
-                WHERE username = :student AND pack_id = :pack_id
-            """),
-            {"student": student, "pack_id": pack_id}
-        ).mappings().all()
-        
-        existing_work_ids = [w['work_id'] for w in existing_works]
-        
-        for work in pack_works:
-            work_id = work['work_id']
-            
-            if work_id in existing_work_ids:
-                continue
-                
-            if mode == 'accept_dupes' and work_id in conflict_work_ids:
-                status = 'Past'
-            elif mode == 'reject_dupes' and work_id in conflict_work_ids:
-                continue
-            else:
-                status = 'Future'
-            
-            db.session.execute(
-                text("""
-                    INSERT INTO prod.user_works 
-                    (username, pack_id, work_id, work_level, work_name, work_link, 
-                     work_rank, pack_desc, work_score, incorrect, work_views, 
-                     work_status, last_updated)
-                    VALUES (:username, :pack_id, :work_id, :work_level, :work_name, 
-                            :work_link, :work_rank, :pack_desc, NULL, NULL, NULL, 
-                            :status, CURRENT_TIMESTAMP)
-                """),
-                {
-                    "username": student,
-                    "pack_id": pack_id,
-                    "work_id": work_id,
-                    "work_level": work['work_level'],
-                    "work_name": work['work_name'],
-                    "work_link": work['work_link'],
-                    "work_rank": work['work_rank'],
-                    "pack_desc": pack_info['pack_desc'],
-                    "status": status
-                }
-            )
-        
+
+        on_conflict = {'accept_dupes': 'past', 'reject_dupes': 'skip'}.get(mode, 'ignore')
+        assign_pack(pack, [student], {student: conflict_work_ids}, on_conflict=on_conflict)
         db.session.commit()
-        
+
         return jsonify({
             "success": True,
             "message": f"✅ Pack {pack_id} processed for {student} (mode: {mode})"
         })
-        
+
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error processing assignment: {e}")
@@ -1039,140 +844,11 @@ def student_home_new():
     if current_user.user_role not in ('student_new', 'new'):
         return "Forbidden", 403
 
-    from collections import defaultdict
-
-    username = current_user.username
-
-    # ── 1. Fetch ALL work rows for this student ────────────────────────────
-    all_rows = MyWorkList.query.filter_by(user=username).all()
-
-    # Per-unit quiz progress (all statuses, for progress bar)
-    from collections import defaultdict as _dd
-    q_progress = _dd(lambda: {'total': 0, 'done': 0})
-    for _r in all_rows:
-        if _r.item_code.startswith('Q-') and _r.status in ('assigned', 'done'):
-            q_progress[_r.au_name]['total'] += 1
-            if _r.status == 'done':
-                q_progress[_r.au_name]['done'] += 1
-
-    # Achievement stats
-    total_done      = sum(1 for _r in all_rows if _r.status == 'done')
-    total_remaining = sum(1 for _r in all_rows if _r.status == 'assigned' and _r.item_code.startswith('Q-'))
-    streak_row = UserStreak.query.get(current_user.id)
-    stats = {'done': total_done, 'remaining': total_remaining, 'streak': streak_row.streak if streak_row else 0}
-
-    if not all_rows:
-        return render_template("student_new.html", units=[],
-                               student_name=current_user.full_name or username,
-                               stats=stats)
-
-    # Keep only assigned items (quizzes, videos, and interactions)
-    work_rows = [r for r in all_rows if r.status == 'assigned']
-
-    # ── 2. Determine au_name ordering from a_unit table ────────────────────
-    au_names = list({row.au_name for row in work_rows})
-    unit_rows = (AUnit.query
-                 .filter(AUnit.au_name.in_(au_names))
-                 .order_by(AUnit.au_id)
-                 .all())
-
-    ordered_au_names = [u.au_name for u in unit_rows]
-    for name in au_names:
-        if name not in ordered_au_names:
-            ordered_au_names.append(name)
-
-    # Map au_name → item-code position from au_content
-    au_content_order = {}
-    for unit in unit_rows:
-        codes = [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
-        au_content_order[unit.au_name] = {code: i for i, code in enumerate(codes)}
-
-    # ── 3. Group and sort work rows ────────────────────────────────────────
-    work_by_unit = defaultdict(list)
-    for row in work_rows:
-        work_by_unit[row.au_name].append(row)
-
-    for au_name in work_by_unit:
-        order = au_content_order.get(au_name, {})
-        work_by_unit[au_name].sort(key=lambda r: order.get(r.item_code, 9999))
-
-    # ── 4. Build item lookup maps ──────────────────────────────────────────
-    q_codes = {r.item_code for rows in work_by_unit.values() for r in rows if r.item_code.startswith('Q-')}
-    v_codes = {r.item_code for rows in work_by_unit.values() for r in rows if r.item_code.startswith('V-')}
-    i_codes = {r.item_code for rows in work_by_unit.values() for r in rows if r.item_code.startswith('I-')}
-
-    quiz_titles  = {}
-    quiz_ids     = {}
-    quiz_total_q = {}
-    if q_codes:
-        for q in Quiz.query.filter(Quiz.quiz_code.in_(q_codes)).all():
-            quiz_titles[q.quiz_code]  = q.title
-            quiz_ids[q.quiz_code]     = q.id
-            quiz_total_q[q.quiz_code] = q.question_count or 0
-
-    video_names = {}
-    if v_codes:
-        for v in Video.query.filter(Video.lesson_code.in_(v_codes)).all():
-            video_names[v.lesson_code] = v.display_name
-
-    interaction_names = {}
-    if i_codes:
-        for i in Interaction.query.filter(Interaction.lesson_code.in_(i_codes)).all():
-            interaction_names[i.lesson_code] = i.display_name
-
-    # ── 5. Assemble template-ready structure ───────────────────────────────
-    # Only show a unit if it has at least one assigned quiz; videos ride along.
-    units = []
-    for au_name in ordered_au_names:
-        rows = work_by_unit.get(au_name, [])
-        if not rows:
-            continue
-        has_assigned_quiz = any(
-            r.item_code.startswith('Q-') and r.status == 'assigned'
-            for r in rows
-        )
-        if not has_assigned_quiz:
-            continue
-        items = []
-        for row in rows:
-            if row.item_code.startswith('Q-'):
-                items.append({
-                    'code':    row.item_code,
-                    'type':    'quiz',
-                    'name':    quiz_titles.get(row.item_code, row.item_code),
-                    'url':     None,
-                    'quiz_id': quiz_ids.get(row.item_code),
-                    'views':   row.views or 0,
-                    'answered': row.questions_answered or 0,
-                    'total_q': quiz_total_q.get(row.item_code, 0),
-                })
-            elif row.item_code.startswith('V-'):
-                items.append({
-                    'code':  row.item_code,
-                    'type':  'video',
-                    'name':  video_names.get(row.item_code, row.item_code),
-                    'url':   row.item_detail,
-                    'views': row.views or 0,
-                })
-            elif row.item_code.startswith('I-'):
-                items.append({
-                    'code':  row.item_code,
-                    'type':  'interaction',
-                    'name':  interaction_names.get(row.item_code, row.item_code),
-                    'url':   row.item_detail,
-                    'views': row.views or 0,
-                })
-            else:
-                items.append({'code': row.item_code, 'type': 'unknown',
-                              'name': row.item_code, 'url': None, 'views': row.views or 0})
-        prog = q_progress[au_name]
-        units.append({'au_name': au_name, 'work_items': items,
-                      'done_q': prog['done'], 'total_q': prog['total']})
-
-    return render_template("student_new.html", units=units,
-                           student_name=current_user.full_name or username,
+    dashboard = dashboard_snapshot(current_user)
+    return render_template("student_new.html", units=dashboard['units'],
+                           student_name=current_user.full_name or current_user.username,
                            user_id=current_user.id,
-                           stats=stats)
+                           stats=dashboard['stats'])
 
 
 @lms_bp.route('/student-new/mark-viewed', methods=['POST'])
@@ -1183,10 +859,7 @@ def student_mark_viewed():
     item_code = (request.get_json(silent=True) or {}).get('item_code', '')
     if not item_code:
         return jsonify(ok=False), 400
-    row = MyWorkList.query.filter_by(user=current_user.username, item_code=item_code).first()
-    if row:
-        row.views = (row.views or 0) + 1
-        db.session.commit()
+    view_counter.hit_work_item(current_user.username, item_code)
     return jsonify(ok=True)
 
 
@@ -1390,17 +1063,11 @@ def units_create():
         au_content=None,
     )
     db.session.add(unit)
-    db.session.commit()
+    db.session.flush()
 
     # Auto-park the new unit for every active, assignable student
-    active_students = UserTable.query.filter(
-        UserTable.user_role == 'student_new',
-        UserTable.can_assign_work == True,
-    ).all()
-    for s in active_students:
-        db.session.add(ParkedUnit(student_id=s.id, unit_id=unit.au_id))
-    if active_students:
-        db.session.commit()
+    _park_units(unit_id=unit.au_id)
+    db.session.commit()
 
     return jsonify({'ok': True, 'au_id': unit.au_id})
 
@@ -1433,6 +1100,7 @@ def units_add_videos():
     existing_set = set(existing)
     new_codes = [c for c in codes if c not in existing_set]
     unit.au_content = '|'.join(existing + new_codes)
+    invalidate_dashboards(au_names=[unit.au_name])
     db.session.commit()
     return jsonify({'ok': True, 'au_content': unit.au_content})
 
@@ -1454,6 +1122,7 @@ def units_add_interactions():
     existing_set = set(existing)
     new_codes = [c for c in codes if c not in existing_set]
     unit.au_content = '|'.join(existing + new_codes)
+    invalidate_dashboards(au_names=[unit.au_name])
     db.session.commit()
     return jsonify({'ok': True, 'au_content': unit.au_content})
 
@@ -1541,6 +1210,7 @@ def units_save_content(au_id):
     data  = request.get_json(force=True)
     codes = [c.strip() for c in (data.get('codes') or []) if c.strip()]
     unit.au_content = '|'.join(codes)
+    invalidate_dashboards(au_names=[unit.au_name])
     db.session.commit()
     return jsonify({'ok': True, 'au_content': unit.au_content})
 
@@ -1568,6 +1238,7 @@ def units_update(au_id):
         unit.au_area  = new_area or None
         unit.au_topic = new_topic or None
         unit.au_level = new_level or None
+        invalidate_dashboards(au_names=[new_name])
         db.session.commit()
         logger.info('Unit updated: au_id=%s name=%r area=%r by admin=%s',
                     au_id, new_name, new_area, current_user.username)
@@ -1624,57 +1295,79 @@ def unit_assign_list():
     ]})
 
 
-# ── Shared helper ────────────────────────────────────────────────────────────
+# ── Shared helpers ───────────────────────────────────────────────────────────
 
-def _assign_unit_to_student(student, unit):
-    """Insert my_work_list rows for every item in `unit` that the student doesn't already have.
+# One statement for any number of (student, unit, item) rows; the unique index
+# uq_my_work_list_user_unit_item turns existing rows into skips.
+_INSERT_WORK_ROWS_SQL = f"""
+INSERT INTO {MyWorkList.__table__.fullname} ("user", au_name, item_code, item_detail, views, status, user_id)
+SELECT p.username, p.au_name, p.item_code, p.item_detail, 0, :status, p.user_id
+FROM unnest(CAST(:usernames AS text[]), CAST(:au_names AS text[]), CAST(:item_codes AS text[]),
+            CAST(:item_details AS text[]), CAST(:user_ids AS int[]))
+     AS p(username, au_name, item_code, item_detail, user_id)
+ON CONFLICT ("user", au_name, item_code) DO NOTHING
+RETURNING user_id
+"""
 
-    Skips any item code already present (any status).
-    Does NOT commit — caller is responsible for db.session.commit().
-    Returns count of new rows added.
-    """
-    codes = [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
-    if not codes:
-        return 0
 
+def _unit_codes(unit):
+    return [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
+
+
+def _work_item_details(codes):
+    """item_detail (the URL) for the video and interaction codes among `codes`.
+
+    Quizzes are served via Quiz.questions_json at execution time — no copy needed.
+    """
     video_codes       = {c for c in codes if c.startswith('V-')}
     interaction_codes = {c for c in codes if c.startswith('I-')}
 
-    video_detail = {}
+    details = {}
     if video_codes:
         for v in Video.query.filter(Video.lesson_code.in_(video_codes)).all():
-            video_detail[v.lesson_code] = f'https://mx-app-mm.onrender.com/packages/advanced/{v.file_name}'
-
-    interaction_detail = {}
+            details[v.lesson_code] = f'https://mx-app-mm.onrender.com/packages/advanced/{v.file_name}'
     if interaction_codes:
         for i in Interaction.query.filter(Interaction.lesson_code.in_(interaction_codes)).all():
-            interaction_detail[i.lesson_code] = f'/static/interactions/{i.file_name}'
+            details[i.lesson_code] = f'/static/interactions/{i.file_name}'
+    return details
 
-    created = 0
-    for code in codes:
-        exists = MyWorkList.query.filter_by(
-            user=student.username, au_name=unit.au_name, item_code=code
-        ).first()
-        if exists:
-            continue
 
-        if code.startswith('V-'):
-            detail = video_detail.get(code)
-        elif code.startswith('I-'):
-            detail = interaction_detail.get(code)
-        else:
-            detail = None
-
-        db.session.add(MyWorkList(
-            user=student.username,
-            au_name=unit.au_name,
-            item_code=code,
-            item_detail=detail,
-            views=0,
-            status='future',
-            user_id=student.id,
-        ))
-        created += 1
+def _insert_work_rows(pairs, status='future'):
+    """Insert my_work_list rows for every item of every (student, unit) pair in one statement.
+
+    Skips any (user, au_name, item_code) that already exists, in any status.
+    Marks the dashboards of students who got new rows stale.
+    Does NOT commit — caller is responsible for db.session.commit().
+    Returns (created, skipped).
+    """
+    pairs = list(pairs)
+    details = _work_item_details({code for _, unit in pairs for code in _unit_codes(unit)})
+    rows = [(student.username, unit.au_name, code, details.get(code), student.id)
+            for student, unit in pairs for code in _unit_codes(unit)]
+    if not rows:
+        return 0, 0
+
+    usernames, au_names, item_codes, item_details, user_ids = (list(col) for col in zip(*rows))
+    inserted = db.session.execute(text(_INSERT_WORK_ROWS_SQL), {
+        'status':       status,
+        'usernames':    usernames,
+        'au_names':     au_names,
+        'item_codes':   item_codes,
+        'item_details': item_details,
+        'user_ids':     user_ids,
+    }).scalars().all()
+    invalidate_dashboards(user_ids=set(inserted))
+    return len(inserted), len(rows) - len(inserted)
+
+
+def _assign_unit_to_student(student, unit):
+    """Insert my_work_list rows for every item in `unit` that the student doesn't already have.
+
+    Skips any item code already present (any status).
+    Does NOT commit — caller is responsible for db.session.commit().
+    Returns count of new rows added.
+    """
+    created, _ = _insert_work_rows([(student, unit)])
     return created
 
 
@@ -1686,7 +1379,6 @@ def unit_assign_submit():
     Creates one my_work_list row per item code per student.
     Silently skips rows where (user, au_name, item_code) already exists.
     """
-    import json as _json
     if current_user.user_role not in ('admin', 'admin_new'):
         return jsonify({'ok': False, 'error': 'Forbidden'}), 403
 
@@ -1701,69 +1393,12 @@ def unit_assign_submit():
     users = {u.id: u for u in UserTable.query.filter(UserTable.id.in_(user_ids)).all()}
     units = {u.au_id: u for u in AUnit.query.filter(AUnit.au_id.in_(au_ids)).all()}
 
-    # Collect all item codes across selected units
-    all_codes = set()
-    for unit in units.values():
-        for c in (unit.au_content or '').split('|'):
-            if c.strip():
-                all_codes.add(c.strip())
-
-    quiz_codes        = {c for c in all_codes if c.startswith('Q-')}
-    video_codes       = {c for c in all_codes if c.startswith('V-')}
-    interaction_codes = {c for c in all_codes if c.startswith('I-')}
-
-    # item_detail stores the URL for videos and interactions.
-    # Quizzes are served via Quiz.questions_json at execution time — no copy needed.
-    video_detail = {}
-    for v in Video.query.filter(Video.lesson_code.in_(video_codes)).all():
-        video_detail[v.lesson_code] = f'https://mx-app-mm.onrender.com/packages/advanced/{v.file_name}'
-
-    interaction_detail = {}
-    for i in Interaction.query.filter(Interaction.lesson_code.in_(interaction_codes)).all():
-        interaction_detail[i.lesson_code] = f'/static/interactions/{i.file_name}'
-
-    created = 0
-    skipped = 0
+    pairs = [(users[user_id], units[au_id])
+             for user_id in user_ids if user_id in users
+             for au_id in au_ids if au_id in units]
 
     try:
-        for user_id in user_ids:
-            user = users.get(user_id)
-            if not user:
-                continue
-            username = user.username
-
-            for au_id in au_ids:
-                unit = units.get(au_id)
-                if not unit:
-                    continue
-                codes = [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
-
-                for code in codes:
-                    exists = MyWorkList.query.filter_by(
-                        user=username, au_name=unit.au_name, item_code=code
-                    ).first()
-                    if exists:
-                        skipped += 1
-                        continue
-
-                    if code.startswith('V-'):
-                        detail = video_detail.get(code)
-                    elif code.startswith('I-'):
-                        detail = interaction_detail.get(code)
-                    else:
-                        detail = None
-
-                    db.session.add(MyWorkList(
-                        user=username,
-                        au_name=unit.au_name,
-                        item_code=code,
-                        item_detail=detail,
-                        views=0,
-                        status='future',
-                        user_id=user_id,
-                    ))
-                    created += 1
-
+        created, skipped = _insert_work_rows(pairs)
         db.session.commit()
         msg = f'Assigned {created} item(s).'
         if skipped:
@@ -1990,6 +1625,7 @@ def unit_finetune_status():
 
     row.status = new_status
     row.last_updated = datetime.utcnow()
+    invalidate_dashboards(usernames=[row.user])
     db.session.commit()
     logger.info('Finetune status: row_id=%s status=%s by admin=%s', row_id, new_status, current_user.username)
     return jsonify({'ok': True})
@@ -2075,6 +1711,35 @@ def unit_activate_parked():
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 
+# Park units for every active, assignable student who has no work rows in
+# them; existing parked_units pairs are skipped by uq_parked_units_student_unit.
+_PARK_UNITS_SQL = f"""
+WITH parked AS (
+    INSERT INTO {ParkedUnit.__table__.fullname} (student_id, unit_id)
+    SELECT s.id, u.au_id
+    FROM {UserTable.__table__.fullname} s
+    CROSS JOIN {AUnit.__table__.fullname} u
+    WHERE s.user_role = 'student_new'
+      AND s.can_assign_work
+      AND (CAST(:unit_id AS int) IS NULL OR u.au_id = CAST(:unit_id AS int))
+      AND NOT EXISTS (SELECT 1
+                      FROM {MyWorkList.__table__.fullname} m
+                      WHERE m."user" = s.username AND m.au_name = u.au_name)
+    ON CONFLICT (student_id, unit_id) DO NOTHING
+    RETURNING 1
+)
+SELECT count(*) FROM parked
+"""
+
+
+def _park_units(unit_id=None):
+    """Park ``unit_id`` (default: every unit) for students with no work rows in it, in one statement.
+
+    Does NOT commit. Returns the number of parked_units rows created.
+    """
+    return db.session.execute(text(_PARK_UNITS_SQL), {'unit_id': unit_id}).scalar()
+
+
 @lms_bp.route('/unit/api/admin/backfill-parking', methods=['POST'])
 @login_required
 def backfill_parking():
@@ -2086,138 +1751,37 @@ def backfill_parking():
     if current_user.user_role not in ('admin', 'admin_new'):
         return jsonify({'ok': False, 'error': 'Forbidden'}), 403
 
-    students  = UserTable.query.filter(
-        UserTable.user_role == 'student_new',
-        UserTable.can_assign_work == True,
-    ).all()
-    all_units = AUnit.query.all()
-
-    existing_pairs = {(p.student_id, p.unit_id) for p in ParkedUnit.query.all()}
-
-    # Pairs that already have work rows (units already active for those students)
-    from sqlalchemy import distinct
-    assigned_pairs = {
-        (r.user, r.au_name)
-        for r in db.session.query(MyWorkList.user, MyWorkList.au_name).distinct().all()
-    }
-    username_map = {s.username: s.id for s in students}
-
-    created = 0
-    for student in students:
-        for unit in all_units:
-            if (student.id, unit.au_id) in existing_pairs:
-                continue  # already parked
-            if (student.username, unit.au_name) in assigned_pairs:
-                continue  # already has work rows → stays active
-            db.session.add(ParkedUnit(student_id=student.id, unit_id=unit.au_id))
-            created += 1
-
+    created = _park_units()
     db.session.commit()
     logger.info('Backfill parking: created=%s by admin=%s', created, current_user.username)
     return jsonify({'ok': True, 'created': created})
 
 
+@lms_bp.route('/unit/api/admin/view-counter/stats', methods=['GET'])
+@login_required
+def view_counter_stats():
+    """Buffered view-counter hits, pending increments and flush counters for this worker (admin only)."""
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    return jsonify({'ok': True, 'stats': view_counter.stats()})
+
+
 @lms_bp.route('/student-new/preview/<int:user_id>', methods=['GET'])
 @login_required
 def student_preview(user_id):
     if current_user.user_role not in ('admin', 'admin_new'):
         return "Forbidden", 403
 
-    from collections import defaultdict
-
     student = UserTable.query.get(user_id)
     if not student:
         return "Student not found", 404
 
-    username = student.username
-    all_rows = MyWorkList.query.filter_by(user=username).all()
-
-    q_progress = defaultdict(lambda: {'total': 0, 'done': 0})
-    for r in all_rows:
-        if r.item_code.startswith('Q-') and r.status in ('assigned', 'done'):
-            q_progress[r.au_name]['total'] += 1
-            if r.status == 'done':
-                q_progress[r.au_name]['done'] += 1
-
-    total_done = sum(1 for r in all_rows if r.status == 'done')
-    total_remaining = sum(1 for r in all_rows if r.status == 'assigned' and r.item_code.startswith('Q-'))
-    streak_row = UserStreak.query.get(user_id)
-    stats = {'done': total_done, 'remaining': total_remaining, 'streak': streak_row.streak if streak_row else 0}
-    preview_banner = f"Preview — viewing as: {student.full_name or username}"
-
-    if not all_rows:
-        return render_template("student_new.html", units=[],
-                               student_name=student.full_name or username,
-                               stats=stats, preview_banner=preview_banner)
-
-    # Preview shows only what the student sees: assigned items only
-    work_rows = [r for r in all_rows if r.status == 'assigned']
-
-    au_names = list({row.au_name for row in work_rows})
-    unit_rows = (AUnit.query
-                 .filter(AUnit.au_name.in_(au_names))
-                 .order_by(AUnit.au_id)
-                 .all())
-    ordered_au_names = [u.au_name for u in unit_rows]
-    for name in au_names:
-        if name not in ordered_au_names:
-            ordered_au_names.append(name)
-
-    au_content_order = {}
-    for unit in unit_rows:
-        codes = [c.strip() for c in (unit.au_content or '').split('|') if c.strip()]
-        au_content_order[unit.au_name] = {code: i for i, code in enumerate(codes)}
-
-    work_by_unit = defaultdict(list)
-    for row in work_rows:
-        work_by_unit[row.au_name].append(row)
-    for au_name in work_by_unit:
-        order = au_content_order.get(au_name, {})
-        work_by_unit[au_name].sort(key=lambda r: order.get(r.item_code, 9999))
-
-    q_codes = {r.item_code for rows in work_by_unit.values() for r in rows if r.item_code.startswith('Q-')}
-    v_codes = {r.item_code for rows in work_by_unit.values() for r in rows if r.item_code.startswith('V-')}
-
-    quiz_titles, quiz_ids, quiz_total_q = {}, {}, {}
-    if q_codes:
-        for q in Quiz.query.filter(Quiz.quiz_code.in_(q_codes)).all():
-            quiz_titles[q.quiz_code] = q.title
-            quiz_ids[q.quiz_code] = q.id
-            quiz_total_q[q.quiz_code] = q.question_count or 0
-
-    video_names = {}
-    if v_codes:
-        for v in Video.query.filter(Video.lesson_code.in_(v_codes)).all():
-            video_names[v.lesson_code] = v.display_name
-
-    units = []
-    for au_name in ordered_au_names:
-        rows = work_by_unit.get(au_name, [])
-        if not rows:
-            continue
-        items = []
-        for row in rows:
-            if row.item_code.startswith('Q-'):
-                items.append({'code': row.item_code, 'type': 'quiz',
-                              'name': quiz_titles.get(row.item_code, row.item_code),
-                              'url': None, 'quiz_id': quiz_ids.get(row.item_code),
-                              'views': row.views or 0,
-                              'answered': row.questions_answered or 0,
-                              'total_q': quiz_total_q.get(row.item_code, 0)})
-            elif row.item_code.startswith('V-'):
-                items.append({'code': row.item_code, 'type': 'video',
-                              'name': video_names.get(row.item_code, row.item_code),
-                              'url': row.item_detail, 'views': row.views or 0})
-            else:
-                items.append({'code': row.item_code, 'type': 'unknown',
-                              'name': row.item_code, 'url': None, 'views': row.views or 0})
-        prog = q_progress[au_name]
-        units.append({'au_name': au_name, 'work_items': items,
-                      'done_q': prog['done'], 'total_q': prog['total']})
-
-    return render_template("student_new.html", units=units,
-                           student_name=student.full_name or username,
-                           user_id=user_id, stats=stats,
-                           preview_banner=preview_banner)
+    # Preview shows exactly what the student sees
+    dashboard = dashboard_snapshot(student)
+    student_name = student.full_name or student.username
+    return render_template("student_new.html", units=dashboard['units'],
+                           student_name=student_name,
+                           user_id=user_id, stats=dashboard['stats'],
+                           preview_banner=f"Preview — viewing as: {student_name}")
 
 
@@ -155,6 +155,7 @@ class QBank(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.now())
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
     sync_required = db.Column(db.Boolean, default=False, nullable=False, server_default='false')
+    render_version = db.Column(db.String(64))  # render stamp of the stored html (qb.handlers.common.render_version)
 
 
 class Quiz(db.Model):
@@ -182,6 +183,47 @@ class Quiz(db.Model):
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
 
 
+class QuizQuestion(db.Model):
+    """Reverse index of Quiz.question_ids — one row per (quiz, position).
+
+    Quiz.question_ids stays the source of truth for ordering; every path that
+    writes it goes through qb.db_utils.set_quiz_question_ids(), which keeps
+    these rows in step. Used for "which quizzes contain question X" lookups.
+    """
+    __tablename__ = 'quiz_question'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('quiz_id', 'position'),
+        db.Index('ix_quiz_question_question_id', 'question_id'),
+        {'schema': CURRENT_SCHEMA},
+    )
+
+    quiz_id     = db.Column(db.Integer, db.ForeignKey(f'{CURRENT_SCHEMA}.quiz.id', ondelete='CASCADE'), nullable=False)
+    position    = db.Column(db.Integer, nullable=False)
+    question_id = db.Column(db.Integer, nullable=False)
+
+
+class EquivCacheEntry(db.Model):
+    """Shared memo of algebra equivalence verdicts (see qb/equiv_cache.py).
+
+    ``key`` is sha256 over the chain version, the whitespace-normalised
+    expressions and the sorted variable list. Rows with ``expires_at`` set
+    are negative entries (timeouts) and are ignored once expired.
+    """
+    __tablename__ = 'equiv_cache'
+    __table_args__ = {'schema': CURRENT_SCHEMA}
+
+    key          = db.Column(db.String(64), primary_key=True)
+    user_expr    = db.Column(db.Text, nullable=False)
+    correct_expr = db.Column(db.Text, nullable=False)
+    variables    = db.Column(db.Text, nullable=False, default='')   # comma-separated, sorted
+    equivalent   = db.Column(db.Boolean, nullable=False)
+    stage        = db.Column(db.String(20))
+    error        = db.Column(db.Text)
+    elapsed_ms   = db.Column(db.Float)
+    chain_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at   = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    expires_at   = db.Column(db.DateTime(timezone=True))
+
 
 class QuizExecution(db.Model):
     """Per-question answer record for a quiz session."""
@@ -198,6 +240,7 @@ class QuizExecution(db.Model):
     user_answer       = db.Column(db.String)
     correct_answer    = db.Column(db.String)
     is_correct        = db.Column(db.Boolean)
+    raw_answer        = db.Column(JSON)   # answer as the quiz page sent it — what qb.grading grades
     created_at        = db.Column(db.DateTime, server_default=db.func.now())
     updated_at        = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
@@ -205,7 +248,10 @@ class QuizExecution(db.Model):
 class MyWorkList(db.Model):
     """Student work queue — one row per assigned item (quiz or video) per student."""
     __tablename__ = 'my_work_list'
-    __table_args__ = {'schema': CURRENT_SCHEMA}
+    __table_args__ = (
+        db.Index('uq_my_work_list_user_unit_item', 'user', 'au_name', 'item_code', unique=True),
+        {'schema': CURRENT_SCHEMA},
+    )
 
     id           = db.Column(db.Integer, primary_key=True)
     user         = db.Column(db.String(100), nullable=False)
@@ -231,6 +277,39 @@ class UserStreak(db.Model):
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
 
+class StudentDashboard(db.Model):
+    """Stored /student-new page data for one student — built and invalidated by lms/dashboard.py."""
+    __tablename__ = 'student_dashboard'
+    __table_args__ = {'schema': CURRENT_SCHEMA}
+
+    user_id    = db.Column(db.Integer, db.ForeignKey(f'{CURRENT_SCHEMA}.user_table.id', ondelete='CASCADE'), primary_key=True)
+    data       = db.Column(JSON)   # NULL = stale, rebuilt on the next page load
+    generation = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    built_at   = db.Column(db.DateTime)
+
+
+class BackgroundJob(db.Model):
+    """State of a background job (qb/jobs.py), readable from every gunicorn worker."""
+    __tablename__ = 'background_job'
+    __table_args__ = (
+        db.Index('uq_background_job_active_name', 'name', unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+        {'schema': CURRENT_SCHEMA},
+    )
+
+    id          = db.Column(db.String(32), primary_key=True)
+    name        = db.Column(db.Text, nullable=False)
+    status      = db.Column(db.String(20), nullable=False)   # queued → running → done | failed
+    done        = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total       = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    message     = db.Column(db.Text)
+    result      = db.Column(JSON)
+    error       = db.Column(db.Text)
+    created_at  = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    updated_at  = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime)
+
+
 class ParkedUnit(db.Model):
     """Parking lot for assignment units — controls collapsed/expanded display on fine-tune page.
 
@@ -0,0 +1,30 @@
+-- DDL for prod.my_work_list unique (user, au_name, item_code)
+-- Unit assignment inserts all (student, unit, item) rows in one
+-- INSERT ... ON CONFLICT DO NOTHING (lms/routes.py _insert_work_rows); this
+-- index is what makes an existing row a skip instead of a duplicate.
+
+-- 1. Existing duplicates, if any — review before step 2
+SELECT "user", au_name, item_code, array_agg(id ORDER BY id) AS ids, array_agg(status ORDER BY id) AS statuses,
+       array_agg(questions_answered ORDER BY id) AS answered
+FROM prod.my_work_list
+GROUP BY "user", au_name, item_code
+HAVING count(*) > 1;
+
+-- 2. Keep the row with the most progress in each duplicate group: a done row
+--    first, then the most questions answered, then the most views, then the
+--    lowest id. Lookups used .first() with no ORDER BY, so which duplicate a
+--    student saw was arbitrary, and their progress may sit on any of them.
+DELETE FROM prod.my_work_list
+WHERE id IN (
+    SELECT id
+    FROM (SELECT id,
+                 ROW_NUMBER() OVER (PARTITION BY "user", au_name, item_code
+                                    ORDER BY (status = 'done') DESC, questions_answered DESC,
+                                             views DESC, id) AS rn
+          FROM prod.my_work_list) ranked
+    WHERE rn > 1
+);
+
+-- 3. The index
+CREATE UNIQUE INDEX uq_my_work_list_user_unit_item
+    ON prod.my_work_list ("user", au_name, item_code);
@@ -0,0 +1,7 @@
+-- DDL for prod.q_bank.render_version
+-- Render stamp (converter version : renderer : renderer version) of the html
+-- stored next to each latex field in q_bank.json, written on save. Read
+-- paths serve the stored html while the stamp matches the running app;
+-- rerender_questions.py re-renders rows whose stamp is missing or stale.
+
+ALTER TABLE prod.q_bank ADD COLUMN render_version VARCHAR(64);
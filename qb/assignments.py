@@ -7,6 +7,7 @@ from flask_login import login_required, current_user
 
 from db import db
 from models import UserTable, Quiz, MyWorkList
+from lms.dashboard import invalidate_dashboards
 from qb.routes import qb_bp
 
 logger = logging.getLogger(__name__)
@@ -114,6 +115,8 @@ def direct_assign_quizzes():
             ))
             created += 1
 
+    if created:
+        invalidate_dashboards(user_ids=list(user_map))
     db.session.commit()
     msg = f'Assigned {created} quiz(zes).'
     if skipped:
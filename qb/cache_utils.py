@@ -0,0 +1,95 @@
+"""Small in-process caching helpers shared across the QB modules."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL and hit/miss counters.
+
+        cache = LRUCache(maxsize=4096, ttl=None)
+        value = cache.get(key)          # None on miss
+        cache.set(key, value)
+
+    ``maxsize`` bounds memory; the least recently used entry is evicted first.
+    ``maxbytes`` additionally bounds the total len() of the values (for str /
+    bytes payloads); None means entries are only counted.
+    ``ttl`` (seconds) expires entries lazily on lookup; None means never.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None):
+        self.maxsize = max(int(maxsize), 1)
+        self.maxbytes = int(maxbytes) if maxbytes is not None else None
+        self.ttl = ttl
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _size(self, value):
+        return len(value) if self.maxbytes is not None else 0
+
+    def _discard(self, key):
+        entry = self._data.pop(key, self._MISSING)
+        if entry is not self._MISSING:
+            self.bytes -= self._size(entry[0])
+        return entry
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._discard(key)
+            self._data[key] = (value, expires)
+            self.bytes += self._size(value)
+            while len(self._data) > self.maxsize or \
+                    (self.maxbytes is not None and self.bytes > self.maxbytes):
+                self._discard(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._discard(key)
+        return default if entry is self._MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+            if self.maxbytes is not None:
+                stats["bytes"] = self.bytes
+                stats["maxbytes"] = self.maxbytes
+            return stats
@@ -1,8 +1,11 @@
 """Database utility functions for Question Bank operations."""
 
-from models import QBank
+from models import QBank, Quiz, QuizQuestion
 from db import db
-from qb.handlers.common import generate_question_html as ensure_question_html, save_image_from_data_url
+from lms.dashboard import invalidate_dashboards
+from sqlalchemy import text
+from sqlalchemy.orm import load_only
+from qb.handlers.common import generate_question_html as ensure_question_html, render_version, save_image_from_data_url
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,6 +38,88 @@ def interaction_code(interaction_id: int) -> str:
     return make_code('I', interaction_id)
 
 
+# ── Quiz ↔ question index ─────────────────────────────────────────────────────
+
+def set_quiz_question_ids(quiz, ids) -> None:
+    """Set quiz.question_ids and rewrite its quiz_question rows to match.
+
+    Every write of Quiz.question_ids must go through here. Flushes a new quiz
+    first so it has an id. Non-numeric entries are kept in the string but not
+    indexed. Students who have the quiz assigned get their dashboards (question
+    counts) marked stale. Does not commit.
+    """
+    ids = [str(i).strip() for i in ids if str(i).strip()]
+    quiz.question_ids = ','.join(ids)
+    if quiz.id is None:
+        db.session.add(quiz)
+        db.session.flush()
+    elif quiz.quiz_code:
+        invalidate_dashboards(item_codes=[quiz.quiz_code])
+    QuizQuestion.query.filter_by(quiz_id=quiz.id).delete(synchronize_session=False)
+    rows = [
+        {'quiz_id': quiz.id, 'position': pos, 'question_id': int(qid)}
+        for pos, qid in enumerate(ids) if qid.isdigit()
+    ]
+    if rows:
+        db.session.execute(QuizQuestion.__table__.insert(), rows)
+
+
+def quizzes_containing(question_ids):
+    """Query for quizzes that contain any of the given question IDs.
+
+    A semi-join on the quiz_question index — no DISTINCT over Quiz rows,
+    which Postgres cannot do with the json questions_json column.
+    """
+    if isinstance(question_ids, int):
+        question_ids = [question_ids]
+    quiz_ids = (db.session.query(QuizQuestion.quiz_id)
+                .filter(QuizQuestion.question_id.in_([int(i) for i in question_ids])))
+    return Quiz.query.filter(Quiz.id.in_(quiz_ids))
+
+
+def used_question_ids_subquery():
+    """Subquery of every question ID that appears in at least one quiz."""
+    return db.session.query(QuizQuestion.question_id).distinct()
+
+
+def backfill_quiz_questions() -> int:
+    """Rebuild all quiz_question rows from Quiz.question_ids in one statement. Does not commit."""
+    table = QuizQuestion.__table__.fullname
+    quiz_table = Quiz.__table__.fullname
+    db.session.execute(text(f"DELETE FROM {table}"))
+    result = db.session.execute(text(f"""
+        INSERT INTO {table} (quiz_id, position, question_id)
+        SELECT q.id, t.ord - 1, trim(t.qid)::int
+        FROM {quiz_table} q
+        CROSS JOIN LATERAL unnest(string_to_array(q.question_ids, ',')) WITH ORDINALITY AS t(qid, ord)
+        WHERE trim(t.qid) ~ '^[0-9]+$'
+    """))
+    return result.rowcount
+
+
+# ── Bulk question loading ─────────────────────────────────────────────────────
+
+# What the read paths need to prepare a question for display (see stored_question_html)
+DISPLAY_COLUMNS = ('type', 'json', 'render_version')
+
+
+def load_questions(question_ids, columns=None) -> list:
+    """Load q_bank rows for ``question_ids`` in one IN query, in the order given.
+
+    Missing IDs are skipped; a repeated ID yields the same object again.
+    ``columns`` limits the load to those attributes (plus id), e.g.
+    DISPLAY_COLUMNS — touching any other attribute then costs its own query.
+    """
+    int_ids = [int(i) for i in question_ids]
+    if not int_ids:
+        return []
+    query = QBank.query
+    if columns:
+        query = query.options(load_only(*[getattr(QBank, c) for c in columns]))
+    by_id = {q.id: q for q in query.filter(QBank.id.in_(set(int_ids))).all()}
+    return [by_id[qid] for qid in int_ids if qid in by_id]
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 
 
@@ -166,7 +251,7 @@ def create_question_safely(question_type, topic, subtopic, level, question_json,
             question_json['image']['src'] = image_path
         
         # Generate HTML from LaTeX for all text fields (central conversion point)
-        ensure_question_html(question_json)
+        question_json = ensure_question_html(question_json)
         
         # Create the question with the explicit ID
         q = QBank(
@@ -175,7 +260,8 @@ def create_question_safely(question_type, topic, subtopic, level, question_json,
             topic=topic,
             subtopic=subtopic,
             level=level,
-            json=question_json
+            json=question_json,
+            render_version=render_version()
         )
         
         db.session.add(q)
@@ -230,9 +316,10 @@ def update_question_safely(question_id, question_type, topic, subtopic, level, q
         question_json['id'] = question_id
         
         # Generate HTML from LaTeX for all text fields (central conversion point)
-        ensure_question_html(question_json)
+        question_json = ensure_question_html(question_json)
         
         q.json = question_json
+        q.render_version = render_version()
         
         db.session.commit()
         logger.info(f"Updated {question_type} question ID {question_id}")
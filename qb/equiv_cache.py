@@ -0,0 +1,157 @@
+"""Memo for algebra equivalence verdicts (POST /quiz/api/check-expr-equiv).
+
+Students in a class type the same right and wrong answers to the same
+question, so each distinct (answer, canonical, variables) only needs sympy
+once. Two tiers:
+  1. In-process LRU (EQUIV_CACHE_SIZE entries).
+  2. prod.equiv_cache table — shared by every worker and kept across deploys.
+
+Keys are sha256 over CHAIN_VERSION, the whitespace-normalised expressions
+(both from qb/equivalence.py) and the sorted, de-duplicated variable list,
+so bumping CHAIN_VERSION retires every old verdict. Each entry stores the
+verdict, the chain stage that decided it and how long it took. Timeouts are
+cached negatively for EQUIV_TIMEOUT_TTL seconds, so one pathological expression costs one worker
+timeout per window instead of one per student.
+
+Like the render cache, any table failure degrades to a plain miss.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+
+from db import db
+from models import EquivCacheEntry
+from qb.cache_utils import LRUCache
+from qb.equivalence import CHAIN_VERSION, normalize
+
+logger = logging.getLogger(__name__)
+
+def equiv_key(user_expr, correct_expr, variables):
+    """Return (key, user, correct, variables) for a check, all normalised."""
+    user, correct = normalize(user_expr), normalize(correct_expr)
+    names = sorted({normalize(v) for v in (variables or []) if normalize(v)})
+    raw = '\x00'.join([str(CHAIN_VERSION), user, correct, ','.join(names)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest(), user, correct, names
+
+
+class EquivCache:
+    """LRU in front of the shared equiv_cache table, with hit/miss counters."""
+
+    def __init__(self, maxsize=4096, timeout_ttl=120):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.timeout_ttl = timeout_ttl
+        self._lock = threading.Lock()
+        self.table_hits = 0
+        self.table_misses = 0
+        self.table_errors = 0
+        self.stores = 0
+
+    def _table_failed(self, e):
+        with self._lock:
+            self.table_errors += 1
+        logger.warning("[EQUIV_CACHE] table error: %s", e)
+
+    def get(self, key):
+        """Cached result dict ({'equivalent', 'stage'[, 'error']}) or None."""
+        result = self.memory.get(key)
+        if result is not None:
+            return result
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(text(f"""
+                    SELECT equivalent, stage, error, elapsed_ms,
+                           extract(epoch FROM expires_at - now()) AS ttl
+                    FROM {EquivCacheEntry.__table__.fullname}
+                    WHERE key = :key AND (expires_at IS NULL OR expires_at > now())
+                """), {'key': key}).first()
+        except Exception as e:
+            self._table_failed(e)
+            return None
+        with self._lock:
+            if row is None:
+                self.table_misses += 1
+            else:
+                self.table_hits += 1
+        if row is None:
+            return None
+        result = {'equivalent': row.equivalent, 'stage': row.stage, 'elapsed_ms': row.elapsed_ms}
+        if row.error:
+            result['error'] = row.error
+        self.memory.set(key, result, ttl=float(row.ttl) if row.ttl is not None else None)
+        return result
+
+    def set(self, key, user, correct, variables, result, elapsed_ms):
+        """Store a verdict. stage == 'timeout' entries expire after timeout_ttl."""
+        result = {**result, 'elapsed_ms': round(elapsed_ms, 2)}
+        ttl = self.timeout_ttl if result.get('stage') == 'timeout' else None
+        self.memory.set(key, result, ttl=ttl)
+        with self._lock:
+            self.stores += 1
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(f"""
+                    INSERT INTO {EquivCacheEntry.__table__.fullname}
+                        (key, user_expr, correct_expr, variables, equivalent, stage, error,
+                         elapsed_ms, chain_version, created_at, expires_at)
+                    VALUES (:key, :user, :correct, :variables, :equivalent, :stage, :error,
+                            :elapsed_ms, :chain_version, now(), now() + make_interval(secs => :ttl))
+                    ON CONFLICT (key) DO UPDATE SET
+                        equivalent = EXCLUDED.equivalent,
+                        stage      = EXCLUDED.stage,
+                        error      = EXCLUDED.error,
+                        elapsed_ms = EXCLUDED.elapsed_ms,
+                        created_at = EXCLUDED.created_at,
+                        expires_at = EXCLUDED.expires_at
+                """), {
+                    'key': key, 'user': user, 'correct': correct, 'variables': ','.join(variables),
+                    'equivalent': bool(result.get('equivalent')), 'stage': result.get('stage'),
+                    'error': result.get('error'), 'elapsed_ms': result['elapsed_ms'], 'ttl': ttl,
+                    'chain_version': CHAIN_VERSION,
+                })
+        except Exception as e:
+            self._table_failed(e)
+
+    def stats(self):
+        """Counters for this process (each gunicorn worker keeps its own)."""
+        memory = self.memory.stats()
+        with self._lock:
+            table = {
+                "hits": self.table_hits,
+                "misses": self.table_misses,
+                "errors": self.table_errors,
+            }
+            stores = self.stores
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + table["hits"]
+        return {
+            "pid": os.getpid(),
+            "timeout_ttl": self.timeout_ttl,
+            "memory": memory,
+            "table": table,
+            "stores": stores,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+# ── Per-process singleton ──────────────────────────────────────────────────────
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_equiv_cache(maxsize=4096, timeout_ttl=120):
+    """Return this process's equivalence cache, creating it on first use (fork-safe)."""
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = EquivCache(maxsize=maxsize, timeout_ttl=timeout_ttl)
+                _cache_pid = pid
+    return _cache
@@ -0,0 +1,320 @@
+"""Algebraic equivalence checking with sympy — runs inside the equivalence worker pool.
+
+Loaded by path in qb/worker_pool.py child processes, so it must not import
+anything from the qb package or the Flask app. The parent calls it with:
+
+    get_worker_pool('equiv', script=EQUIV_WORKER, ...).call(
+        'equiv', user_expr='2x+2', correct_expr='2(x+1)', variables=['x'])
+
+Algebra questions store compile_canonical()'s output as answer['compiled'] at
+save time; passing it back as ``compiled=`` skips parsing the reference side.
+
+Evaluation chain (short-circuit, fastest first):
+    1. Identical after parsing              → True  (instant)
+    1b. numeric probe at random points      → False (both sides differ at most points)
+    2. expand(diff) == 0                    → True  (microseconds, handles school algebra)
+    3. cancel(diff) == 0                    → True  (rational expressions)
+    3b. both sides rational, cancel failed  → False (cancel is a complete test there)
+    4. trigsimp(diff) == 0                  → True  (trig identities)
+    4b. expand(sqrtdenest(diff)) == 0       → True  (nested radicals, e.g. sqrt(3+2*sqrt(2)))
+    5. simplify(diff) == 0                  → True/False
+The caller's pool timeout bounds the whole chain; a worker stuck in
+simplify is killed and replaced rather than left running.
+
+The numeric probe only ever rejects: a wrong answer is caught without
+symbolic work, while "probably equal" answers still need a symbolic proof.
+Points are complex because sympy symbols are complex by default (and it keeps
+sqrt/log of negative numbers defined). NumPy is optional — without it the
+probe evaluates point by point with mpmath.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+EQUIV_WORKER = os.path.abspath(__file__)
+
+_PROBE_POINTS = 12       # random points per check
+_PROBE_RADIUS = 3.0      # real and imaginary parts drawn from [-r, r]
+_PROBE_RTOL = 1e-6       # |u - c| <= rtol * max(1, |u|, |c|) counts as equal
+_PROBE_SEED = 20240917   # fixed, so a given answer always gets the same verdict
+
+# Part of every verdict-cache key (qb/equiv_cache.py). Bump it whenever a change
+# to check_equivalence can give a different verdict for the same input, so
+# verdicts cached by the old chain stop matching.
+CHAIN_VERSION = 2
+
+
+_SPACE_RUN = re.compile(r'\s+')
+_SPACE_AROUND_OP = re.compile(r' ?([-+*/^=(),]) ?')
+
+
+def normalize(expr):
+    """Collapse insignificant whitespace: '2x + 2' and '2x+2' are the same answer.
+
+    Whitespace between operands is kept — the implicit-multiplication parser
+    reads 'sin x' as sin(x) but 'sinx' as s*i*n*x. Callers normalise both
+    expressions before a check (see qb/equiv_cache.equiv_key).
+    """
+    return _SPACE_AROUND_OP.sub(r'\1', _SPACE_RUN.sub(' ', (expr or '').strip()))
+
+
+def _parser():
+    from sympy.parsing.sympy_parser import (
+        parse_expr, standard_transformations,
+        implicit_multiplication_application, convert_xor,
+    )
+    transforms = standard_transformations + (
+        implicit_multiplication_application,
+        convert_xor,
+    )
+    return parse_expr, transforms
+
+
+def _probe_points(n_vars):
+    if np is not None:
+        rng = np.random.default_rng(_PROBE_SEED)
+        shape = (n_vars, _PROBE_POINTS)
+        return rng.uniform(-_PROBE_RADIUS, _PROBE_RADIUS, shape) \
+            + 1j * rng.uniform(-_PROBE_RADIUS, _PROBE_RADIUS, shape)
+    import random
+    rng = random.Random(_PROBE_SEED)
+    return [[complex(rng.uniform(-_PROBE_RADIUS, _PROBE_RADIUS), rng.uniform(-_PROBE_RADIUS, _PROBE_RADIUS))
+             for _ in range(_PROBE_POINTS)] for _ in range(n_vars)]
+
+
+def _evaluate(expr, symbols, points):
+    """Values of expr at every probe point (complex array / list; nan where undefined)."""
+    from sympy import lambdify
+    if np is not None:
+        f = lambdify(symbols, expr, modules='numpy')
+        with np.errstate(all='ignore'):
+            values = np.asarray(f(*points), dtype=complex)
+        return np.broadcast_to(values, (_PROBE_POINTS,))
+    f = lambdify(symbols, expr, modules='mpmath')
+    values = []
+    for point in zip(*points):
+        try:
+            values.append(complex(f(*point)))
+        except (ValueError, ZeroDivisionError, TypeError, ArithmeticError):
+            values.append(complex('nan'))
+    return values
+
+
+def _fingerprint(expr, symbols):
+    """Values of expr at the probe points as JSON-friendly [re, im] pairs (None where undefined)."""
+    values = [complex(v) for v in _evaluate(expr, symbols, _probe_points(len(symbols)))]
+    return [[v.real, v.imag] if _finite(v) else None for v in values]
+
+
+def numerically_different(user, correct, fingerprint=None, fingerprint_symbols=None):
+    """True when user and correct clearly disagree at random complex points.
+
+    Returns False ("can't tell") whenever the probe is inconclusive: too few
+    points where both sides are defined, or functions lambdify can't compile.
+    Rejects only if most defined points disagree, so cancellation noise in one
+    evaluation can't fail a correct answer. A precompiled ``fingerprint`` of
+    correct (see compile_canonical) is used instead of evaluating it when the
+    symbol sets line up.
+    """
+    symbols = sorted(user.free_symbols | correct.free_symbols, key=str)
+    try:
+        points = _probe_points(len(symbols))
+        u_vals = _evaluate(user, symbols, points)
+        if fingerprint is not None and [str(x) for x in symbols] == fingerprint_symbols:
+            c_vals = [complex(*v) if v else complex('nan') for v in fingerprint]
+        else:
+            c_vals = _evaluate(correct, symbols, points)
+    except Exception:
+        return False
+
+    defined = differ = 0
+    for u, c in zip(u_vals, c_vals):
+        u, c = complex(u), complex(c)
+        if not (_finite(u) and _finite(c)):
+            continue
+        defined += 1
+        if abs(u - c) > _PROBE_RTOL * max(1.0, abs(u), abs(c)):
+            differ += 1
+    return defined >= 3 and differ * 2 > defined
+
+
+def _finite(z):
+    return z == z and abs(z) != float('inf')
+
+
+def _is_rational(expr, symbols):
+    """expr is a ratio of polynomials in symbols with rational coefficients.
+
+    For those, cancel() is a complete zero test, so the chain can stop there.
+    Only sums, products, integer powers, rationals and the given symbols pass:
+    sqrt(2) has only rational atoms but is Pow(2, 1/2), and cancel() cannot
+    prove sqrt(3+2*sqrt(2)) - (1+sqrt(2)) is zero.
+    """
+    from sympy import preorder_traversal
+
+    for node in preorder_traversal(expr):
+        if node.is_Add or node.is_Mul or node.is_Rational or node in symbols:
+            continue
+        if node.is_Pow and node.exp.is_Integer:
+            continue
+        return False
+    return True
+
+
+@lru_cache(maxsize=1024)
+def _from_srepr(text):
+    from sympy import sympify
+    return sympify(text)
+
+
+def _reference(correct_expr, compiled):
+    """(correct, expanded, compiled) from stored artifacts, or (None, None, None) if stale.
+
+    Compared whitespace-normalised: the caller passes the normalised canonical,
+    while questions saved before compile_canonical normalised keep it as typed.
+    """
+    if not compiled or 'srepr' not in compiled:
+        return None, None, None
+    if normalize(compiled.get('canonical')) != normalize(correct_expr):
+        return None, None, None
+    return _from_srepr(compiled['srepr']), _from_srepr(compiled['expanded']), compiled
+
+
+def compile_canonical(canonical, variables=None):
+    """Precompute the reference side of an algebra question at save time.
+
+    Returns the answer['compiled'] dict — the parsed canonical as srepr, its
+    expanded form and the probe-point fingerprint — or {'error': ...} if it
+    won't parse.
+    Equations (A=B) are stored as A-B. The canonical is stored normalised,
+    the form check_equivalence receives it in.
+    """
+    from sympy import expand, srepr, Symbol
+
+    parse_expr, transforms = _parser()
+    local_dict = {name: Symbol(name) for name in (variables or [])}
+    canonical = normalize(canonical)
+
+    def parse(s):
+        return parse_expr(s, local_dict=local_dict, transformations=transforms)
+
+    try:
+        if '=' in canonical:
+            lhs, rhs = canonical.split('=', 1)
+            correct = parse(lhs.strip()) - parse(rhs.strip())
+        else:
+            correct = parse(canonical)
+    except Exception as exc:  # SympifyError, SyntaxError, TokenError, ...
+        return {'error': str(exc) or type(exc).__name__}
+
+    symbols = sorted(correct.free_symbols, key=str)
+    try:
+        fingerprint = _fingerprint(correct, symbols)
+    except Exception:
+        fingerprint = None
+    return {
+        'canonical':   canonical,
+        'equation':    '=' in canonical,
+        'srepr':       srepr(correct),
+        'expanded':    srepr(expand(correct)),
+        'symbols':     [str(x) for x in symbols],
+        'fingerprint': fingerprint,
+    }
+
+
+def check_equivalence(user_expr, correct_expr, variables=None, compiled=None):
+    """Return {'equivalent': bool, 'stage': str} (plus 'error' for parse errors).
+
+    ``compiled`` is the question's answer['compiled'] (see compile_canonical);
+    when it matches correct_expr only the user's side is parsed.
+    """
+    from sympy import expand, cancel, trigsimp, simplify, sqrtdenest, Pow, Symbol, S
+    from sympy.core.sympify import SympifyError
+
+    parse_expr, transforms = _parser()
+    local_dict = {name: Symbol(name) for name in (variables or [])}
+
+    def parse(s):
+        return parse_expr(s, local_dict=local_dict, transformations=transforms)
+
+    try:
+        reference, reference_expanded, compiled = _reference(correct_expr, compiled)
+
+        # ── Equation mode ────────────────────────────────────────────────────
+        # Both strings contain '=': treat as equations A=B.
+        # Two equations are equivalent when (A-B) = ±(C-D), i.e. they express
+        # the same constraint up to flipping sides / rearranging terms.
+        # e.g.  2x+8=3x-2  ≡  3x-2=8+2x  ≡  x=10
+        if '=' in user_expr and '=' in correct_expr:
+            def _parse_eq(s):
+                lhs, rhs = s.split('=', 1)
+                return parse(lhs.strip()), parse(rhs.strip())
+            u_lhs, u_rhs = _parse_eq(user_expr)
+            d_user = u_lhs - u_rhs
+            if reference is not None:
+                d_correct = reference
+            else:
+                c_lhs, c_rhs = _parse_eq(correct_expr)
+                d_correct = c_lhs - c_rhs
+            if expand(d_user - d_correct) == S.Zero: return {'equivalent': True, 'stage': 'equation'}
+            if expand(d_user + d_correct) == S.Zero: return {'equivalent': True, 'stage': 'equation'}
+            return {'equivalent': False, 'stage': 'equation'}
+
+        # One side is an equation, the other is a bare expression — reject
+        if '=' in user_expr or '=' in correct_expr:
+            return {'equivalent': False, 'stage': 'equation-mismatch'}
+
+        # ── Expression mode ──────────────────────────────────────────────────
+        user = parse(user_expr)
+        correct = reference if reference is not None else parse(correct_expr)
+        diff = user - correct
+        if diff == S.Zero:         return {'equivalent': True, 'stage': 'identical'}
+        if numerically_different(user, correct,
+                                 fingerprint=compiled.get('fingerprint') if compiled else None,
+                                 fingerprint_symbols=compiled.get('symbols') if compiled else None):
+            return {'equivalent': False, 'stage': 'numeric'}
+        if reference_expanded is not None:
+            if expand(user) - reference_expanded == S.Zero: return {'equivalent': True, 'stage': 'expand'}
+        elif expand(diff) == S.Zero:
+            return {'equivalent': True, 'stage': 'expand'}
+        try:
+            if cancel(diff) == S.Zero: return {'equivalent': True, 'stage': 'cancel'}
+            symbols = sorted(diff.free_symbols, key=str)
+            if _is_rational(correct, symbols) and _is_rational(user, symbols):
+                return {'equivalent': False, 'stage': 'cancel'}
+        except Exception:
+            pass
+        try:
+            if trigsimp(diff) == S.Zero: return {'equivalent': True, 'stage': 'trigsimp'}
+        except Exception:
+            pass
+        try:
+            if any(not p.exp.is_Integer for p in diff.atoms(Pow)) and expand(sqrtdenest(diff)) == S.Zero:
+                return {'equivalent': True, 'stage': 'sqrtdenest'}
+        except Exception:
+            pass
+        try:
+            return {'equivalent': bool(simplify(diff) == S.Zero), 'stage': 'simplify'}
+        except Exception:
+            return {'equivalent': False, 'stage': 'simplify'}
+
+    except (SympifyError, NameError, SyntaxError) as exc:
+        return {'equivalent': False, 'stage': 'parse', 'error': str(exc)}
+
+
+def warmup():
+    """Import sympy and exercise the parser and probe so the first real call is fast."""
+    check_equivalence('2x+2', '2(x+1)', ['x'])
+    check_equivalence('2x+3', '2(x+1)', ['x'])
+
+
+HANDLERS = {
+    'equiv':   check_equivalence,
+    'compile': compile_canonical,
+}
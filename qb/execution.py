@@ -2,17 +2,29 @@
 
 import json as json_lib
 import logging
+import time
 
 from flask import render_template, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import func, text
 
 from db import db
-from models import Quiz, QBank, QuizExecution, UserTable, MyWorkList, UserStreak
+from models import Quiz, QBank, QuizExecution, UserTable, MyWorkList, UserStreak, StudentDashboard
+from lms.dashboard import invalidate_dashboards
+from qb.cache_utils import LRUCache
 from qb.db_utils import quiz_code
 from qb.routes import qb_bp
+from qb.equiv_cache import equiv_key
+from qb.grading import answer_keys, equiv_cache, equiv_pool, grade_batch, legacy_answer, quiz_answer_keys
+from qb.jobs import start_job
+from qb.worker_pool import PoolBusy, WorkerError, WorkerTimeout
+from view_counter import view_counter
 
 logger = logging.getLogger(__name__)
 
+# Rendered admin review sets; see admin_student_review_set for the key
+_review_sets = LRUCache(maxsize=32, ttl=600)
+
 
 @qb_bp.route("/execute", methods=["GET"])
 @login_required
@@ -59,17 +71,9 @@ def execute_quiz():
 
     # Increment view counter when a student opens the quiz (reliable server-side
     # alternative to sendBeacon which is dropped on same-tab navigation).
+    # Buffered by view_counter and flushed in bulk.
     if current_user.user_role in ('student_new', 'new'):
-        q_code = quiz_code(quiz_id)
-        mwl = MyWorkList.query.filter_by(
-            user=current_user.username, item_code=q_code
-        ).first()
-        if mwl:
-            mwl.views = (mwl.views or 0) + 1
-            try:
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
+        view_counter.hit_work_item(current_user.username, quiz_code(quiz_id))
 
     streak_row    = UserStreak.query.get(user_id)
     initial_streak = streak_row.streak if streak_row else 0
@@ -93,107 +97,92 @@ def admin_return():
     return render_template("quiz-admin-return.html")
 
 
+def _equiv_response(result):
+    if result.get('stage') == 'timeout':
+        return jsonify({'equivalent': False, 'timeout': True})
+    if result.get('error'):
+        return jsonify({'equivalent': False, 'error': result['error']})
+    return jsonify({'equivalent': bool(result.get('equivalent'))})
+
+
 @qb_bp.route("/api/check-expr-equiv", methods=["POST"])
 @login_required
 def check_expr_equiv():
     """Check algebraic equivalence of two expressions using sympy.
 
-    Evaluation chain (short-circuit, fastest first):
-        1. Identical after parsing              → True  (instant)
-        2. expand(diff) == 0                    → True  (microseconds, handles school algebra)
-        3. cancel(diff) == 0                    → True  (rational expressions)
-        4. trigsimp(diff) == 0                  → True  (trig identities)
-        5. simplify(diff) == 0 (3 s timeout)    → True/False or timeout→False
+    With ``question_id`` the question's precompiled reference (answer['compiled'],
+    see AlgebraHandler.save_question) is passed along so the worker only parses
+    the student's side; correct_expr/variables default to the stored ones.
+
+    Verdicts are memoised per normalised (user_expr, correct_expr, variables)
+    in qb/equiv_cache.py, so a repeated answer never reaches sympy. Misses run
+    the chain (see qb/equivalence.py) in a pool of pre-warmed worker
+    processes. A check that exceeds EQUIV_TIMEOUT has its worker killed and
+    replaced and answers {'equivalent': False, 'timeout': True} — cached for
+    EQUIV_TIMEOUT_TTL seconds; when more than EQUIV_POOL_SIZE + EQUIV_MAX_QUEUE
+    checks are in flight the endpoint answers 503 with {'busy': True} and a
+    Retry-After header.
     """
-    import threading
-    from sympy.parsing.sympy_parser import (
-        parse_expr, standard_transformations,
-        implicit_multiplication_application, convert_xor,
-    )
-    from sympy import expand, cancel, trigsimp, simplify, Symbol, S
-    from sympy.core.sympify import SympifyError
-
     data        = request.get_json(force=True, silent=True) or {}
     user_str    = (data.get('user_expr')    or '').strip()
     correct_str = (data.get('correct_expr') or '').strip()
     variables   = data.get('variables') or []
-    logger.info("check_expr_equiv request: user=%r  correct=%r  vars=%r", user_str, correct_str, variables)
+    try:
+        question_id = int(data.get('question_id') or 0)
+    except (TypeError, ValueError):
+        question_id = 0
+    compiled    = None
+    if question_id:
+        key = answer_keys([question_id]).get(question_id) or {}
+        if key.get('type') == 'algebra':
+            correct_str = correct_str or key['canonical']
+            variables   = variables or key['variables']
+            compiled    = key['compiled']
+    logger.info("check_expr_equiv request: user=%r  correct=%r  vars=%r  question=%s",
+                user_str, correct_str, variables, question_id)
 
     if not user_str or not correct_str:
         return jsonify({'equivalent': False, 'error': 'empty input'})
 
+    cache = equiv_cache()
+    key, user_str, correct_str, variables = equiv_key(user_str, correct_str, variables)
+    result = cache.get(key)
+    if result is not None:
+        logger.info("check_expr_equiv: cache hit user=%r correct=%r → %s (stage=%s)",
+                    user_str, correct_str, result.get('equivalent'), result.get('stage'))
+        return _equiv_response(result)
+
+    started = time.perf_counter()
     try:
-        TRANSFORMS = standard_transformations + (
-            implicit_multiplication_application,
-            convert_xor,
-        )
-        local_dict = {name: Symbol(name) for name in variables}
-
-        # ── Equation mode ────────────────────────────────────────────────────
-        # Both strings contain '=': treat as equations A=B.
-        # Two equations are equivalent when (A-B) = ±(C-D), i.e. they express
-        # the same constraint up to flipping sides / rearranging terms.
-        # e.g.  2x+8=3x-2  ≡  3x-2=8+2x  ≡  x=10
-        if '=' in user_str and '=' in correct_str:
-            def _parse_eq(s):
-                lhs, rhs = s.split('=', 1)
-                return (parse_expr(lhs.strip(), local_dict=local_dict, transformations=TRANSFORMS),
-                        parse_expr(rhs.strip(), local_dict=local_dict, transformations=TRANSFORMS))
-            u_lhs, u_rhs = _parse_eq(user_str)
-            c_lhs, c_rhs = _parse_eq(correct_str)
-            d_user    = u_lhs - u_rhs
-            d_correct = c_lhs - c_rhs
-            logger.info("check_expr_equiv equation mode: d_user=%r  d_correct=%r", d_user, d_correct)
-            if expand(d_user - d_correct) == S.Zero: return jsonify({'equivalent': True})
-            if expand(d_user + d_correct) == S.Zero: return jsonify({'equivalent': True})
-            return jsonify({'equivalent': False})
-
-        # One side is an equation, the other is a bare expression — reject
-        if '=' in user_str or '=' in correct_str:
-            return jsonify({'equivalent': False})
-
-        # ── Expression mode (original behaviour) ─────────────────────────────
-        e1 = parse_expr(user_str,    local_dict=local_dict, transformations=TRANSFORMS)
-        e2 = parse_expr(correct_str, local_dict=local_dict, transformations=TRANSFORMS)
-        logger.info("check_expr_equiv: e1=%r  e2=%r", e1, e2)
-
-        diff = e1 - e2
-        logger.info("check_expr_equiv: diff=%r  expand(diff)=%r", diff, expand(diff))
-        if diff == S.Zero:         return jsonify({'equivalent': True})
-        if expand(diff) == S.Zero: return jsonify({'equivalent': True})
-        try:
-            if cancel(diff) == S.Zero: return jsonify({'equivalent': True})
-        except Exception:
-            pass
-        try:
-            if trigsimp(diff) == S.Zero: return jsonify({'equivalent': True})
-        except Exception:
-            pass
-
-        # Slow path: simplify with thread-based timeout (cross-platform)
-        result = [None]
-
-        def _run():
-            try:
-                result[0] = simplify(diff) == S.Zero
-            except Exception:
-                result[0] = False
-
-        t = threading.Thread(target=_run, daemon=True)
-        t.start()
-        t.join(timeout=3)
-        if t.is_alive():
-            logger.warning("check_expr_equiv: simplify timed out for %r", user_str)
-            return jsonify({'equivalent': False, 'timeout': True})
-
-        return jsonify({'equivalent': bool(result[0])})
-
-    except (SympifyError, NameError, SyntaxError) as exc:
-        logger.info("check_expr_equiv: parse error for user=%r correct=%r — %s", user_str, correct_str, exc)
-        return jsonify({'equivalent': False, 'error': str(exc)})
-    except Exception:
+        result = equiv_pool().call('equiv', user_expr=user_str, correct_expr=correct_str,
+                                   variables=variables, compiled=compiled)
+    except PoolBusy as exc:
+        logger.warning("check_expr_equiv: pool busy — %s", exc)
+        response = jsonify({'equivalent': False, 'busy': True, 'error': 'busy, retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    except WorkerTimeout:
+        logger.warning("check_expr_equiv: timed out for %r", user_str)
+        result = {'equivalent': False, 'stage': 'timeout'}
+    except WorkerError:
         logger.exception("check_expr_equiv unexpected error")
         return jsonify({'equivalent': False})
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    cache.set(key, user_str, correct_str, variables, result, elapsed_ms)
+    logger.info("check_expr_equiv: user=%r correct=%r → %s at stage=%s in %.1fms",
+                user_str, correct_str, result.get('equivalent'), result.get('stage'), elapsed_ms)
+    return _equiv_response(result)
+
+
+@qb_bp.route("/api/equiv/stats", methods=["GET"])
+@login_required
+def equiv_stats():
+    """Verdict-cache and worker-pool counters for this worker (admin only)."""
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    return jsonify({'ok': True, 'cache': equiv_cache().stats(), 'pool': equiv_pool().stats()})
 
 
 @qb_bp.route("/api/complete-quiz", methods=["POST"])
@@ -228,6 +217,7 @@ def complete_quiz():
             mwl.status    = 'done'
             mwl.score     = score_str
             mwl.incorrect = incorrect_str
+            invalidate_dashboards(user_ids=[user_id])
             db.session.commit()
         else:
             logger.warning("[COMPLETE_QUIZ] MyWorkList row not found for user_id=%s item_code=%s", user_id, item_code)
@@ -240,6 +230,148 @@ def complete_quiz():
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 
+# ── Regrade after an answer-key fix ──────────────────────────────────────────
+
+_REGRADE_BATCH = 500
+
+_REGRADE_ROWS_SQL = f"""
+SELECT user_id, quiz_id, question_id, question_sequence, user_answer, raw_answer, is_correct
+FROM {QuizExecution.__table__.fullname}
+WHERE question_id = ANY(CAST(:question_ids AS int[]))
+  AND (question_id, user_id, quiz_id) > (:after_question, :after_user, :after_quiz)
+ORDER BY question_id, user_id, quiz_id
+LIMIT :limit
+"""
+
+_REGRADE_UPDATE_SQL = f"""
+UPDATE {QuizExecution.__table__.fullname} qe
+SET is_correct = v.is_correct,
+    updated_at = now()
+FROM unnest(CAST(:user_ids AS int[]), CAST(:quiz_ids AS int[]), CAST(:question_ids AS int[]),
+            CAST(:verdicts AS boolean[])) AS v(user_id, quiz_id, question_id, is_correct)
+WHERE qe.user_id = v.user_id AND qe.quiz_id = v.quiz_id AND qe.question_id = v.question_id
+  AND qe.is_correct IS DISTINCT FROM v.is_correct
+RETURNING qe.user_id, qe.quiz_id
+"""
+
+# Same strings complete_quiz writes ("3 of 5", "All Correct" / "Q: 2, 4"),
+# for every affected (user, quiz) at once. Only completed items carry a score.
+_RESCORE_SQL = f"""
+UPDATE {MyWorkList.__table__.fullname} m
+SET score     = s.correct || ' of ' || s.total,
+    incorrect = CASE WHEN s.wrong IS NULL THEN 'All Correct' ELSE 'Q: ' || s.wrong END
+FROM (
+    SELECT p.user_id, p.item_code,
+           count(*) AS total,
+           count(*) FILTER (WHERE qe.is_correct) AS correct,
+           string_agg((qe.question_sequence + 1)::text, ', ' ORDER BY qe.question_sequence)
+               FILTER (WHERE qe.is_correct IS NOT TRUE) AS wrong
+    FROM unnest(CAST(:user_ids AS int[]), CAST(:quiz_ids AS int[]), CAST(:item_codes AS text[]))
+         AS p(user_id, quiz_id, item_code)
+    JOIN {QuizExecution.__table__.fullname} qe ON qe.user_id = p.user_id AND qe.quiz_id = p.quiz_id
+    GROUP BY p.user_id, p.item_code
+) s
+WHERE m.user_id = s.user_id AND m.item_code = s.item_code AND m.status = 'done'
+"""
+
+
+def regrade_questions(job, question_ids):
+    """Background job: regrade every quiz_execution row for these questions.
+
+    Rows are read in keyset-paged batches and graded with qb.grading against
+    the current answer keys (raw_answer when present, otherwise the answer is
+    recovered from the user_answer display string). Changed verdicts are
+    written with one UPDATE per batch, then the score/incorrect strings of
+    every affected completed (user, quiz) are recomputed in one aggregate
+    UPDATE. Each batch commits on its own, so a rerun picks up where a failed
+    one stopped. Rows that can't be graded (legacy answer not recoverable,
+    sympy busy) are left alone and counted as skipped.
+    """
+    question_ids = sorted({int(i) for i in question_ids})
+    keys = answer_keys(question_ids)
+    questions = {q.id: q for q in QBank.query.filter(QBank.id.in_(question_ids)).all()}
+    total = db.session.execute(
+        text(f"SELECT count(*) FROM {QuizExecution.__table__.fullname} "
+             "WHERE question_id = ANY(CAST(:ids AS int[]))"), {'ids': question_ids}).scalar()
+    if job:
+        job.progress(0, total, 'Regrading answers')
+
+    done = graded = changed = skipped = 0
+    rescored = set()
+    after = (0, 0, 0)
+    while True:
+        rows = db.session.execute(text(_REGRADE_ROWS_SQL), {
+            'question_ids': question_ids, 'limit': _REGRADE_BATCH,
+            'after_question': after[0], 'after_user': after[1], 'after_quiz': after[2],
+        }).all()
+        if not rows:
+            break
+        after = (rows[-1].question_id, rows[-1].user_id, rows[-1].quiz_id)
+
+        items, targets = [], []
+        for r in rows:
+            answer = r.raw_answer
+            if answer is None:
+                q = questions.get(r.question_id)
+                answer = legacy_answer(q.type, q.json, r.user_answer) if q else None
+            if answer is None or r.question_id not in keys:
+                continue
+            items.append((keys[r.question_id], answer))
+            targets.append(r)
+        verdicts = grade_batch(items)
+        decided = [(r, v) for r, v in zip(targets, verdicts) if v is not None]
+
+        if decided:
+            pairs = db.session.execute(text(_REGRADE_UPDATE_SQL), {
+                'user_ids':     [r.user_id for r, _ in decided],
+                'quiz_ids':     [r.quiz_id for r, _ in decided],
+                'question_ids': [r.question_id for r, _ in decided],
+                'verdicts':     [v for _, v in decided],
+            }).all()
+            affected = sorted({(p.user_id, p.quiz_id) for p in pairs})
+            if affected:
+                db.session.execute(text(_RESCORE_SQL), {
+                    'user_ids':   [u for u, _ in affected],
+                    'quiz_ids':   [q for _, q in affected],
+                    'item_codes': [quiz_code(q) for _, q in affected],
+                })
+                rescored.update(affected)
+            db.session.commit()
+            changed += len(pairs)
+
+        done += len(rows)
+        graded += len(decided)
+        skipped += len(rows) - len(decided)
+        if job:
+            job.progress(done, total, f'Regraded {done}/{total} answers, {changed} changed')
+
+    message = (f"Regraded {graded} answer(s) for {len(question_ids)} question(s): "
+               f"{changed} changed across {len(rescored)} student quiz(zes), {skipped} skipped")
+    logger.info("[REGRADE] %s", message)
+    return {'rows': done, 'graded': graded, 'changed': changed, 'rescored': len(rescored),
+            'skipped': skipped, 'message': message}
+
+
+@qb_bp.route("/api/regrade", methods=["POST"])
+@login_required
+def regrade():
+    """Start a background regrade for {"question_ids": [...]} (admin only).
+
+    Poll /quiz/api/jobs/<job_id> for progress.
+    """
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        question_ids = sorted({int(i) for i in data.get('question_ids') or []})
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'question_ids must be integers'}), 400
+    if not question_ids:
+        return jsonify({'ok': False, 'error': 'question_ids is required'}), 400
+    job = start_job(f"regrade-{','.join(map(str, question_ids))}", regrade_questions, question_ids)
+    return jsonify({'ok': True, **job.to_dict()}), 202
+
+
 @qb_bp.route("/api/reset-execution", methods=["POST"])
 @login_required
 def reset_execution():
@@ -261,6 +393,7 @@ def reset_execution():
             mwl.score              = None
             mwl.incorrect          = None
             mwl.questions_answered = 0
+        invalidate_dashboards(user_ids=[user_id])
         db.session.commit()
         return jsonify({'ok': True})
     except Exception as e:
@@ -269,64 +402,201 @@ def reset_execution():
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 
+_UPSERT_ANSWERS_SQL = f"""
+WITH input AS (
+    SELECT *
+    FROM unnest(CAST(:quiz_ids AS int[]), CAST(:item_codes AS text[]), CAST(:question_ids AS int[]),
+                CAST(:sequences AS int[]), CAST(:user_answers AS text[]), CAST(:correct_answers AS text[]),
+                CAST(:is_correct AS boolean[]), CAST(:raw_answers AS text[]))
+         WITH ORDINALITY AS t(quiz_id, item_code, question_id, question_sequence,
+                              user_answer, correct_answer, is_correct, raw_answer, ord)
+),
+upserted AS (
+    INSERT INTO {QuizExecution.__table__.fullname} AS qe
+        (user_id, quiz_id, question_id, question_sequence, user_answer, correct_answer, is_correct,
+         raw_answer)
+    SELECT :user_id, quiz_id, question_id, question_sequence, user_answer, correct_answer, is_correct,
+           CAST(raw_answer AS json)
+    FROM input
+    ORDER BY ord
+    ON CONFLICT (user_id, quiz_id, question_id) DO UPDATE
+        SET user_answer    = EXCLUDED.user_answer,
+            correct_answer = EXCLUDED.correct_answer,
+            is_correct     = EXCLUDED.is_correct,
+            raw_answer     = EXCLUDED.raw_answer,
+            updated_at     = now()
+    RETURNING qe.quiz_id, qe.question_id, (qe.xmax = 0) AS inserted
+),
+new_rows AS (
+    SELECT i.ord, i.item_code, coalesce(i.is_correct, false) AS is_correct
+    FROM upserted u
+    JOIN input i ON i.quiz_id = u.quiz_id AND i.question_id = u.question_id
+    WHERE u.inserted
+),
+answered AS (
+    UPDATE {MyWorkList.__table__.fullname} m
+    SET questions_answered = m.questions_answered + n.cnt,
+        last_updated       = now()
+    FROM (SELECT item_code, count(*) AS cnt FROM new_rows GROUP BY item_code) n
+    WHERE m.user_id = :user_id AND m.item_code = n.item_code
+    RETURNING m.id
+),
+run AS (
+    -- First submissions in order: a wrong answer resets the streak, so only
+    -- the corrects after the last wrong count; with no wrong they extend it.
+    SELECT count(*) AS n_new,
+           bool_or(NOT is_correct) AS any_wrong,
+           count(*) FILTER (WHERE ord > coalesce(
+               (SELECT max(ord) FROM new_rows WHERE NOT is_correct), 0)) AS trailing
+    FROM new_rows
+),
+streak AS (
+    INSERT INTO {UserStreak.__table__.fullname} AS us (user_id, streak)
+    SELECT :user_id, run.trailing FROM run WHERE run.n_new > 0
+    ON CONFLICT (user_id) DO UPDATE
+        SET streak     = CASE WHEN (SELECT any_wrong FROM run) THEN EXCLUDED.streak
+                              ELSE us.streak + EXCLUDED.streak END,
+            updated_at = now()
+    RETURNING us.streak
+),
+dashboard AS (
+    -- questions_answered and the streak moved, so the student's dashboard is stale
+    -- (same statement as lms.dashboard.invalidate_dashboards)
+    INSERT INTO {StudentDashboard.__table__.fullname} AS d (user_id, generation)
+    SELECT :user_id, 1 FROM run WHERE run.n_new > 0
+    ON CONFLICT (user_id) DO UPDATE
+        SET generation = d.generation + 1,
+            data       = NULL
+)
+SELECT coalesce((SELECT streak FROM streak),
+                (SELECT streak FROM {UserStreak.__table__.fullname} WHERE user_id = :user_id),
+                0) AS streak,
+       (SELECT count(*) FROM new_rows) AS inserted,
+       (SELECT count(*) FROM upserted) AS written,
+       (SELECT count(*) FROM answered) AS work_rows
+"""
+
+
+def _upsert_answers(user_id, answers):
+    """Record answers for one student in a single round trip. Does not commit.
+
+    ``answers`` is an ordered list of dicts with quiz_id, question_id,
+    question_sequence, user_answer, correct_answer, is_correct and optionally
+    the raw ``answer`` (stored as raw_answer). In one
+    statement: upsert into quiz_execution, bump my_work_list.questions_answered
+    for first submissions only, update the correct-answer streak exactly
+    as submitting the answers one by one would, and mark the student's
+    dashboard stale. A question repeated within the batch keeps its last answer.
+
+    Returns (streak, inserted_count, written_count).
+    """
+    latest = {}
+    for a in answers:
+        key = (int(a['quiz_id']), int(a['question_id']))
+        latest.pop(key, None)   # re-insert so order follows the last occurrence
+        latest[key] = a
+    rows = list(latest.values())
+
+    def _str(v):
+        return None if v is None else str(v)
+
+    params = {
+        'user_id':         int(user_id),
+        'quiz_ids':        [int(a['quiz_id']) for a in rows],
+        'item_codes':      [quiz_code(int(a['quiz_id'])) for a in rows],
+        'question_ids':    [int(a['question_id']) for a in rows],
+        'sequences':       [int(a['question_sequence']) for a in rows],
+        'user_answers':    [_str(a.get('user_answer')) for a in rows],
+        'correct_answers': [_str(a.get('correct_answer')) for a in rows],
+        'is_correct':      [bool(a.get('is_correct', False)) for a in rows],
+        'raw_answers':     [json_lib.dumps(a['answer']) if 'answer' in a else None for a in rows],
+    }
+    result = db.session.execute(text(_UPSERT_ANSWERS_SQL), params).one()
+    return result.streak, result.inserted, result.written
+
+
+def _grade_answers(answers):
+    """Replace the client's is_correct with the server's verdict (qb.grading).
+
+    Only answers that carry the raw ``answer`` are graded; older clients that
+    send just is_correct are stored as before. If a verdict can't be decided
+    right now (sympy pool busy or timed out), the client's value is kept.
+    """
+    graded = [a for a in answers if 'answer' in a]
+    if not graded:
+        return
+    keys = quiz_answer_keys(a['quiz_id'] for a in graded)
+    # Quizzes not (yet) in the quiz_question index
+    missing = {int(a['question_id']) for a in graded} - keys.keys()
+    if missing:
+        keys.update(answer_keys(missing))
+    verdicts = grade_batch([(keys.get(int(a['question_id']), {}), a['answer']) for a in graded])
+    for a, verdict in zip(graded, verdicts):
+        if verdict is None:
+            continue
+        if bool(a.get('is_correct')) != verdict:
+            logger.info("[GRADING] question %s: client said %s, server says %s",
+                        a['question_id'], a.get('is_correct'), verdict)
+        a['is_correct'] = verdict
+
+
+def _missing_answer_fields(a):
+    return not all([a.get('quiz_id') is not None, a.get('question_id') is not None,
+                    a.get('question_sequence') is not None])
+
+
 @qb_bp.route("/api/submit-answer", methods=["POST"])
 @login_required
 def submit_answer():
-    """Record a student's answer for one question (upsert)."""
+    """Record a student's answer for one question (upsert).
+
+    With the raw ``answer`` in the body the answer is graded server-side and
+    the stored/returned is_correct is the server's.
+    """
     try:
         data = request.get_json()
-        user_id        = data.get('user_id')
-        quiz_id        = data.get('quiz_id')
-        question_id    = data.get('question_id')
-        question_seq   = data.get('question_sequence')
-        user_answer    = data.get('user_answer')
-        correct_answer = data.get('correct_answer')
-        is_correct     = data.get('is_correct', False)
-
-        if not all([user_id is not None, quiz_id is not None, question_id is not None, question_seq is not None]):
+        user_id = data.get('user_id')
+        if user_id is None or _missing_answer_fields(data):
             return jsonify({'ok': False, 'error': 'Missing required fields'}), 400
 
-        is_new = False
-        ex = QuizExecution.query.get((user_id, quiz_id, question_id))
-        if ex:
-            ex.user_answer    = user_answer
-            ex.correct_answer = correct_answer
-            ex.is_correct     = is_correct
-        else:
-            is_new = True
-            ex = QuizExecution(
-                user_id=user_id,
-                quiz_id=quiz_id,
-                question_id=question_id,
-                question_sequence=question_seq,
-                user_answer=user_answer,
-                correct_answer=correct_answer,
-                is_correct=is_correct,
-            )
-            db.session.add(ex)
-
-        # Increment questions_answered on first submission only
-        if is_new:
-            item_code = quiz_code(quiz_id)
-            (db.session.query(MyWorkList)
-             .filter_by(user_id=user_id, item_code=item_code)
-             .update({'questions_answered': MyWorkList.questions_answered + 1},
-                     synchronize_session=False))
-
-            # Update correct streak
-            streak_row = UserStreak.query.get(user_id)
-            if streak_row:
-                new_streak = streak_row.streak + 1 if is_correct else 0
-                streak_row.streak = new_streak
-            else:
-                new_streak = 1 if is_correct else 0
-                db.session.add(UserStreak(user_id=user_id, streak=new_streak))
-        else:
-            streak_row = UserStreak.query.get(user_id)
-            new_streak = streak_row.streak if streak_row else 0
+        _grade_answers([data])
+        new_streak, _, _ = _upsert_answers(user_id, [data])
+        db.session.commit()
+        return jsonify({'ok': True, 'streak': new_streak, 'is_correct': bool(data.get('is_correct'))}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(e)
+        return jsonify({'ok': False, 'error': str(e)}), 500
+
+
+@qb_bp.route("/api/submit-answers", methods=["POST"])
+@login_required
+def submit_answers():
+    """Record several answers for one student in one round trip.
+
+    Body: {"user_id": 7, "quiz_id": 3, "answers": [{"question_id", "question_sequence",
+    "user_answer", "correct_answer", "is_correct"[, "answer", "quiz_id"]}, ...]}
+    Answers are applied in list order; each may override the top-level quiz_id.
+    Answers with a raw ``answer`` are graded server-side in one batch.
+    """
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
+        answers = data.get('answers') or []
+        if user_id is None or not isinstance(answers, list) or not answers:
+            return jsonify({'ok': False, 'error': 'user_id and a non-empty answers list are required'}), 400
 
+        answers = [dict(a, quiz_id=a.get('quiz_id', data.get('quiz_id'))) for a in answers]
+        bad = [n for n, a in enumerate(answers) if _missing_answer_fields(a)]
+        if bad:
+            return jsonify({'ok': False, 'error': f'Missing required fields in answers at positions {bad}'}), 400
+
+        _grade_answers(answers)
+        new_streak, inserted, written = _upsert_answers(user_id, answers)
         db.session.commit()
-        return jsonify({'ok': True, 'streak': new_streak}), 201
+        return jsonify({'ok': True, 'streak': new_streak, 'saved': written, 'new': inserted,
+                        'is_correct': [bool(a.get('is_correct')) for a in answers]}), 201
 
     except Exception as e:
         db.session.rollback()
@@ -456,58 +726,71 @@ def admin_student_review_set():
             .limit(n)
             .all())
 
-    quiz_codes = [r.item_code for r in rows]
-    quiz_map = {}
-    if quiz_codes:
-        for q in Quiz.query.filter(Quiz.quiz_code.in_(quiz_codes)).all():
-            quiz_map[q.quiz_code] = {'id': q.id, 'title': q.title}
+    # Finishing, resetting or regrading one of these quizzes changes the key
+    cache_key = (user_obj.id, n, tuple((r.item_code, r.last_updated, r.score, r.incorrect) for r in rows))
+    html = _review_sets.get(cache_key)
+    if html is None:
+        from qb.questions import generate_review_set_html
+        html = generate_review_set_html(
+            student_name=user_obj.full_name or user_obj.username,
+            quizzes=_review_set_quizzes(user_obj.id, rows),
+            n=n,
+            n_fetched=len(rows),
+        )
+        _review_sets.set(cache_key, html)
 
-    quizzes = []
-    for row in rows:
-        qinfo   = quiz_map.get(row.item_code, {})
-        quiz_id = qinfo.get('id')
-
-        incorrect_questions = []
-        total_qs = 0
-        if quiz_id:
-            total_qs = QuizExecution.query.filter_by(
-                user_id=user_obj.id, quiz_id=quiz_id).count()
-            inc_rows = (db.session.query(QuizExecution, QBank)
-                        .join(QBank, QBank.id == QuizExecution.question_id)
-                        .filter(QuizExecution.user_id == user_obj.id,
-                                QuizExecution.quiz_id == quiz_id,
-                                QuizExecution.is_correct == False)
-                        .order_by(QuizExecution.question_sequence)
-                        .all())
-            for ex, qbank in inc_rows:
-                incorrect_questions.append({
-                    'sequence':       ex.question_sequence + 1,
-                    'qbank_id':       ex.question_id,
-                    'question':       qbank.json,
-                    'qtype':          (qbank.type or 'mcq').lower(),
-                    'correct_answer': ex.correct_answer or '—',
-                    'user_answer':    ex.user_answer or '—',
-                })
+    from flask import Response
+    return Response(html, mimetype='text/html')
 
-        quizzes.append({
-            'quiz_code':    row.item_code,
-            'quiz_title':   qinfo.get('title', row.item_code),
-            'score':        row.score or '—',
-            'completed_at': row.last_updated,
-            'total':        total_qs,
-            'questions':    incorrect_questions,
-        })
 
-    n_fetched = len(quizzes)
-    quizzes = [q for q in quizzes if q['questions']]
+def _review_set_quizzes(user_id, rows):
+    """Quizzes with mistakes among the MyWorkList ``rows``, in their order, for generate_review_set_html.
 
-    from qb.questions import generate_review_set_html
-    from flask import Response
-    student_name = user_obj.full_name or user_obj.username
-    html = generate_review_set_html(
-        student_name=student_name,
-        quizzes=quizzes,
-        n=n,
-        n_fetched=n_fetched,
-    )
-    return Response(html, mimetype='text/html')
+    One query: a window over the student's quiz_execution rows for those
+    quizzes counts each quiz's questions, then only the incorrect rows are
+    kept and joined to q_bank.
+    """
+    quiz_codes = [r.item_code for r in rows]
+    if not quiz_codes:
+        return []
+
+    executions = (db.session.query(
+                      Quiz.quiz_code, Quiz.title,
+                      QuizExecution.question_id, QuizExecution.question_sequence,
+                      QuizExecution.correct_answer, QuizExecution.user_answer, QuizExecution.is_correct,
+                      func.count().over(partition_by=QuizExecution.quiz_id).label('total'))
+                  .join(Quiz, Quiz.id == QuizExecution.quiz_id)
+                  .filter(QuizExecution.user_id == user_id,
+                          Quiz.quiz_code.in_(quiz_codes))
+                  .subquery())
+    inc_rows = (db.session.query(executions, QBank.json, QBank.type)
+                .join(QBank, QBank.id == executions.c.question_id)
+                .filter(executions.c.is_correct == False)
+                .order_by(executions.c.quiz_code, executions.c.question_sequence)
+                .all())
+
+    by_code = {}
+    for ex in inc_rows:
+        quiz = by_code.setdefault(ex.quiz_code, {'title': ex.title, 'total': ex.total, 'questions': []})
+        quiz['questions'].append({
+            'sequence':       ex.question_sequence + 1,
+            'qbank_id':       ex.question_id,
+            'question':       ex.json,
+            'qtype':          (ex.type or 'mcq').lower(),
+            'correct_answer': ex.correct_answer or '—',
+            'user_answer':    ex.user_answer or '—',
+        })
+
+    quizzes = []
+    for row in rows:
+        quiz = by_code.get(row.item_code)
+        if quiz:
+            quizzes.append({
+                'quiz_code':    row.item_code,
+                'quiz_title':   quiz['title'],
+                'score':        row.score or '—',
+                'completed_at': row.last_updated,
+                'total':        quiz['total'],
+                'questions':    quiz['questions'],
+            })
+    return quizzes
@@ -0,0 +1,288 @@
+"""Compiled FEVAL rules: one cache of parsed rules for validation and grading.
+
+A rule is a Python boolean expression over the question's variables
+(see FEVAL_AUTHORING_GUIDE.md). compile_rule() parses and whitelist-checks it
+once; the result is cached by a hash of the expression, so every question
+that uses `a + b == -7` shares one CompiledRule across saves, grading and
+regrades. Feedback text is still computed in the browser.
+
+    rule = compile_rule('a + b == -7')
+    test_rule('a + b == -7', ['a', 'b'])                     # (ok, error) at save time
+    evaluate_batch(['a + b == -7', 'a > 0'], {'a': ['3', '1', '-2'], 'b': ['-10', '2', '-5']})
+
+Authored rules never run in the web process: scalar evaluation goes to the
+FEVAL worker pool (qb/feval_sandbox.py — AST whitelist, operand-size guards,
+CPU and memory rlimits). The one exception is evaluate_batch()'s vector
+path: rules made only of arithmetic, comparisons, and/or/not and
+abs/round/min/max are rewritten into NumPy float64 array operations, which
+can't build big integers or loop, and checked over every student's values
+at once. Anything else (isinstance, len, non-numeric input, a
+floating-point error, a value of 2**53 or more that float64 can't hold
+exactly) goes to the pool row by row, so both paths give the same verdicts.
+
+Must run in an app context (the pool is sized from app config).
+"""
+
+import ast
+import hashlib
+import logging
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+from flask import current_app
+
+from qb.cache_utils import LRUCache
+from qb.feval_sandbox import FEVAL_WORKER, RULE_BUILTINS, UnsafeRule, limits_env, parse_rule, rule_value
+from qb.worker_pool import PoolBusy, WorkerError, WorkerTimeout, get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+# Largest integer a float64 holds exactly — beyond it the vector path could round
+_EXACT_FLOAT = 2 ** 53
+
+
+class CompiledRule:
+    """One parsed, whitelist-checked rule expression."""
+
+    __slots__ = ('expression', 'names', 'error', 'vector_code')
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.names = frozenset()
+        self.error = None
+        self.vector_code = None
+        try:
+            tree = parse_rule(expression)
+        except (SyntaxError, UnsafeRule) as e:
+            self.error = str(e)
+            return
+        self.names = frozenset(n.id for n in ast.walk(tree)
+                               if isinstance(n, ast.Name) and n.id not in RULE_BUILTINS)
+        if np is not None:
+            vector_tree = _Vectorizer().visit(tree)
+            if vector_tree is not None:
+                self.vector_code = compile(ast.fix_missing_locations(vector_tree), '<feval-rule-vec>', 'eval')
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+_rules = LRUCache(maxsize=4096)
+
+
+def compile_rule(expression):
+    """Return the cached CompiledRule for an expression (errors are cached too)."""
+    expression = (expression or '').strip()
+    key = hashlib.sha1(expression.encode('utf-8')).hexdigest()
+    rule = _rules.get(key)
+    if rule is None:
+        rule = CompiledRule(expression)
+        _rules.set(key, rule)
+    return rule
+
+
+def feval_pool():
+    """This worker's FEVAL sandbox pool (qb/feval_sandbox.py), sized from app config."""
+    config = current_app.config
+    return get_worker_pool('feval', script=FEVAL_WORKER,
+                           size=config.get("FEVAL_POOL_SIZE", 2),
+                           timeout=config.get("FEVAL_TIMEOUT", 2),
+                           max_queue=config.get("FEVAL_MAX_QUEUE", 16),
+                           env=limits_env(config.get("FEVAL_CPU_SECONDS", 1),
+                                          config.get("FEVAL_MEMORY_MB", 256)))
+
+
+# ── Sandboxed evaluation ──────────────────────────────────────────────────────
+
+def _run(expressions, rows):
+    """Pool 'evaluate' call: [[passed per row] per expression], or None if undecided.
+
+    A worker killed for running past the timeout fails those rules.
+    """
+    try:
+        return feval_pool().call('evaluate', expressions=expressions, rows=rows)
+    except WorkerTimeout:
+        return [[False] * len(rows) for _ in expressions]
+    except (PoolBusy, WorkerError) as e:
+        logger.warning("[FEVAL] %d rule(s) not evaluated: %s", len(expressions), e)
+        return None
+
+
+def test_rule(expression, variables):
+    """(ok, error) from running a rule in the sandbox with every variable set to 0."""
+    rule = compile_rule(expression)
+    if not rule.ok:
+        return False, rule.error
+    try:
+        result = feval_pool().call('test', expression=rule.expression, variables=list(variables))
+    except WorkerTimeout:
+        return False, "Rule execution timeout (infinite loop?)"
+    except (PoolBusy, WorkerError) as e:
+        # Whitelist and guards still apply at grading time; don't block the save
+        logger.warning("[FEVAL] test run skipped for %r: %s", expression, e)
+        return True, None
+    return result['ok'], result['error']
+
+
+# ── Batch evaluation ──────────────────────────────────────────────────────────
+
+class _Vectorizer(ast.NodeTransformer):
+    """Rewrite a rule AST into NumPy elementwise operations, or return None.
+
+    Only numeric operators, comparisons, and/or/not and abs/round/min/max are
+    translated; any other construct means the rule is evaluated row by row.
+    Numeric literals become float64 scalars, so no operator ever works on a
+    Python int: a constant like 9**9**9 overflows (and goes to the sandbox)
+    rather than being computed in this process. Every arithmetic result is
+    passed through _exact(), so a value float64 may have rounded (2**53 + 1)
+    sends the rule to the sandbox, where Python ints are exact.
+    and/or become logical_and/logical_or, which return booleans where Python
+    returns an operand, so they are only translated where just their truth
+    value counts: the whole rule, an operand of and/or, or the target of not.
+    `(a and b) == 5` goes row by row.
+    """
+
+    _CALLS = {'abs': 'absolute', 'round': 'round', 'max': 'maximum', 'min': 'minimum'}
+    _BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+    _CMPOPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+    class _Unsupported(Exception):
+        pass
+
+    def visit(self, node):
+        if isinstance(node, ast.Expression):
+            try:
+                return ast.Expression(body=self._convert(node.body, truth=True))
+            except self._Unsupported:
+                return None
+        return super().visit(node)
+
+    @staticmethod
+    def _np(func, *args):
+        return ast.Call(func=ast.Attribute(value=ast.Name(id='_np', ctx=ast.Load()), attr=func, ctx=ast.Load()),
+                        args=list(args), keywords=[])
+
+    def _fold(self, func, values):
+        result = values[0]
+        for value in values[1:]:
+            result = self._np(func, result, value)
+        return result
+
+    def _convert(self, node, truth=False):
+        if isinstance(node, ast.Name) and node.id not in RULE_BUILTINS:
+            return ast.Name(id=node.id, ctx=ast.Load())
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            if isinstance(node.value, int) and abs(node.value) > _EXACT_FLOAT:
+                raise self._Unsupported(ast.dump(node))
+            # float64 from the start, so 9**9**9 overflows instead of building a big int here
+            return self._np('float64', node)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, self._BINOPS):
+            result = ast.BinOp(left=self._convert(node.left), op=node.op, right=self._convert(node.right))
+            return ast.Call(func=ast.Name(id='_exact', ctx=ast.Load()), args=[result], keywords=[])
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return ast.UnaryOp(op=node.op, operand=self._convert(node.operand))
+            if isinstance(node.op, ast.Not):
+                return self._np('logical_not', self._convert(node.operand, truth=True))
+        if isinstance(node, ast.BoolOp) and truth:
+            func = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+            return self._fold(func, [self._convert(v, truth=True) for v in node.values])
+        if isinstance(node, ast.Compare) and all(isinstance(op, self._CMPOPS) for op in node.ops):
+            # a < b < c  →  (a < b) & (b < c)
+            operands = [self._convert(node.left)] + [self._convert(c) for c in node.comparators]
+            pairs = [ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+                     for i, op in enumerate(node.ops)]
+            return self._fold('logical_and', pairs)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords \
+                and node.func.id in self._CALLS:
+            name = node.func.id
+            if name == 'round' and len(node.args) in (1, 2):
+                # ndigits must stay a Python int for np.round
+                args = [self._convert(node.args[0])]
+                if len(node.args) == 2:
+                    digits = node.args[1]
+                    if not (isinstance(digits, ast.Constant) and type(digits.value) is int):
+                        raise self._Unsupported(ast.dump(node))
+                    args.append(digits)
+                return self._np('round', *args)
+            args = [self._convert(a) for a in node.args]
+            if name == 'abs' and len(args) == 1:
+                return self._np('absolute', *args)
+            if name in ('max', 'min') and len(args) >= 2:
+                return self._fold(self._CALLS[name], args)
+        raise self._Unsupported(ast.dump(node))
+
+
+def _exact(values):
+    """values, unless one reaches 2**53 — float64 may have rounded it where a Python int would not."""
+    if np.any(np.abs(values) >= _EXACT_FLOAT):
+        raise OverflowError("intermediate result too large for float64")
+    return values
+
+
+def _numeric_column(values):
+    """float64 array of the converted values, or None if any is non-numeric / too large."""
+    out = []
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v) \
+                or abs(v) > _EXACT_FLOAT:
+            return None
+        out.append(v)
+    return np.asarray(out, dtype=np.float64)
+
+
+def evaluate_batch(rules, columns):
+    """Evaluate rules over many answers at once.
+
+    ``rules`` is a list of expressions (or CompiledRules). ``columns`` maps
+    each variable to a list of raw inputs, one per answer, all the same
+    length. Returns (all_passed, per_rule): per_rule[i][n] says whether rule
+    i held for answer n, which is what item analysis needs. Entries are None
+    where the sandbox couldn't be reached.
+    """
+    rules = [compile_rule(r) if isinstance(r, str) else r for r in rules]
+    n = len(next(iter(columns.values()), []))
+    converted = {name: [rule_value(v) for v in vals] for name, vals in columns.items()}
+    per_rule = [None] * len(rules)
+    scalar = []
+    for i, rule in enumerate(rules):
+        if not rule.ok:
+            per_rule[i] = [False] * n
+        else:
+            per_rule[i] = _evaluate_vector(rule, converted, n)
+            if per_rule[i] is None:
+                scalar.append(i)
+    if scalar:
+        rows = [{name: vals[k] for name, vals in columns.items()} for k in range(n)]
+        results = _run([rules[i].expression for i in scalar], rows) if n else [[] for _ in scalar]
+        for i, passed in zip(scalar, results or [[None] * n for _ in scalar]):
+            per_rule[i] = passed
+    all_passed = [_all([col[k] for col in per_rule]) for k in range(n)]
+    return all_passed, per_rule
+
+
+def _all(verdicts):
+    if not verdicts or False in verdicts:
+        return False
+    return None if None in verdicts else True
+
+
+def _evaluate_vector(rule, converted, n):
+    """Per-answer verdicts via NumPy, or None when the rule/values need the sandbox."""
+    if rule.vector_code is None or not n or not rule.names <= converted.keys():
+        return None
+    arrays = {name: _numeric_column(converted[name]) for name in rule.names}
+    if any(a is None for a in arrays.values()):
+        return None
+    try:
+        with np.errstate(all='raise'):
+            result = eval(rule.vector_code, {'__builtins__': {}, '_np': np, '_exact': _exact}, arrays)
+    except (FloatingPointError, ZeroDivisionError, OverflowError, TypeError, ValueError):
+        return None  # e.g. a division by zero or an inexact value somewhere: let the sandbox decide per row
+    return [bool(x) for x in np.broadcast_to(np.asarray(result, dtype=bool), (n,))]
@@ -0,0 +1,265 @@
+"""Sandboxed FEVAL rule execution — runs inside the FEVAL worker pool.
+
+Loaded by path in qb/worker_pool.py child processes, so it must not import
+anything from the qb package or the Flask app. The parent (qb/feval_rules.py)
+calls it with:
+
+    get_worker_pool('feval', script=FEVAL_WORKER, env=limits_env(1, 256), ...).call(
+        'evaluate', expressions=['a + b == -7'], rows=[{'a': '3', 'b': '-10'}])
+
+Three layers keep an authored rule from hurting anyone else:
+    1. parse_rule() — an AST whitelist (no attributes, comprehensions, lambdas
+       or underscore names; calls only to RULE_BUILTINS) and a length cap.
+       The parent runs it at save time, so a rejected rule never gets here.
+    2. Operand-size guards — ** * << are rewritten into calls that refuse to
+       build integers over _MAX_BITS bits or sequences over _MAX_ITEMS items,
+       so `9**9**9` or `[0]*10**9` fail fast instead of running.
+    3. rlimits on the worker process, set by warmup() from the environment
+       the parent passes — RLIMIT_AS caps memory; RLIMIT_CPU is re-armed per rule so a rule that burns its CPU budget fails (the
+       remaining rows of that rule are False) and the worker carries on. The
+       pool's wall-clock timeout kills anything the signal can't interrupt.
+"""
+
+import ast
+import math
+import os
+import re
+import signal
+from functools import lru_cache
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+FEVAL_WORKER = os.path.abspath(__file__)
+
+RULE_BUILTINS = {
+    'abs': abs, 'round': round, 'max': max, 'min': min, 'len': len, 'sum': sum,
+    'isinstance': isinstance, 'int': int, 'float': float, 'str': str, 'bool': bool,
+    'list': list, 'dict': dict, 'True': True, 'False': False, 'None': None,
+}
+
+_MAX_LENGTH = 500      # characters in one rule or template expression
+_MAX_BITS = 4096       # largest integer result of ** * <<
+_MAX_ITEMS = 10_000    # longest str / list / tuple built by *
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Load,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.LShift, ast.RShift, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.UnaryOp, ast.UAdd, ast.USub, ast.Not, ast.Invert,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Call, ast.keyword, ast.IfExp, ast.Constant, ast.Name,
+    ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Subscript, ast.Slice,
+)
+
+# JavaScript parseFloat's accepted prefix
+_NUMERIC_PREFIX = re.compile(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?Infinity)')
+
+
+class UnsafeRule(ValueError):
+    """The expression uses something rules may not (see parse_rule)."""
+
+
+def parse_rule(expression):
+    """Parse a rule and check it against the whitelist.
+
+    Returns the ast.Expression; raises SyntaxError or UnsafeRule.
+    """
+    if len(expression) > _MAX_LENGTH:
+        raise UnsafeRule(f"Expression is longer than {_MAX_LENGTH} characters")
+    tree = ast.parse(expression, mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise UnsafeRule(f"{type(node).__name__} is not allowed in rules")
+        if isinstance(node, ast.Name) and node.id.startswith('_'):
+            raise UnsafeRule(f"Name '{node.id}' is not allowed in rules")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name)
+                                               and node.func.id in RULE_BUILTINS):
+            raise UnsafeRule("Only abs, round, max, min, len, sum, isinstance, int, float, "
+                             "str, bool, list and dict can be called")
+    return tree
+
+
+def rule_value(value):
+    """A typed input as rules see it: numbers become int/float, anything else stays a string.
+
+    Mirrors the quiz page's _toNumeric (parseFloat), so '4' is the int 4 and
+    isinstance(a, int) reads as "is a whole number".
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        n = float(value)
+    else:
+        m = _NUMERIC_PREFIX.match(str(value))
+        if not m:
+            return value
+        n = float(m.group(1).replace('Infinity', 'inf'))
+    return int(n) if math.isfinite(n) and n.is_integer() else n
+
+
+# ── Operand-size guards ───────────────────────────────────────────────────────
+
+def _too_large(what):
+    return OverflowError(f"{what} too large in rule")
+
+
+def _pow(a, b):
+    if isinstance(a, int) and isinstance(b, int) and abs(a) > 1 and b > 0 \
+            and b * a.bit_length() > _MAX_BITS:
+        raise _too_large("power")
+    return a ** b
+
+
+def _mul(a, b):
+    for seq, n in ((a, b), (b, a)):
+        if isinstance(seq, (str, list, tuple)) and isinstance(n, int) and len(seq) * n > _MAX_ITEMS:
+            raise _too_large("repetition")
+    if isinstance(a, int) and isinstance(b, int) and a.bit_length() + b.bit_length() > _MAX_BITS:
+        raise _too_large("product")
+    return a * b
+
+
+def _lshift(a, b):
+    if isinstance(a, int) and isinstance(b, int) and a.bit_length() + b > _MAX_BITS:
+        raise _too_large("shift")
+    return a << b
+
+
+class _Guard(ast.NodeTransformer):
+    _GUARDED = {ast.Pow: '_pow', ast.Mult: '_mul', ast.LShift: '_lshift'}
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        guard = self._GUARDED.get(type(node.op))
+        if guard is None:
+            return node
+        return ast.Call(func=ast.Name(id=guard, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+
+
+_GLOBALS = {'__builtins__': {}, '_pow': _pow, '_mul': _mul, '_lshift': _lshift}
+
+
+@lru_cache(maxsize=1024)
+def _code(expression):
+    """Guarded code object for an expression (raises SyntaxError / UnsafeRule)."""
+    tree = _Guard().visit(parse_rule(expression.strip()))
+    return compile(ast.fix_missing_locations(tree), '<feval-rule>', 'eval')
+
+
+def _namespace(values):
+    namespace = dict(RULE_BUILTINS)
+    namespace.update({k: rule_value(v) for k, v in (values or {}).items()})
+    return namespace
+
+
+# ── CPU budget ────────────────────────────────────────────────────────────────
+
+class CpuLimitExceeded(Exception):
+    """The current rule used up its CPU budget (SIGXCPU)."""
+
+
+_cpu_budget = None   # seconds per rule, from FEVAL_CPU_SECONDS in the environment
+
+_CPU_ENV = 'FEVAL_CPU_SECONDS'
+_MEMORY_ENV = 'FEVAL_MEMORY_MB'
+
+
+def _on_sigxcpu(signum, frame):
+    raise CpuLimitExceeded("rule used up its CPU time")
+
+
+def _arm_cpu_limit():
+    """Allow the next rule _cpu_budget more CPU seconds than used so far."""
+    if resource is None or not _cpu_budget:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + _cpu_budget
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def limits_env(cpu_seconds, memory_mb):
+    """env= for the pool: per-rule CPU budget and an address-space cap, applied by warmup()."""
+    return {_CPU_ENV: str(int(cpu_seconds)), _MEMORY_ENV: str(int(memory_mb))}
+
+
+def _apply_limits():
+    """Set this worker's rlimits from the environment and take over SIGXCPU.
+
+    Does nothing where the resource module is unavailable (limits are then
+    just the pool's wall-clock timeout).
+    """
+    global _cpu_budget
+    if resource is None:
+        return
+    memory_mb = int(os.environ.get(_MEMORY_ENV) or 0)
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    cpu_seconds = int(os.environ.get(_CPU_ENV) or 0)
+    if cpu_seconds > 0:
+        _cpu_budget = cpu_seconds
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+        _arm_cpu_limit()
+
+
+# ── Handlers ──────────────────────────────────────────────────────────────────
+
+def evaluate(expressions, rows):
+    """[[passed per row] per expression]; errors, oversize operands and CPU overruns count as False."""
+    namespaces = [_namespace(row) for row in rows]
+    results = []
+    for expression in expressions:
+        try:
+            code = _code(expression)
+        except (SyntaxError, UnsafeRule):
+            results.append([False] * len(namespaces))
+            continue
+        _arm_cpu_limit()
+        passed = []
+        try:
+            for namespace in namespaces:
+                try:
+                    passed.append(bool(eval(code, _GLOBALS, namespace)))
+                except CpuLimitExceeded:
+                    raise
+                except Exception:
+                    passed.append(False)
+        except CpuLimitExceeded:
+            passed.extend([False] * (len(namespaces) - len(passed)))
+        results.append(passed)
+    return results
+
+
+def test(expression, variables):
+    """Run a rule with every variable set to 0; {'ok': bool, 'error': str|None}."""
+    namespace = _namespace({var: 0 for var in variables})
+    _arm_cpu_limit()
+    try:
+        result = eval(_code(expression), _GLOBALS, namespace)
+    except CpuLimitExceeded:
+        return {'ok': False, 'error': "Rule execution timeout (infinite loop?)"}
+    except Exception as e:
+        return {'ok': False, 'error': str(e) or type(e).__name__}
+    if not isinstance(result, (bool, int, float)):
+        return {'ok': False, 'error': f"Rule must return a boolean value, got {type(result).__name__}"}
+    return {'ok': True, 'error': None}
+
+
+def warmup():
+    """Apply the limits the parent passed in and run one rule."""
+    _apply_limits()
+    evaluate(['a + b == 1'], [{'a': '0', 'b': '1'}])
+
+
+HANDLERS = {
+    'evaluate': evaluate,
+    'test':     test,
+}
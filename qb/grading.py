@@ -0,0 +1,476 @@
+"""Server-side grading for every question type.
+
+The browser still grades for instant feedback (static/js/template-handlers.js),
+but the verdict that gets stored is computed here from the raw answer, using
+the same rules as the JS handlers:
+
+    keys = answer_keys([12, 13])                # {question_id: key}, cached per q_bank.updated_at
+    keys = quiz_answer_keys([7])                # every question of quiz 7, built together
+    grade(keys[12], 'opt_2')                    # True / False / None (undecided)
+    grade_batch([(keys[12], 'opt_2'), (keys[13], {'blank_0': '3/4'})])
+
+A key is the question's answer section precompiled into the form its grader
+wants (option-id sets, parsed numeric tolerances, normalised text sets,
+compiled FEVAL rules, ...). Raw answer shapes, as the quiz page sends them:
+
+    mcq      'opt_1'                          option id
+    mr       ['opt_0', 'opt_2']               option ids
+    fill     {'blank_0': '12', ...}           blank id → typed text ('3/4' for fractions)
+    ohs      'hs1' | '__miss__'               hotspot id
+    feval    {'x': '4', ...}                  variable → typed text
+    algebra  '2x+2'                           typed expression
+
+Algebra answers that miss the accepted strings go to sympy through the
+verdict cache and worker pool (batched in grade_batch); FEVAL rules that
+can't be checked with NumPy run in the FEVAL sandbox pool (qb/feval_rules.py).
+None means the verdict could not be decided right now (pool busy / worker
+failure) — callers keep whatever they had.
+"""
+
+import json
+import logging
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from db import db
+from models import QBank, QuizQuestion
+from qb.cache_utils import LRUCache
+from qb.equiv_cache import equiv_key, get_equiv_cache
+from qb.feval_rules import compile_rule, evaluate_batch
+from qb.equivalence import EQUIV_WORKER
+from qb.worker_pool import get_worker_pool, PoolBusy, WorkerError, WorkerTimeout
+
+logger = logging.getLogger(__name__)
+
+
+# ── sympy pool and verdict cache (shared with /api/check-expr-equiv) ───────────
+
+def equiv_pool():
+    """This worker's sympy pool (qb/equivalence.py), sized from app config."""
+    config = current_app.config
+    return get_worker_pool('equiv', script=EQUIV_WORKER,
+                           size=config.get("EQUIV_POOL_SIZE", 2),
+                           timeout=config.get("EQUIV_TIMEOUT", 5),
+                           max_queue=config.get("EQUIV_MAX_QUEUE", 8))
+
+
+def equiv_cache():
+    config = current_app.config
+    return get_equiv_cache(maxsize=config.get("EQUIV_CACHE_SIZE", 4096),
+                           timeout_ttl=config.get("EQUIV_TIMEOUT_TTL", 120))
+
+
+def check_equivalence_many(checks):
+    """Sympy verdicts for [(user_expr, correct_expr, variables, compiled), ...].
+
+    Returns one result dict ({'equivalent', 'stage'[, 'error']}) per check, or
+    None where the pool was busy, the worker failed or timed out. A timeout is
+    undecided here, not wrong: unlike /api/check-expr-equiv, a regrade must
+    not flip a stored verdict because the pool was slow, so timeouts (fresh
+    or cached) come back as None and are not cached. Duplicates and cached
+    verdicts never reach the pool; misses are spread over the pool's workers.
+    Must run in an app context.
+    """
+    cache = equiv_cache()
+    keyed = [equiv_key(user, correct, variables) + (compiled,)
+             for user, correct, variables, compiled in checks]
+    results = {}
+    todo = {}
+    for key, user, correct, variables, compiled in keyed:
+        if key in results or key in todo:
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            results[key] = None if cached.get('stage') == 'timeout' else cached
+        else:
+            todo[key] = (user, correct, variables, compiled)
+
+    if todo:
+        pool = equiv_pool()
+
+        def run(item):
+            key, (user, correct, variables, compiled) = item
+            started = time.perf_counter()
+            try:
+                result = pool.call('equiv', user_expr=user, correct_expr=correct,
+                                   variables=variables, compiled=compiled)
+            except (PoolBusy, WorkerTimeout, WorkerError) as e:
+                logger.warning("[GRADING] sympy check for %r not decided: %s", user, e)
+                return key, None, 0
+            return key, result, (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            done = list(executor.map(run, todo.items()))
+        for key, result, elapsed_ms in done:
+            results[key] = result
+            if result is not None:
+                user, correct, variables, _ = todo[key]
+                cache.set(key, user, correct, variables, result, elapsed_ms)
+
+    return [results.get(k[0]) for k in keyed]
+
+
+# ── Answer keys ────────────────────────────────────────────────────────────────
+
+def _normalize_text(s):
+    """Same as the JS handlers: drop all whitespace, lowercase."""
+    return ''.join(str(s or '').split()).lower()
+
+
+_JS_DECIMAL = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?Infinity'
+_JS_FLOAT = re.compile(r'\s*(' + _JS_DECIMAL + ')')
+_JS_NUMBER = re.compile(_JS_DECIMAL)
+
+
+def _parse_float(value):
+    """JavaScript parseFloat: leading numeric prefix, NaN if there is none."""
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _JS_FLOAT.match(str(value))
+    if not m:
+        return math.nan
+    return float(m.group(1).replace('Infinity', 'inf'))
+
+
+def _js_number(value):
+    """JavaScript Number(): whole string must be numeric, '' is 0."""
+    s = str(value).strip()
+    if not s:
+        return 0.0
+    if not _JS_NUMBER.fullmatch(s):
+        return math.nan
+    return float(s.replace('Infinity', 'inf'))
+
+
+def _js_gcd(a, b):
+    while b != 0:
+        a, b = b, math.fmod(a, b)
+    return abs(a)
+
+
+def _reduce(num, den):
+    g = _js_gcd(num, den)
+    return num / g, den / g
+
+
+def _key_mcq(q):
+    answer = q.get('answer') or {}
+    options = (q.get('input') or {}).get('options') or []
+    correct = answer.get('correct_option_id') or (options[0].get('id') if options else None) or 'opt_0'
+    return {'option': str(correct)}
+
+
+def _key_mr(q):
+    return {'options': frozenset(str(i) for i in (q.get('answer') or {}).get('correct_option_ids') or [])}
+
+
+def _key_fill(q):
+    blanks = (q.get('input') or {}).get('blanks') or []
+    correct = (q.get('answer') or {}).get('correct') or []
+    specs = []
+    for idx, blank in enumerate(blanks):
+        entry = correct[idx] if idx < len(correct) else None
+        spec = None
+        if entry:
+            rt = entry.get('response_type') or 'text'
+            if rt == 'numeric':
+                spec = ('numeric', [_parse_float(v) for v in entry.get('accepted_numeric') or []])
+            elif rt in ('fraction', 'simplest_fraction'):
+                fractions = set()
+                for f in entry.get('accepted_fraction') or []:
+                    n, d = _js_number(f.get('numerator', 0)), _js_number(f.get('denominator', 0))
+                    if d != 0 and math.isfinite(n) and math.isfinite(d):
+                        fractions.add(_reduce(n, d))
+                spec = (rt, fractions)
+            else:
+                spec = ('text', {_normalize_text(t) for t in entry.get('accepted_text') or []})
+        specs.append((blank.get('id') or f'blank_{idx}', spec))
+    return {'blanks': specs}
+
+
+def _key_ohs(q):
+    return {'hotspot': (q.get('answer') or {}).get('correct_hotspot_id') or 'hs1'}
+
+
+def _key_feval(q):
+    # Shared compiled-rule cache; a rule with a syntax error fails, as in the browser
+    return {'rules': [compile_rule(rule.get('expression', ''))
+                      for rule in (q.get('answer') or {}).get('rules') or []]}
+
+
+def _key_algebra(q):
+    answer = q.get('answer') or {}
+    return {
+        'accepted':  {_normalize_text(a) for a in answer.get('accepted') or []},
+        'use_sympy': bool(answer.get('use_sympy')),
+        'canonical': (answer.get('canonical') or '').strip(),
+        'variables': answer.get('variables') or [],
+        'compiled':  answer.get('compiled'),
+    }
+
+
+_KEY_BUILDERS = {
+    'mcq':     _key_mcq,
+    'mr':      _key_mr,
+    'fill':    _key_fill,
+    'ohs':     _key_ohs,
+    'feval':   _key_feval,
+    'algebra': _key_algebra,
+}
+
+
+def build_key(question_type, question_json):
+    """Precompile one question's answer section. Unknown types get a key that grades None."""
+    qtype = (question_type or (question_json or {}).get('type') or '').lower()
+    builder = _KEY_BUILDERS.get(qtype)
+    key = builder(question_json or {}) if builder else {}
+    key['type'] = qtype
+    return key
+
+
+# question_id → (updated_at, key)
+_keys = LRUCache(maxsize=8192)
+
+
+def answer_keys(question_ids):
+    """{question_id: key} for the given questions, rebuilt only when q_bank.updated_at moves."""
+    ids = {int(i) for i in question_ids}
+    if not ids:
+        return {}
+    return _keys_for(dict(db.session.query(QBank.id, QBank.updated_at).filter(QBank.id.in_(ids)).all()))
+
+
+def quiz_answer_keys(quiz_ids):
+    """{question_id: key} for every question in the given quizzes (via the quiz_question index).
+
+    The first answer submitted in a quiz builds the keys of all its questions
+    in one q_bank query; later answers in the same quiz only check stamps.
+    """
+    ids = {int(i) for i in quiz_ids}
+    if not ids:
+        return {}
+    stamps = (db.session.query(QBank.id, QBank.updated_at)
+              .join(QuizQuestion, QuizQuestion.question_id == QBank.id)
+              .filter(QuizQuestion.quiz_id.in_(ids))
+              .all())
+    return _keys_for(dict(stamps))
+
+
+def _keys_for(stamps):
+    """Keys for {question_id: updated_at}, from the cache where the stamp still matches."""
+    keys, stale = {}, []
+    for qid, updated_at in stamps.items():
+        cached = _keys.get(qid)
+        if cached is not None and cached[0] == updated_at:
+            keys[qid] = cached[1]
+        else:
+            stale.append(qid)
+    if stale:
+        for q in QBank.query.filter(QBank.id.in_(stale)).all():
+            key = build_key(q.type, q.json if isinstance(q.json, dict) else {})
+            _keys.set(q.id, (q.updated_at, key))
+            keys[q.id] = key
+    return keys
+
+
+# ── Rows written before raw_answer existed ─────────────────────────────────────
+
+_TAG = re.compile(r'<[^>]*>')
+
+
+def _option_text(option, fallback):
+    if isinstance(option, str):
+        return option
+    return option.get('html') or option.get('latex') or option.get('text') or fallback
+
+
+def _blank_label(blank, idx):
+    label = blank.get('input_label') or {}
+    raw = (label.get('latex') if isinstance(label, dict) else None) \
+        or _TAG.sub('', (label.get('html') if isinstance(label, dict) else None) or '') \
+        or blank.get('label') \
+        or f'Blank {idx + 1}'
+    return re.sub(r':$', '', raw.strip()).strip()
+
+
+def legacy_answer(question_type, question_json, user_answer):
+    """Recover the raw answer from a quiz_execution.user_answer display string.
+
+    Inverts quiz-controller.js _answerToString against the question as it is
+    now. Returns None when that is ambiguous (option texts that no longer
+    match, duplicate labels); callers should skip those rows.
+    """
+    if user_answer is None:
+        return None
+    qtype = (question_type or '').lower()
+    q = question_json or {}
+    if qtype in ('ohs', 'algebra'):
+        return user_answer
+    if qtype == 'feval':
+        try:
+            value = json.loads(user_answer)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+    if qtype in ('mcq', 'mr'):
+        by_text = {}
+        for option in (q.get('input') or {}).get('options') or []:
+            opt_id = str(option.get('id', '')) if isinstance(option, dict) else ''
+            by_text.setdefault(_option_text(option, opt_id), set()).add(opt_id)
+            by_text.setdefault(opt_id, set()).add(opt_id)   # _optionText falls back to the id
+
+        def option_id(text):
+            ids = by_text.get(text)
+            return next(iter(ids)) if ids and len(ids) == 1 else None
+
+        if qtype == 'mcq':
+            return option_id(user_answer)
+        ids = [option_id(t) for t in user_answer.split('; ')] if user_answer else []
+        return ids if ids and None not in ids else None
+
+    if qtype == 'fill':
+        blanks = (q.get('input') or {}).get('blanks') or []
+        labels = [_blank_label(b, i) for i, b in enumerate(blanks)]
+        if not blanks or len(set(labels)) != len(labels):
+            return None
+        pattern = '; '.join(re.escape(label) + ': (.*?)' for label in labels)
+        m = re.fullmatch(pattern, user_answer, re.S)
+        if not m:
+            return None
+        return {(b.get('id') or f'blank_{i}'): v for i, (b, v) in enumerate(zip(blanks, m.groups()))}
+    return None
+
+
+# ── Graders ────────────────────────────────────────────────────────────────────
+
+def _grade_mcq(key, answer):
+    return str(answer) == key['option']
+
+
+def _grade_mr(key, answer):
+    if not key['options'] or not isinstance(answer, (list, tuple)):
+        return False
+    return {str(a) for a in answer} == key['options']
+
+
+def _fraction_parts(value):
+    parts = str(value).split('/')
+    if len(parts) != 2:
+        return None
+    num, den = _js_number(parts[0]), _js_number(parts[1])
+    if not (math.isfinite(num) and math.isfinite(den)) or den == 0:
+        return None
+    return num, den
+
+
+def _grade_blank(spec, value):
+    kind, accepted = spec
+    if kind == 'numeric':
+        n = _parse_float(value)
+        return not math.isnan(n) and any(abs(ca - n) < 1e-9 for ca in accepted)
+    if kind in ('fraction', 'simplest_fraction'):
+        parts = _fraction_parts(value)
+        if parts is None:
+            return False
+        reduced = _reduce(*parts)
+        if reduced not in accepted:
+            return False
+        # simplest_fraction: the typed fraction must already be reduced
+        return kind == 'fraction' or parts == reduced
+    return _normalize_text(value) in accepted
+
+
+def _grade_fill(key, answer):
+    if not key['blanks'] or not isinstance(answer, dict):
+        return False
+    return all(spec is not None and _grade_blank(spec, answer.get(blank_id) or '')
+               for blank_id, spec in key['blanks'])
+
+
+def _grade_ohs(key, answer):
+    return answer == key['hotspot']
+
+
+def _grade_feval(key, answer):
+    if not key['rules'] or not isinstance(answer, dict):
+        return False
+    passed, _ = evaluate_batch(key['rules'], {k: [v] for k, v in answer.items()})
+    return passed[0]
+
+
+def _algebra_string_match(key, answer):
+    return _normalize_text(answer) in key['accepted']
+
+
+_GRADERS = {
+    'mcq':     _grade_mcq,
+    'mr':      _grade_mr,
+    'fill':    _grade_fill,
+    'ohs':     _grade_ohs,
+    'feval':   _grade_feval,
+    'algebra': _algebra_string_match,
+}
+
+
+def _needs_sympy(key, answer):
+    return (key.get('type') == 'algebra' and key['use_sympy'] and key['canonical']
+            and isinstance(answer, str) and answer.strip())
+
+
+def grade(key, answer):
+    """Grade one raw answer against a key without calling sympy.
+
+    Algebra answers that miss every accepted string return False if the
+    question has no sympy fallback and None if it does (use grade_batch).
+    """
+    grader = _GRADERS.get(key.get('type'))
+    if grader is None:
+        return None
+    if answer is None or answer == '' or answer == [] or answer == {}:
+        return False
+    verdict = grader(key, answer)
+    if verdict or verdict is None:
+        return verdict
+    return None if _needs_sympy(key, answer) else False
+
+
+def grade_batch(items):
+    """Grade [(key, answer), ...] in one call; returns a list of True / False / None.
+
+    Everything is graded in-process except algebra answers that need sympy,
+    which are checked together (deduplicated, cached, spread over the pool).
+    FEVAL answers to the same question are checked column-wise with
+    evaluate_batch, one pass per rule instead of one per student.
+    """
+    verdicts = [None] * len(items)
+    feval_groups = {}
+    for n, (key, answer) in enumerate(items):
+        if key.get('type') == 'feval' and key['rules'] and isinstance(answer, dict) and answer:
+            # Same question and same variables typed → one column batch
+            feval_groups.setdefault((id(key), tuple(sorted(answer))), []).append(n)
+        else:
+            verdicts[n] = grade(key, answer)
+    for (_, names), group in feval_groups.items():
+        key = items[group[0]][0]
+        passed, _ = evaluate_batch(key['rules'], {name: [items[n][1][name] for n in group] for name in names})
+        for n, ok in zip(group, passed):
+            verdicts[n] = ok
+
+    pending = [n for n, v in enumerate(verdicts)
+               if v is None and _needs_sympy(items[n][0], items[n][1])]
+    if pending:
+        results = check_equivalence_many([
+            (items[n][1], items[n][0]['canonical'], items[n][0]['variables'], items[n][0]['compiled'])
+            for n in pending
+        ])
+        for n, result in zip(pending, results):
+            if result is not None:
+                verdicts[n] = bool(result.get('equivalent')) and not result.get('error')
+    return verdicts
@@ -3,6 +3,8 @@
 import logging
 from qb.handlers.common import latex_to_html
 from qb.db_utils import save_question_to_db
+from qb.grading import equiv_pool
+from qb.worker_pool import PoolBusy, WorkerError
 from db import db
 
 logger = logging.getLogger(__name__)
@@ -16,22 +18,30 @@ class AlgebraHandler:
           "accepted":  ["x+4", "4+x"],   # fast-path list, spaces already stripped
           "canonical": "x+4",            # used by sympy as the reference expression
           "variables": ["x"],            # declared symbols — sympy security gate
-          "use_sympy": true              # enable sympy fallback when string match fails
+          "use_sympy": true,             # enable sympy fallback when string match fails
+          "compiled":  {...}             # written at save time — see compile_answer()
         }
     """
 
     @staticmethod
-    def prepare_html(question):
-        """Generate HTML versions from LaTeX for stem and feedback."""
+    def prepare_html(question, use_stored_html=False):
+        """Generate HTML versions from LaTeX for stem and feedback.
+
+        With use_stored_html (read paths) fields that already have html keep it.
+        """
         if isinstance(question, dict):
             question = dict(question)
 
+        # compiled is server-side only (check-expr-equiv reads it from q_bank)
+        if isinstance(question.get('answer'), dict) and 'compiled' in question['answer']:
+            question['answer'] = {k: v for k, v in question['answer'].items() if k != 'compiled'}
+
         if 'stem' in question:
             if isinstance(question['stem'], dict):
                 question['stem'] = dict(question['stem'])
             else:
                 question['stem'] = {'latex': str(question['stem']), 'html': ''}
-            if 'latex' in question['stem']:
+            if 'latex' in question['stem'] and not (use_stored_html and question['stem'].get('html')):
                 question['stem']['html'] = latex_to_html(question['stem']['latex'])
             elif 'html' not in question['stem']:
                 question['stem']['html'] = question['stem'].get('latex', '')
@@ -41,7 +51,7 @@ class AlgebraHandler:
                 question['feedback'] = dict(question['feedback'])
             else:
                 question['feedback'] = {'latex': str(question['feedback']), 'html': ''}
-            if 'latex' in question['feedback']:
+            if 'latex' in question['feedback'] and not (use_stored_html and question['feedback'].get('html')):
                 question['feedback']['html'] = latex_to_html(question['feedback']['latex'])
             elif 'html' not in question['feedback']:
                 question['feedback']['html'] = question['feedback'].get('latex', '')
@@ -53,7 +63,7 @@ class AlgebraHandler:
                     node = {'latex': str(node), 'html': ''}
                 else:
                     node = dict(node)
-                if 'latex' in node:
+                if 'latex' in node and not (use_stored_html and node.get('html')):
                     node['html'] = latex_to_html(node['latex'])
                 elif 'html' not in node:
                     node['html'] = node.get('latex', '')
@@ -86,6 +96,26 @@ class AlgebraHandler:
 
         return len(errors) == 0, errors
 
+    @staticmethod
+    def compile_answer(answer):
+        """Precompile the canonical form into answer['compiled'] using the sympy pool.
+
+        Stores the parsed canonical (srepr), its expanded form and a numeric
+        fingerprint so check-expr-equiv only has to parse the student's side.
+        Returns an error message if the canonical form does not parse; if the pool is busy the question is saved without
+        it and checks fall back to parsing the canonical string.
+        """
+        try:
+            compiled = equiv_pool().call('compile', canonical=answer['canonical'].strip(),
+                                         variables=answer.get('variables') or [])
+        except (PoolBusy, WorkerError) as e:
+            logger.warning("Could not precompile canonical %r: %s", answer.get('canonical'), e)
+            return None
+        if compiled.get('error'):
+            return f"Canonical form could not be parsed: {compiled['error']}"
+        answer['compiled'] = compiled
+        return None
+
     @staticmethod
     def save_question(data):
         """Save algebra question to database. Returns (question, error) tuple."""
@@ -101,6 +131,11 @@ class AlgebraHandler:
             if not valid:
                 return None, "Validation failed: " + "; ".join(errors)
 
+            if question.get('answer', {}).get('use_sympy'):
+                error = AlgebraHandler.compile_answer(question['answer'])
+                if error:
+                    return None, "Validation failed: " + error
+
             final_json = AlgebraHandler.order_json(question)
             q, error = save_question_to_db(question_type, topic, subtopic, level, final_json, data)
             if error:
@@ -2,50 +2,184 @@
 
 import os
 import base64
-import json as _json
-import shutil
-import subprocess
+import contextvars
+import re
 import latex2mathml.converter
 from flask import current_app
+from qb.katex_pool import get_katex_pool
+from qb.render_cache import RENDERER_VERSIONS, get_render_cache, render_key
 
-# Resolve node executable once at import time (None if not on PATH)
-_NODE_BIN = shutil.which('node')
-_KATEX_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'katex_render.js')
+
+def app_render_cache():
+    """The render cache configured for the current Flask app."""
+    config = current_app.config
+    return get_render_cache(path=config.get("RENDER_CACHE_PATH"),
+                            maxsize=config.get("RENDER_CACHE_SIZE", 4096))
+
+
+# Set by collect_math_spans(): _render_math records spans here instead of rendering
+_collecting = contextvars.ContextVar('_collecting', default=None)
 
 
 def _render_math(inner, display_mode):
     """Render a LaTeX math expression to HTML.
 
-    Primary:  node katex_render.js via subprocess (full KaTeX — textcolor, textbf, etc.)
+    Primary:  persistent pool of node katex_render.js workers (full KaTeX — textcolor, textbf, etc.)
     Fallback: latex2mathml (used locally when node is not installed, or on timeout/error)
 
     Controlled by LATEX_RENDERER config: 'katex' (default) or 'mathml'.
+    Pool size and per-request timeout come from KATEX_POOL_SIZE / KATEX_TIMEOUT.
+
+    Results are cached per (latex, displayMode, renderer, version) in the
+    shared render cache; the raw-LaTeX last resort is never cached.
     """
-    renderer = current_app.config.get("LATEX_RENDERER", "katex")
-    if renderer == "katex" and _NODE_BIN and os.path.exists(_KATEX_SCRIPT):
-        try:
-            payload = _json.dumps({'latex': inner, 'displayMode': display_mode})
-            result = subprocess.run(
-                [_NODE_BIN, _KATEX_SCRIPT],
-                input=payload,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                timeout=10
-            )
-            if result.returncode == 0 and result.stdout:
-                return result.stdout
-            # Non-zero exit: KaTeX parse error — fall through to mathml
-        except subprocess.TimeoutExpired:
-            pass
-        except Exception:
-            pass
+    spans = _collecting.get()
+    if spans is not None:
+        spans.append((inner, display_mode))
+        return ''
+    config = current_app.config
+    cache = app_render_cache()
+    renderer = config.get("LATEX_RENDERER", "katex")
+    if renderer == "katex":
+        key = render_key(inner, display_mode, "katex")
+        html = cache.get(key)
+        if html is not None:
+            return html
+        pool = get_katex_pool(size=config.get("KATEX_POOL_SIZE", 2),
+                              timeout=config.get("KATEX_TIMEOUT", 10))
+        html = pool.render(inner, display_mode)
+        if html:
+            cache.set(key, html)
+            return html
+        # Worker unavailable, crashed or timed out — fall through to mathml
     # Fallback: latex2mathml (works without node; no textcolor/textbf support)
+    key = render_key(inner, display_mode, "mathml")
+    html = cache.get(key)
+    if html is not None:
+        return html
     mode = 'block' if display_mode else 'inline'
     try:
-        return latex2mathml.converter.convert(inner, display=mode)
+        html = latex2mathml.converter.convert(inner, display=mode)
     except Exception:
         return inner  # last resort: raw LaTeX
+    cache.set(key, html)
+    return html
+
+
+def collect_math_spans(latex):
+    """Return the (inner, display_mode) math spans latex_to_html would render.
+
+    Runs the real scanner in collect mode, so delimiters, escapes and nested
+    formatting commands are interpreted exactly as at render time.
+    """
+    if not isinstance(latex, str) or '$' not in latex:
+        return []
+    token = _collecting.set([])
+    try:
+        latex_to_html(latex)
+        return _collecting.get()
+    finally:
+        _collecting.reset(token)
+
+
+# Fields prepare_html wraps as {'latex': value} when they are stored as plain strings
+_WRAPPED_FIELDS = frozenset({'stem', 'feedback', 'input_label', 'label_after'})
+
+
+def question_latex_strings(question):
+    """Yield every string in a question dict that prepare_html renders.
+
+    That is each ``latex`` value (stem, feedback, options, blanks, labels) plus
+    stem, feedback and label fields stored as bare strings.
+    """
+    if isinstance(question, dict):
+        for key, value in question.items():
+            if isinstance(value, str) and (key == 'latex' or key in _WRAPPED_FIELDS):
+                yield value
+            elif isinstance(value, (dict, list)):
+                yield from question_latex_strings(value)
+    elif isinstance(question, list):
+        for item in question:
+            yield from question_latex_strings(item)
+
+
+def prerender_math(texts):
+    """Warm the render cache for every math span in ``texts`` with one batched KaTeX call.
+
+    Phase one of two-phase rendering: collect the unique spans of a whole
+    question (or quiz, or upload), render the cache misses in a single round
+    trip to katex_render.js, and store them. The normal latex_to_html pass
+    that follows then hits the cache for every span. Spans that fail in the
+    batch are left alone and take the usual per-span path (incl. mathml fallback).
+
+    Returns the number of spans rendered.
+    """
+    config = current_app.config
+    if config.get("LATEX_RENDERER", "katex") != "katex":
+        return 0  # latex2mathml runs in-process — nothing to batch
+
+    spans = {}
+    for text in texts:
+        for span in collect_math_spans(text):
+            spans.setdefault(span, None)
+
+    cache = app_render_cache()
+    misses = []
+    for inner, display_mode in spans:
+        key = render_key(inner, display_mode, "katex")
+        if cache.get(key) is None:
+            misses.append((inner, display_mode, key))
+    if not misses:
+        return 0
+
+    pool = get_katex_pool(size=config.get("KATEX_POOL_SIZE", 2),
+                          timeout=config.get("KATEX_TIMEOUT", 10))
+    htmls = pool.render_many([(inner, display_mode) for inner, display_mode, _ in misses])
+    rendered = 0
+    for (_, _, key), html in zip(misses, htmls):
+        if html:
+            cache.set(key, html)
+            rendered += 1
+    return rendered
+
+
+# Bump when latex_to_html's output changes, so stored question HTML is re-rendered
+HTML_VERSION = 1
+
+
+def render_version():
+    """Stamp for stored question HTML: converter version + renderer + renderer version.
+
+    q_bank.render_version records the stamp a question's html fields were
+    rendered under. While it matches, read paths serve the stored HTML
+    (see stored_question_html); after a KaTeX upgrade, a renderer switch or
+    an HTML_VERSION bump they render on the fly until rerender_questions.py
+    has caught the bank up.
+    """
+    renderer = current_app.config.get("LATEX_RENDERER", "katex")
+    return f"{HTML_VERSION}:{renderer}:{RENDERER_VERSIONS.get(renderer, 'unknown')}"
+
+
+def stored_question_html(handler, q):
+    """Read path: ``handler.prepare_html(q.json)``, reusing stored HTML when it is current."""
+    return handler.prepare_html(q.json, use_stored_html=getattr(q, 'render_version', None) == render_version())
+
+
+def rerender_question_html(question):
+    """Re-render every ``html`` next to a ``latex`` string in a question dict.
+
+    Unlike generate_question_html this ignores existing html, and unlike the
+    handlers' prepare_html it leaves server-only data (answer.compiled) alone,
+    so the result can be written straight back to q_bank.json. Returns a new dict.
+    """
+    if isinstance(question, list):
+        return [rerender_question_html(item) for item in question]
+    if not isinstance(question, dict):
+        return question
+    question = {k: rerender_question_html(v) for k, v in question.items()}
+    if isinstance(question.get('latex'), str):
+        question['html'] = latex_to_html(question['latex'])
+    return question
 
 
 def save_image_from_data_url(data_url, filename, subdir="qimage"):
@@ -88,6 +222,26 @@ def rename_image_file(old_filename, new_filename, subdir="qimage"):
         return None
 
 
+# One alternation over every delimiter/command latex_to_html reacts to.
+# Order matters only where alternatives share a start: $$ must precede $.
+_LATEX_TOKEN = re.compile(
+    r'(?P<display>\$\$)'
+    r'|(?P<escaped>\\\$)'
+    r'|(?P<inline>\$)'
+    r'|(?P<bracket>\\\[)'
+    r'|(?P<paren>\\\()'
+    r'|\\(?P<cmd>textbf|textit|underline|texttt)\{'
+    r'|(?P<linebreak>\\\\|\n)'
+)
+_BRACE = re.compile(r'[{}]')
+_CMD_TAGS = {
+    'textbf':    ('<strong>', '</strong>'),
+    'textit':    ('<em>', '</em>'),
+    'underline': ('<u>', '</u>'),
+    'texttt':    ('<code>', '</code>'),
+}
+
+
 def latex_to_html(latex):
     """Convert LaTeX text formatting to HTML while preserving math mode.
     
@@ -101,160 +255,110 @@ def latex_to_html(latex):
     - Preserves math delimiters: $...$, $$...$$, \\(...\\), \\[...\\]
     - Supports nested LaTeX commands and math within text formatting
     
+    Single pass: one compiled regex jumps between tokens, and nested
+    formatting commands push a frame (closing tag, resume position, outer
+    end) on an explicit stack instead of recursing. Each frame's argument is
+    scanned in place with ``endpos`` bounds, so it sees exactly the text a
+    recursive call on the argument substring would.
+    
     MathJax will render any remaining LaTeX math mode content.
     """
     if not isinstance(latex, str):
         return latex
-    
+
     result = []
-    i = 0
-    length = len(latex)
-    
-    while i < length:
-        # Preserve math mode content - don't convert LaTeX inside math
-        if i < length - 1 and latex[i:i+2] == '$$':
-            # Display math mode: $$ ... $$ → MathML block
-            j = latex.find('$$', i + 2)
+    stack = []           # (closing tag, resume position, outer end)
+    pos = 0
+    end = len(latex)
+    search = _LATEX_TOKEN.search
+
+    while True:
+        m = search(latex, pos, end)
+        if m is None:
+            # Plain text up to the end of this frame, then close it
+            result.append(latex[pos:end])
+            if not stack:
+                break
+            close_tag, pos, end = stack.pop()
+            result.append(close_tag)
+            continue
+
+        i = m.start()
+        if i > pos:
+            result.append(latex[pos:i])
+        kind = m.lastgroup
+
+        if kind == 'display':
+            # Display math mode: $$ ... $$ → rendered block
+            j = latex.find('$$', i + 2, end)
             if j != -1:
-                inner = latex[i+2:j]
                 try:
-                    result.append(_render_math(inner, display_mode=True))
+                    result.append(_render_math(latex[i+2:j], display_mode=True))
                 except Exception:
                     result.append(latex[i:j+2])  # fallback: keep raw
-                i = j + 2
-                continue
+                pos = j + 2
             else:
                 result.append('$$')
-                i += 2
-        elif i < length - 1 and latex[i:i+2] == '\\$':
+                pos = i + 2
+        elif kind == 'escaped':
             # Escaped dollar sign (literal currency symbol, e.g. \$50)
             result.append('$')
-            i += 2
-        elif latex[i] == '$':
-            # Inline math mode: $ ... $ → MathML inline
-            j = latex.find('$', i + 1)
+            pos = i + 2
+        elif kind == 'inline':
+            # Inline math mode: $ ... $ → rendered inline
+            j = latex.find('$', i + 1, end)
             if j != -1:
-                inner = latex[i+1:j]
                 try:
-                    result.append(_render_math(inner, display_mode=False))
+                    result.append(_render_math(latex[i+1:j], display_mode=False))
                 except Exception:
                     result.append(latex[i:j+1])  # fallback: keep raw
-                i = j + 1
-                continue
+                pos = j + 1
             else:
                 result.append('$')
-                i += 1
-        elif i < length - 1 and latex[i:i+2] == '\\[':
-            # Display math mode: \[ ... \]
-            j = latex.find('\\]', i + 2)
-            if j != -1:
-                result.append(latex[i:j+2])
-                i = j + 2
-                continue
-            else:
-                result.append('\\[')
-                i += 2
-        elif i < length - 1 and latex[i:i+2] == '\\(':
-            # Inline math mode: \( ... \)
-            j = latex.find('\\)', i + 2)
+                pos = i + 1
+        elif kind == 'bracket' or kind == 'paren':
+            # \[ ... \] and \( ... \) are left for MathJax untouched
+            closer = '\\]' if kind == 'bracket' else '\\)'
+            j = latex.find(closer, i + 2, end)
             if j != -1:
                 result.append(latex[i:j+2])
-                i = j + 2
-                continue
+                pos = j + 2
             else:
-                result.append('\\(')
-                i += 2
-        # Handle LaTeX text formatting commands
-        elif i < length - 7 and latex[i:i+8] == '\\textbf{':
-            # Extract content of \textbf{...}
-            content, end_pos = _extract_latex_arg(latex, i + 8)
-            if content is not None:
-                converted_content = latex_to_html(content)  # Recursively handle nested formatting
-                result.append(f'<strong>{converted_content}</strong>')
-                i = end_pos
-                continue
+                result.append(m.group())
+                pos = i + 2
+        elif kind == 'cmd':
+            # \textbf{...} etc. — find the matching brace within this frame
+            close = _matching_brace(latex, m.end(), end)
+            if close is not None:
+                open_tag, close_tag = _CMD_TAGS[m.group('cmd')]
+                result.append(open_tag)
+                stack.append((close_tag, close + 1, end))
+                pos, end = m.end(), close
             else:
-                result.append(latex[i])
-                i += 1
-        elif i < length - 7 and latex[i:i+8] == '\\textit{':
-            # Extract content of \textit{...}
-            content, end_pos = _extract_latex_arg(latex, i + 8)
-            if content is not None:
-                converted_content = latex_to_html(content)  # Recursively handle nested formatting
-                result.append(f'<em>{converted_content}</em>')
-                i = end_pos
-                continue
-            else:
-                result.append(latex[i])
-                i += 1
-        elif i < length - 10 and latex[i:i+11] == '\\underline{':
-            # Extract content of \underline{...}
-            content, end_pos = _extract_latex_arg(latex, i + 11)
-            if content is not None:
-                converted_content = latex_to_html(content)  # Recursively handle nested formatting
-                result.append(f'<u>{converted_content}</u>')
-                i = end_pos
-                continue
-            else:
-                result.append(latex[i])
-                i += 1
-        elif i < length - 7 and latex[i:i+8] == '\\texttt{':
-            # Extract content of \texttt{...}
-            content, end_pos = _extract_latex_arg(latex, i + 8)
-            if content is not None:
-                converted_content = latex_to_html(content)  # Recursively handle nested formatting
-                result.append(f'<code>{converted_content}</code>')
-                i = end_pos
-                continue
-            else:
-                result.append(latex[i])
-                i += 1
-        # Handle line breaks
-        elif i < length - 1 and latex[i:i+2] == '\\\\':
-            # LaTeX line break (two backslashes: \\)
-            result.append('<br>')
-            i += 2
-        elif latex[i] == '\n':
-            # Actual newline character (user pressed Enter)
-            result.append('<br>')
-            i += 1
+                result.append('\\')
+                pos = i + 1
         else:
-            result.append(latex[i])
-            i += 1
-    
+            # LaTeX line break (\\) or actual newline character
+            result.append('<br>')
+            pos = m.end()
+
     return ''.join(result)
 
 
-def _extract_latex_arg(text, start_pos):
-    """Extract the argument of a LaTeX command, handling nested braces.
-    
-    Args:
-        text: The full LaTeX string
-        start_pos: Position right after the opening brace
-    
-    Returns:
-        Tuple of (content, end_pos) or (None, start_pos) if no matching brace found
+def _matching_brace(text, start, end):
+    """Index of the brace closing an argument that opens just before ``start``, or None.
+
+    Only text[start:end] is considered, so nested frames never see past their own argument.
     """
-    if start_pos >= len(text):
-        return None, start_pos
-    
     depth = 1
-    i = start_pos
-    
-    while i < len(text) and depth > 0:
-        if text[i] == '{':
+    for m in _BRACE.finditer(text, start, end):
+        if m.group() == '{':
             depth += 1
-        elif text[i] == '}':
+        else:
             depth -= 1
-        i += 1
-    
-    if depth == 0:
-        # Found matching closing brace
-        content = text[start_pos:i-1]
-        return content, i
-    else:
-        # No matching brace found
-        return None, start_pos
+            if depth == 0:
+                return m.start()
+    return None
 
 
 def generate_question_html(question):
@@ -1,11 +1,11 @@
 """Fill in the Blank with Custom Evaluation (FEVAL) question handler."""
 
-import ast
 import re
 from jsonschema import ValidationError, validate
 from qb.latex_utils import compile_latex_to_pdf
 from qb.handlers.common import latex_to_html, generate_question_html
 from qb.db_utils import save_question_to_db
+from qb.feval_rules import compile_rule, test_rule
 from db import db
 import logging
 
@@ -21,11 +21,8 @@ class FEVALHandler:
         Validate Python expression syntax.
         Returns (valid, error_message)
         """
-        try:
-            ast.parse(expression, mode='eval')
-            return True, None
-        except SyntaxError as e:
-            return False, str(e)
+        rule = compile_rule(expression)
+        return rule.ok, rule.error
 
     @staticmethod
     def validate_variables_exist(expression, declared_variables):
@@ -33,29 +30,17 @@ class FEVALHandler:
         Check that all variables used in expression are declared.
         Returns (valid, error_message)
         """
-        try:
-            tree = ast.parse(expression, mode='eval')
-            used_vars = set()
-            
-            # Extract all Name nodes (variable references)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Name):
-                    used_vars.add(node.id)
-            
-            # Check for safe builtins that don't need to be declared
-            safe_builtins = {
-                'abs', 'round', 'max', 'min', 'len', 'sum', 'isinstance',
-                'True', 'False', 'None', 'int', 'float', 'str', 'list', 'dict'
-            }
-            
-            undeclared = used_vars - safe_builtins - set(declared_variables)
-            
-            if undeclared:
-                return False, f"Undefined variables: {', '.join(sorted(undeclared))}"
-            
-            return True, None
-        except Exception as e:
-            return False, str(e)
+        rule = compile_rule(expression)
+        if not rule.ok:
+            return False, rule.error
+
+        # rule.names already leaves out the safe builtins (abs, round, max, ...)
+        undeclared = rule.names - set(declared_variables)
+
+        if undeclared:
+            return False, f"Undefined variables: {', '.join(sorted(undeclared))}"
+
+        return True, None
 
     @staticmethod
     def validate_feedback_template(template, declared_variables):
@@ -89,35 +74,8 @@ class FEVALHandler:
         Test that rule executes safely and returns boolean.
         Returns (valid, error_message)
         """
-        try:
-            # Prepare safe namespace
-            safe_namespace = {var: 0 for var in declared_variables}
-            safe_namespace.update({
-                'abs': abs,
-                'round': round,
-                'max': max,
-                'min': min,
-                'len': len,
-                'sum': sum,
-                'isinstance': isinstance,
-                'int': int,
-                'float': float,
-                'str': str,
-            })
-            
-            # Use compile with timeout (simulated via simple execution)
-            compiled = compile(expression, '<string>', 'eval')
-            result = eval(compiled, {"__builtins__": {}}, safe_namespace)
-            
-            # Verify result is boolean-like
-            if not isinstance(result, (bool, int, float)):
-                return False, f"Rule must return a boolean value, got {type(result).__name__}"
-            
-            return True, None
-        except TimeoutError:
-            return False, "Rule execution timeout (infinite loop?)"
-        except Exception as e:
-            return False, str(e)
+        # Runs in the FEVAL sandbox pool: whitelist, operand-size guards, CPU/memory rlimits
+        return test_rule(expression, declared_variables)
 
     @staticmethod
     def validate_rules(rules, blanks):
@@ -180,8 +138,11 @@ class FEVALHandler:
         return ordered
 
     @staticmethod
-    def prepare_html(question):
-        """Generate HTML versions from LaTeX for all text fields."""
+    def prepare_html(question, use_stored_html=False):
+        """Generate HTML versions from LaTeX for all text fields.
+
+        With use_stored_html (read paths) fields that already have html keep it.
+        """
         # Make a copy to avoid mutating input
         if isinstance(question, dict):
             question = dict(question)
@@ -194,7 +155,7 @@ class FEVALHandler:
                 question['stem'] = {'latex': str(question['stem']), 'html': ''}
             
             # Convert LaTeX to HTML if we have LaTeX
-            if 'latex' in question['stem']:
+            if 'latex' in question['stem'] and not (use_stored_html and question['stem'].get('html')):
                 question['stem']['html'] = latex_to_html(question['stem']['latex'])
             elif 'html' not in question['stem']:
                 question['stem']['html'] = question['stem'].get('latex', '')
@@ -206,7 +167,7 @@ class FEVALHandler:
             else:
                 question['feedback'] = {'latex': str(question['feedback']), 'html': ''}
             
-            if 'latex' in question['feedback']:
+            if 'latex' in question['feedback'] and not (use_stored_html and question['feedback'].get('html')):
                 question['feedback']['html'] = latex_to_html(question['feedback']['latex'])
             elif 'html' not in question['feedback']:
                 question['feedback']['html'] = question['feedback'].get('latex', '')
@@ -40,8 +40,11 @@ class FILLHandler:
         return ordered
 
     @staticmethod
-    def prepare_html(question):
-        """Generate HTML versions from LaTeX for all text fields."""
+    def prepare_html(question, use_stored_html=False):
+        """Generate HTML versions from LaTeX for all text fields.
+
+        With use_stored_html (read paths) fields that already have html keep it.
+        """
         # Make a copy to avoid mutating input
         if isinstance(question, dict):
             question = dict(question)
@@ -54,7 +57,7 @@ class FILLHandler:
                 question['stem'] = {'latex': str(question['stem']), 'html': ''}
             
             # Convert LaTeX to HTML if we have LaTeX
-            if 'latex' in question['stem']:
+            if 'latex' in question['stem'] and not (use_stored_html and question['stem'].get('html')):
                 question['stem']['html'] = latex_to_html(question['stem']['latex'])
             elif 'html' not in question['stem']:
                 question['stem']['html'] = question['stem'].get('latex', '')
@@ -70,7 +73,7 @@ class FILLHandler:
                     else:
                         blank_copy['input_label'] = {'latex': str(blank_copy['input_label']), 'html': ''}
                     
-                    if 'latex' in blank_copy['input_label']:
+                    if 'latex' in blank_copy['input_label'] and not (use_stored_html and blank_copy['input_label'].get('html')):
                         blank_copy['input_label']['html'] = latex_to_html(blank_copy['input_label']['latex'])
                     elif 'html' not in blank_copy['input_label']:
                         blank_copy['input_label']['html'] = blank_copy['input_label'].get('latex', '')
@@ -80,7 +83,7 @@ class FILLHandler:
                         la = dict(la)
                     else:
                         la = {'latex': str(la), 'html': ''}
-                    if 'latex' in la:
+                    if 'latex' in la and not (use_stored_html and la.get('html')):
                         la['html'] = latex_to_html(la['latex'])
                     elif 'html' not in la:
                         la['html'] = la.get('latex', '')
@@ -35,8 +35,12 @@ class OHSHandler:
         return ordered
     
     @staticmethod
-    def prepare_html(question):
-        """Generate HTML representation of question."""
+    def prepare_html(question, use_stored_html=False):
+        """Generate HTML representation of question.
+
+        generate_question_html already keeps stored html, so use_stored_html
+        changes nothing here.
+        """
         return generate_question_html(question)
     
     @staticmethod
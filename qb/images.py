@@ -0,0 +1,172 @@
+"""Question images embedded as data URIs for self-contained sheets and reviews.
+
+Printable sheets and review pages inline every /qimage/ picture so the
+downloaded HTML works offline. One review set can show the same diagram
+dozens of times, so encoded payloads are kept in an in-process LRU keyed by
+(path, mtime, size) — replacing or re-uploading a file changes the key, and
+the stale entry simply ages out. The LRU is bounded by IMAGE_CACHE_SIZE
+entries and IMAGE_CACHE_MB of payload.
+
+    embed_image('/qimage/q123.png')     # 'data:image/png;base64,...'
+    embed_image('https://elsewhere/x')  # returned unchanged
+    ''.join(stream_image(src))          # same URI, yielded a piece at a time
+
+With Pillow installed, images wider than IMAGE_PRINT_WIDTH pixels are
+downscaled before encoding (0 disables this); without it they are embedded
+as stored. Payloads still over _MAX_CACHED_BYTES after that are not cached,
+and stream_image() encodes them a chunk at a time. Any failure falls back to
+the original src — a missing picture must never break a sheet.
+"""
+
+import base64
+import io
+import logging
+import mimetypes
+import os
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+from flask import current_app
+
+from qb.cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_QIMAGE_PREFIXES = ('/qimage/', '/static/qimage/')
+
+# Payloads (after downscaling) larger than this are not cached
+_MAX_CACHED_BYTES = 1024 * 1024
+# Encoding chunk for uncached payloads; a multiple of 3, so chunk encodings concatenate cleanly
+_STREAM_CHUNK = 3 * 16 * 1024
+
+_images = None
+_images_lock = threading.Lock()
+
+
+def image_path(src):
+    """Filesystem path under QIMAGE_PATH for a /qimage/ src, or None for anything else."""
+    from config import QIMAGE_PATH
+
+    for prefix in _QIMAGE_PREFIXES:
+        if src and src.startswith(prefix):
+            return os.path.join(QIMAGE_PATH, src[len(prefix):])
+    return None
+
+
+def _cache():
+    global _images
+    if _images is None:
+        with _images_lock:
+            if _images is None:
+                config = current_app.config
+                _images = LRUCache(maxsize=config.get("IMAGE_CACHE_SIZE", 256),
+                                   maxbytes=config.get("IMAGE_CACHE_MB", 64) * 1024 * 1024)
+    return _images
+
+
+def _downscale(data, max_width):
+    """(bytes, format) shrunk to max_width pixels wide, or None to keep the original."""
+    if Image is None or not max_width:
+        return None
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format
+        if fmt not in ('PNG', 'JPEG') or img.width <= max_width:
+            return None
+        height = max(round(img.height * max_width / img.width), 1)
+        small = img.resize((max_width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        if fmt == 'JPEG':
+            small.save(out, 'JPEG', quality=85, optimize=True)
+        else:
+            small.save(out, 'PNG', optimize=True)
+    scaled = out.getvalue()
+    return (scaled, fmt) if len(scaled) < len(data) else None
+
+
+def _payload(path, max_width):
+    """(bytes, mime) to embed for a file — downscaled when Pillow can and it helps."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    mime = _mime(path)
+    try:
+        scaled = _downscale(data, max_width)
+    except Exception as e:
+        logger.warning("Could not downscale %s: %s", path, e)
+        scaled = None
+    if scaled:
+        data, mime = scaled[0], Image.MIME.get(scaled[1], mime)
+    return data, mime
+
+
+def _mime(path):
+    return mimetypes.guess_type(path)[0] or 'image/png'
+
+
+def _stream_file(path, src):
+    """Yield a file's data URI as stored, reading and encoding it a chunk at a time."""
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        yield src
+        return
+    with f:
+        yield f'data:{_mime(path)};base64,'
+        while True:
+            chunk = f.read(_STREAM_CHUNK)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk).decode()
+
+
+def embed_image(src):
+    """A data URI for a /qimage/ src, or src itself if it can't be embedded."""
+    return ''.join(stream_image(src))
+
+
+def stream_image(src):
+    """Yield embed_image(src) in pieces.
+
+    A payload that fits _MAX_CACHED_BYTES is cached and yielded whole; a
+    larger one is base64-encoded a chunk at a time. Without Pillow a large
+    file can't shrink, so it is read from disk a chunk at a time too.
+    """
+    path = image_path(src)
+    if path is None:
+        yield src
+        return
+    try:
+        st = os.stat(path)
+    except OSError:
+        yield src
+        return
+    max_width = current_app.config.get("IMAGE_PRINT_WIDTH", 1200)
+    key = (path, st.st_mtime_ns, st.st_size, max_width)
+    cache = _cache()
+    uri = cache.get(key)
+    if uri is not None:
+        yield uri
+        return
+    if Image is None and st.st_size > _MAX_CACHED_BYTES:
+        yield from _stream_file(path, src)
+        return
+    try:
+        data, mime = _payload(path, max_width)
+    except OSError:
+        yield src
+        return
+    if len(data) <= _MAX_CACHED_BYTES:
+        uri = f'data:{mime};base64,{base64.b64encode(data).decode()}'
+        cache.set(key, uri)
+        yield uri
+        return
+    yield f'data:{mime};base64,'
+    for i in range(0, len(data), _STREAM_CHUNK):
+        yield base64.b64encode(data[i:i + _STREAM_CHUNK]).decode()
+
+
+def cache_stats():
+    return _cache().stats()
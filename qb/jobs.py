@@ -0,0 +1,191 @@
+"""Background jobs with progress reporting.
+
+Long admin operations (quiz resync, regrading) run on a daemon thread inside
+an app context instead of inside the HTTP request, so they are not bound by
+the gunicorn timeout. The request returns a job id straight away and the
+page polls GET /quiz/api/jobs/<job_id>.
+
+    job = start_job('resync', _run_resync)     # fn(job) — call job.progress(done, total, msg)
+    get_job(job.id).to_dict()
+
+The thread runs in the worker that started the job, but its state lives in
+prod.background_job (see background_job.sql), so polls that land on any
+other gunicorn worker see the same progress. start_job is single-flight per
+name across workers: starting a job while one with the same name is still
+running returns the running one. A job whose worker died stops updating its
+row and is marked failed once it has been silent for _STALE_AFTER.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import text
+
+from db import db
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept this long so late polls still see the result
+_KEEP_FINISHED = 3600  # seconds
+# A queued/running job with no progress for this long is taken to be dead
+_STALE_AFTER = 900     # seconds
+# Progress is written to the database at most this often
+_PROGRESS_EVERY = 1.0  # seconds
+
+_TABLE = BackgroundJob.__table__.fullname
+
+_COLUMNS = ("id, name, status, done, total, message, result, error, "
+            "EXTRACT(EPOCH FROM COALESCE(finished_at, now()) - created_at) AS elapsed")
+
+_EXPIRE_SQL = f"""
+UPDATE {_TABLE}
+SET status = 'failed', error = 'Job stopped reporting progress (worker restarted?)',
+    finished_at = now(), updated_at = now()
+WHERE status IN ('queued', 'running')
+  AND updated_at < now() - make_interval(secs => :stale_after)
+"""
+
+_PRUNE_SQL = f"DELETE FROM {_TABLE} WHERE finished_at < now() - make_interval(secs => :keep)"
+
+_CLAIM_SQL = f"""
+INSERT INTO {_TABLE} (id, name, status, done, total, message)
+VALUES (:id, :name, 'queued', 0, 0, '')
+ON CONFLICT (name) WHERE status IN ('queued', 'running') DO NOTHING
+RETURNING id
+"""
+
+_ACTIVE_SQL = f"SELECT {_COLUMNS} FROM {_TABLE} WHERE name = :name AND status IN ('queued', 'running')"
+
+_GET_SQL = f"SELECT {_COLUMNS} FROM {_TABLE} WHERE id = :id"
+
+_SAVE_SQL = f"""
+UPDATE {_TABLE}
+SET status = :status, done = :done, total = :total, message = :message,
+    result = CAST(:result AS json), error = :error, updated_at = now(),
+    finished_at = CASE WHEN :finished THEN now() END
+WHERE id = :id
+"""
+
+
+class Job:
+    def __init__(self, name, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.name = name
+        self.status = 'queued'      # queued → running → done | failed
+        self.done = 0
+        self.total = 0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.elapsed = None         # set when loaded from the database
+        self._saved_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls(row.name, row.id)
+        job.status = row.status
+        job.done = row.done
+        job.total = row.total
+        job.message = row.message or ''
+        job.result = row.result
+        job.error = row.error
+        job.elapsed = float(row.elapsed)
+        return job
+
+    def progress(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        if time.monotonic() - self._saved_at >= _PROGRESS_EVERY or done == self.total:
+            self.save()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def save(self):
+        """Write this job's state to its row; failures are logged, never raised into the job."""
+        self._saved_at = time.monotonic()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(_SAVE_SQL), {
+                    'id': self.id,
+                    'status': self.status,
+                    'done': self.done,
+                    'total': self.total,
+                    'message': self.message,
+                    'result': json.dumps(self.result, default=str),
+                    'error': self.error,
+                    'finished': self.finished,
+                })
+        except Exception:
+            logger.exception("[JOB] could not save %s %s", self.name, self.id)
+
+    def to_dict(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.created_at
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'elapsed': round(elapsed, 2),
+        }
+
+
+def _run(app, job, fn, args, kwargs):
+    started = time.time()
+    with app.app_context():
+        job.status = 'running'
+        job.save()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("[JOB] %s %s failed", job.name, job.id)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.save()
+            db.session.remove()
+    logger.info("[JOB] %s %s %s in %.1fs", job.name, job.id, job.status, time.time() - started)
+
+
+def start_job(name, fn, *args, **kwargs):
+    """Run fn(job, *args, **kwargs) on a background thread; return the Job (or the running one)."""
+    app = current_app._get_current_object()
+    job = Job(name)
+    with db.engine.begin() as conn:
+        conn.execute(text(_EXPIRE_SQL), {'stale_after': _STALE_AFTER})
+        conn.execute(text(_PRUNE_SQL), {'keep': _KEEP_FINISHED})
+        claimed = conn.execute(text(_CLAIM_SQL), {'id': job.id, 'name': name}).scalar()
+        if claimed is None:
+            running = conn.execute(text(_ACTIVE_SQL), {'name': name}).first()
+            if running is not None:
+                return Job.from_row(running)
+            # The running one finished between the two statements — claim again
+            claimed = conn.execute(text(_CLAIM_SQL), {'id': job.id, 'name': name}).scalar()
+            if claimed is None:
+                raise RuntimeError(f"could not start job {name!r}")
+    thread = threading.Thread(target=_run, args=(app, job, fn, args, kwargs),
+                              name=f"job-{name}-{job.id}", daemon=True)
+    thread.start()
+    return job
+
+
+def get_job(job_id):
+    """The Job with this id from any worker, or None if unknown or pruned."""
+    row = db.session.execute(text(_GET_SQL), {'id': job_id}).first()
+    return Job.from_row(row) if row is not None else None
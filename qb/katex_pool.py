@@ -0,0 +1,216 @@
+"""Persistent pool of KaTeX render workers (node katex_render.js --server).
+
+Each gunicorn worker process owns its own pool. Workers speak line-delimited
+JSON over stdin/stdout (see katex_render.js) through the same LineWorker as
+the Python worker pool (qb/worker_pool.py), so KaTeX is loaded once per node
+process instead of once per math span.
+
+    pool = get_katex_pool(size=2, timeout=10)
+    html = pool.render(r'\\frac{1}{2}', display_mode=False)   # None on failure
+    htmls = pool.render_many([(r'x^2', False), (r'\\sum_i i', True)])  # one round trip
+
+``render`` never raises — it returns None when node is unavailable, the
+worker crashed or the request timed out, and the caller falls back to
+latex2mathml exactly as the old one-shot subprocess path did.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+from qb.worker_pool import LineWorker, WorkerError, WorkerTimeout
+
+logger = logging.getLogger(__name__)
+
+# Resolve node executable once at import time (None if not on PATH)
+NODE_BIN = shutil.which('node')
+KATEX_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'katex_render.js')
+
+# Idle workers older than this are pinged before being handed out
+_HEALTH_CHECK_AFTER = 30  # seconds
+_PING_TIMEOUT = 5         # seconds
+_BATCH_SPAN_BUDGET = 0.05 # extra seconds of timeout per span in a batch request
+
+
+class _KatexWorker(LineWorker):
+    """One long-lived ``node katex_render.js --server`` process."""
+
+    def __init__(self, node_bin, script):
+        super().__init__([node_bin, script, '--server'], stderr=subprocess.DEVNULL)
+
+    def ping(self, timeout=_PING_TIMEOUT):
+        try:
+            return bool(self.request({'ping': True}, timeout).get('ok'))
+        except WorkerError:
+            return False
+
+
+class KatexPool:
+    """Fixed-size pool of KaTeX workers with restart-on-crash and per-request timeouts."""
+
+    def __init__(self, size=2, timeout=10, node_bin=None, script=None):
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.node_bin = node_bin or NODE_BIN
+        self.script = script or KATEX_SCRIPT
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        self._closed = False
+
+    @property
+    def available(self):
+        return bool(self.node_bin) and os.path.exists(self.script) and not self._closed
+
+    # ── Worker lifecycle ────────────────────────────────────────────────────
+
+    def _spawn(self):
+        worker = _KatexWorker(self.node_bin, self.script)
+        logger.info("[KATEX_POOL] started worker pid=%s", worker.proc.pid)
+        return worker
+
+    def _discard(self, worker):
+        worker.close()
+        with self._lock:
+            self._spawned -= 1
+
+    def _checkout(self):
+        """Return a healthy worker, spawning one if the pool is not yet full."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = None
+                with self._lock:
+                    can_spawn = self._spawned < self.size
+                    if can_spawn:
+                        self._spawned += 1
+                if can_spawn:
+                    try:
+                        return self._spawn()
+                    except Exception:
+                        with self._lock:
+                            self._spawned -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise WorkerError("no worker available")
+                try:
+                    worker = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise WorkerError("no worker available")
+
+            if not worker.alive():
+                logger.warning("[KATEX_POOL] worker pid=%s died; restarting", worker.proc.pid)
+                self._discard(worker)
+                continue
+            if time.monotonic() - worker.last_used > _HEALTH_CHECK_AFTER and not worker.ping():
+                logger.warning("[KATEX_POOL] worker pid=%s failed health check; restarting", worker.proc.pid)
+                self._discard(worker)
+                continue
+            return worker
+
+    def _checkin(self, worker):
+        if self._closed:
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+
+    def _call(self, payload, timeout=None):
+        """Run one request on a pooled worker, retrying once on a fresh worker if it crashed."""
+        for attempt in range(2):
+            worker = self._checkout()
+            try:
+                response = worker.request(payload, timeout or self.timeout)
+            except WorkerError as e:
+                logger.warning("[KATEX_POOL] worker pid=%s failed (%s); restarting", worker.proc.pid, e)
+                self._discard(worker)
+                if isinstance(e, WorkerTimeout):
+                    raise
+                continue
+            self._checkin(worker)
+            return response
+        raise WorkerError("worker crashed twice")
+
+    # ── Public API ──────────────────────────────────────────────────────────
+
+    def render(self, latex, display_mode=False):
+        """Render one math span to HTML, or return None so the caller can fall back."""
+        if not self.available:
+            return None
+        try:
+            response = self._call({'latex': latex, 'displayMode': bool(display_mode)})
+        except Exception as e:
+            logger.warning("[KATEX_POOL] render failed for %r: %s", latex[:80], e)
+            return None
+        if response.get('ok') and response.get('html'):
+            return response['html']
+        return None
+
+    def render_many(self, spans):
+        """Render a list of (latex, display_mode) spans in one worker round trip.
+
+        Returns a list aligned with ``spans``; entries that failed (or the whole
+        batch, if the worker is unavailable) are None so the caller can fall back.
+        """
+        spans = list(spans)
+        if not spans:
+            return []
+        if not self.available:
+            return [None] * len(spans)
+        batch = [{'latex': latex, 'displayMode': bool(display_mode)} for latex, display_mode in spans]
+        # Budget grows with the batch; one span normally takes well under 10 ms
+        timeout = self.timeout + len(spans) * _BATCH_SPAN_BUDGET
+        try:
+            response = self._call({'batch': batch}, timeout=timeout)
+        except Exception as e:
+            logger.warning("[KATEX_POOL] batch render of %d spans failed: %s", len(spans), e)
+            return [None] * len(spans)
+        results = response.get('results') if response.get('ok') else None
+        if not isinstance(results, list) or len(results) != len(spans):
+            return [None] * len(spans)
+        return [r.get('html') if isinstance(r, dict) and r.get('ok') and r.get('html') else None
+                for r in results]
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# ── Per-process singleton ──────────────────────────────────────────────────────
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_katex_pool(size=2, timeout=10):
+    """Return this process's KaTeX pool, creating it on first use.
+
+    The pid check makes the pool fork-safe: a gunicorn worker forked from a
+    master that already touched the pool gets its own fresh set of node processes.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = KatexPool(size=size, timeout=timeout)
+                _pool_pid = pid
+    return _pool
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
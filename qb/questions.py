@@ -3,14 +3,16 @@
 import copy
 import logging
 
-from flask import render_template, request, jsonify, send_file, redirect, url_for
+from flask import Response, render_template, request, jsonify, send_file, redirect, url_for, stream_with_context
 from flask_login import login_required
 
 from db import db
-from models import QBank, Quiz, AUnit
+from models import QBank, Quiz, QuizQuestion, AUnit
 from qb.routes import question_bp, qb_bp, get_handler
-from qb.handlers.common import latex_to_html
-from qb.db_utils import create_question_safely
+from qb.handlers.common import latex_to_html, prerender_math, stored_question_html
+from qb.images import embed_image, image_path, stream_image
+from qb.db_utils import (create_question_safely, set_quiz_question_ids, quizzes_containing, used_question_ids_subquery,
+                         load_questions, DISPLAY_COLUMNS)
 
 logger = logging.getLogger(__name__)
 
@@ -18,15 +20,8 @@ logger = logging.getLogger(__name__)
 # ==================== SHARED HELPERS ====================
 
 def _quizzes_using_question(question_id: int) -> list:
-    """Return Quiz objects whose question_ids string contains question_id."""
-    candidates = Quiz.query.filter(
-        Quiz.question_ids.like(f'%{question_id}%')
-    ).all()
-    # Narrow out false positives from the LIKE (e.g. id=1 matching ids '10,11')
-    return [
-        qz for qz in candidates
-        if str(question_id) in [i.strip() for i in (qz.question_ids or '').split(',')]
-    ]
+    """Return Quiz objects that contain question_id (via the quiz_question index)."""
+    return quizzes_containing(question_id).all()
 
 
 # ==================== BUILDER ==================== #
@@ -109,7 +104,7 @@ def get_display_question(question_id):
     handler = get_handler(q.type.lower() if q.type else 'mcq')
     if not handler:
         return jsonify({"ok": False, "errors": [f"Unknown question type: {q.type}"]}), 400
-    question = handler.prepare_html(q.json)
+    question = stored_question_html(handler, q)
     ordered_question = handler.order_json(question)
     return jsonify({
         "ok": True,
@@ -127,7 +122,6 @@ def get_display_question(question_id):
 def delete_question(question_id):
     """Delete a question and its associated image file from disk."""
     import os
-    from config import QIMAGE_PATH
 
     q = QBank.query.get(question_id)
     if not q:
@@ -145,12 +139,7 @@ def delete_question(question_id):
 
     image_src = (q.json or {}).get("image", {}).get("src") if isinstance(q.json, dict) else None
     if image_src:
-        if image_src.startswith("/qimage/"):
-            img_path = os.path.join(QIMAGE_PATH, image_src[len("/qimage/"):])
-        elif image_src.startswith("/static/qimage/"):
-            img_path = os.path.join(QIMAGE_PATH, image_src[len("/static/qimage/"):])
-        else:
-            img_path = None
+        img_path = image_path(image_src)
         if img_path and os.path.exists(img_path):
             try:
                 os.remove(img_path)
@@ -161,7 +150,7 @@ def delete_question(question_id):
     for qz in _quizzes_using_question(question_id):
         ids = [i.strip() for i in (qz.question_ids or '').split(',') if i.strip()]
         ids = [i for i in ids if i != str(question_id)]
-        qz.question_ids = ','.join(ids)
+        set_quiz_question_ids(qz, ids)
 
     db.session.delete(q)
     db.session.commit()
@@ -173,13 +162,7 @@ def delete_question(question_id):
 def get_next_question_id(question_id):
     """Get the next unused question ID (not in any quiz); wraps to first unused if at end."""
     try:
-        used_ids = set()
-        for qz in Quiz.query.filter(Quiz.question_ids.isnot(None)).all():
-            for i in qz.question_ids.split(','):
-                if i.strip().isdigit():
-                    used_ids.add(int(i.strip()))
-
-        base = QBank.query if not used_ids else QBank.query.filter(~QBank.id.in_(used_ids))
+        base = QBank.query.filter(~QBank.id.in_(used_question_ids_subquery()))
 
         next_q = base.filter(QBank.id > question_id).order_by(QBank.id).first()
         if next_q:
@@ -212,24 +195,7 @@ def generate_sheet():
     if not ids:
         return "No valid question IDs", 400
 
-    questions_data = []
-    for qid in ids:
-        q = QBank.query.get(qid)
-        if not q:
-            continue
-        handler = get_handler(q.type.lower() if q.type else 'mcq')
-        if not handler:
-            continue
-        question = handler.prepare_html(q.json)
-        questions_data.append({'id': qid, 'type': q.type.lower(), 'question': question})
-
-    html = _render_sheet(questions_data)
-    from flask import Response
-    return Response(
-        html,
-        mimetype='text/html',
-        headers={'Content-Disposition': 'attachment; filename=questions.html'}
-    )
+    return _sheet_response(_sheet_questions(ids), 'questions.html')
 
 
 @question_bp.route("/generate-sheet-by-unit", methods=["GET"])
@@ -280,33 +246,162 @@ def generate_sheet_by_unit():
         return "No questions found for this unit after applying exclusions", 400
 
     # Reuse the same per-question prepare logic as generate_sheet
-    questions_data = []
-    for qid in ordered_ids:
-        q = QBank.query.get(qid)
-        if not q:
-            continue
+    return _sheet_response(_sheet_questions(ordered_ids), f'unit_{unit_id}_sheet.html')
+
+
+def _sheet_questions(ids):
+    """Yield sheet items for ``ids`` (one bulk load), preparing each question only when it is reached."""
+    for q in load_questions(ids, DISPLAY_COLUMNS):
         handler = get_handler(q.type.lower() if q.type else 'mcq')
         if not handler:
             continue
-        question = handler.prepare_html(q.json)
-        questions_data.append({'id': qid, 'type': q.type.lower(), 'question': question})
+        question = stored_question_html(handler, q)
+        yield {'id': q.id, 'type': q.type.lower(), 'question': question}
+
+
+# Static parts of the printable sheet; _sheet_chunks streams the questions between them
+_SHEET_INSERT_HANDLE = """
+        <div class="insert-handle">
+            <div class="insert-line"></div>
+            <div class="insert-btns">
+                <button class="ins-btn" onclick="insertSpacer(this)">+ Space</button>
+                <button class="ins-btn ins-pb" onclick="insertPageBreak(this)">&#8676; Page Break</button>
+            </div>
+        </div>"""
+
+_SHEET_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>Question Sheet</title>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css">
+<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.js"></script>
+<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/contrib/auto-render.min.js"
+    onload="renderMathInElement(document.body, {delimiters:[{left:'$',right:'$',display:false},{left:'\\\\(',right:'\\\\)',display:false},{left:'\\\\[',right:'\\\\]',display:true}]})"></script>
+<style>
+  body { font-family: 'Georgia', serif; max-width: 820px; margin: 40px auto; padding: 0 24px; color: #111; line-height: 1.7; }
+  /* Toolbar */
+  #toolbar { position: fixed; top: 0; left: 0; right: 0; background: #1F6FAE; color: #fff; padding: 8px 24px; display: flex; align-items: center; gap: 14px; font-family: sans-serif; font-size: 0.9rem; z-index: 999; box-shadow: 0 2px 6px rgba(0,0,0,.3); }
+  #toolbar button { background: #fff; color: #1F6FAE; border: none; border-radius: 4px; padding: 6px 16px; font-weight: 700; cursor: pointer; font-size: 0.88rem; }
+  #toolbar button:hover { background: #dceeff; }
+  #toolbar span { opacity: .8; font-size: 0.82rem; }
+  body { padding-top: 56px; }
+  /* Editable regions */
+  [contenteditable] { outline: none; border-radius: 3px; }
+  [contenteditable]:hover { background: #f0f7ff; }
+  [contenteditable]:focus { background: #e8f2ff; box-shadow: inset 0 0 0 1px #1F6FAE; }
+  /* Insert handles */
+  .insert-handle { display: flex; align-items: center; gap: 10px; margin: 4px 0; opacity: 0; transition: opacity .15s; }
+  .insert-handle:hover { opacity: 1; }
+  .insert-line { flex: 1; border-top: 1px dashed #b0c8e0; }
+  .insert-btns { display: flex; gap: 6px; flex-shrink: 0; }
+  .ins-btn { font-size: 0.74rem; padding: 2px 10px; border: 1px solid #1F6FAE; border-radius: 3px; background: #fff; color: #1F6FAE; cursor: pointer; font-family: sans-serif; }
+  .ins-btn:hover { background: #dceeff; }
+  .ins-pb { border-color: #b44; color: #b44; }
+  .ins-pb:hover { background: #ffeaea; }
+  /* Spacer */
+  .sheet-spacer { position: relative; min-height: 60px; background: repeating-linear-gradient(0deg,transparent,transparent 23px,#eef4fb 23px,#eef4fb 24px); border-radius: 3px; margin: 2px 0; resize: vertical; overflow: hidden; }
+  .sheet-spacer .rm { position: absolute; top: 3px; right: 6px; background: none; border: none; color: #bbb; cursor: pointer; font-size: 0.78rem; font-family: sans-serif; }
+  .sheet-spacer .rm:hover { color: #c00; }
+  /* Page break */
+  .sheet-pb { border: 2px dashed #1F6FAE; border-radius: 3px; text-align: center; padding: 3px 0; margin: 4px 0; font-family: sans-serif; font-size: 0.76rem; color: #1F6FAE; position: relative; }
+  .sheet-pb .rm { position: absolute; right: 8px; top: 50%; transform: translateY(-50%); background: none; border: none; color: #1F6FAE; cursor: pointer; font-size: 0.88rem; }
+  .question-block { margin-bottom: 44px; }
+  .q-row { display: grid; grid-template-columns: 68px 1fr; gap: 0 4px; }
+  .q-label { padding-top: 2px; text-align: right; padding-right: 10px; }
+  .q-num { font-size: 1rem; font-weight: 700; display: block; }
+  .q-id { font-size: 0.68rem; color: #aaa; display: block; }
+  .q-stem { font-size: 1rem; margin-bottom: 8px; }
+  .q-image img { max-width: 50%; margin-bottom: 8px; }
+  .option { margin: 4px 0; }
+  .opt-label { font-weight: 600; min-width: 22px; display: inline-block; }
+  .fill-row { display: flex; align-items: baseline; gap: 6px; margin: 6px 0; }
+  .blank-box { display: inline-block; width: 110px; border-bottom: 1.5px solid #333; margin: 0 4px; }
+  hr.divider { border: none; border-top: 2px solid #ccc; margin: 40px 0; }
+  .answers-section h2 { font-size: 1rem; font-weight: 700; margin-bottom: 14px; }
+  .ans-row { margin: 6px 0; font-size: 0.92rem; }
+  .ans-num { font-weight: 700; margin-right: 10px; }
+  .ans-val { color: #1a5c1a; }
+  #sheet-footer { text-align: center; font-size: 0.72rem; color: #bbb; border-top: 1px solid #eee; padding: 12px 0 4px; margin-top: 32px; font-family: sans-serif; }
+  @media print {
+    #toolbar, .insert-handle, .rm { display: none !important; }
+    body { margin: 20px; padding-top: 0; }
+    [contenteditable]:hover, [contenteditable]:focus { background: none; box-shadow: none; }
+    .sheet-pb { break-before: page; border: none; color: transparent; padding: 0; margin: 0; height: 0; }
+    .sheet-spacer { background: none; }
+    #sheet-footer { position: fixed; bottom: 0; left: 0; right: 0; margin: 0; border-top: 1px solid #ddd; padding: 4px 0; }
+  }
+</style>
+</head>
+<body>
+<div id="toolbar">
+  <button onclick="window.print()">&#128438; Print / Save PDF</button>
+  <span>Hover between questions for insert options &nbsp;&bull;&nbsp; Click text to edit &nbsp;&bull;&nbsp; Print when ready</span>
+</div>
+<div id="sheet-footer">MX Learning Inc.</div>
+"""
 
-    html = _render_sheet(questions_data)
-    from flask import Response
+_SHEET_ANSWERS_HEAD = """
+        <div class="insert-handle">
+            <div class="insert-line"></div>
+            <div class="insert-btns">
+                <button class="ins-btn" onclick="insertSpacer(this)">+ Space</button>
+                <button class="ins-btn ins-pb" onclick="insertPageBreak(this)">&#8676; Page Break</button>
+            </div>
+        </div>
+<hr class="divider">
+<div class="answers-section">
+  <h2>Answers</h2>
+  """
+
+_SHEET_TAIL = """
+</div>
+<script>
+function insertSpacer(btn) {
+  var h = btn.closest('.insert-handle');
+  var el = document.createElement('div');
+  el.className = 'sheet-spacer';
+  var rm = document.createElement('button');
+  rm.className = 'rm';
+  rm.textContent = '\u2715 remove';
+  rm.onclick = function() { el.remove(); };
+  el.appendChild(rm);
+  h.insertAdjacentElement('afterend', el);
+}
+function insertPageBreak(btn) {
+  var h = btn.closest('.insert-handle');
+  var el = document.createElement('div');
+  el.className = 'sheet-pb';
+  el.appendChild(document.createTextNode('\u21b5 Page Break\u00a0'));
+  var rm = document.createElement('button');
+  rm.className = 'rm';
+  rm.textContent = '\u2715';
+  rm.onclick = function() { el.remove(); };
+  el.appendChild(rm);
+  h.insertAdjacentElement('afterend', el);
+}
+</script>
+</body>
+</html>"""
+
+
+def _sheet_response(questions_data, filename):
+    """Stream a sheet as a download: the first bytes go out before the last question is prepared."""
     return Response(
-        html,
+        stream_with_context(_sheet_chunks(questions_data)),
         mimetype='text/html',
-        headers={'Content-Disposition': f'attachment; filename=unit_{unit_id}_sheet.html'}
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 
-def _render_sheet(questions_data):
-    """Build a self-contained HTML sheet string."""
+def _sheet_chunks(questions_data):
+    """Yield a self-contained HTML sheet piece by piece (see _sheet_response).
+
+    ``questions_data`` may be a generator; each question is prepared, rendered
+    and its image embedded only when it is reached.
+    """
     import re
-    import base64
-    import os
     import random
-    from config import QIMAGE_PATH
 
     OPTION_LABELS = ['A', 'B', 'C', 'D', 'E', 'F']
 
@@ -317,23 +412,6 @@ def _render_sheet(questions_data):
         s = re.sub(r'(<br\s*/?>\s*)+$', '', s).strip()
         return s
 
-    def embed_image(src):
-        """Return base64 data URI so the image works in a downloaded file."""
-        try:
-            if src.startswith('/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/qimage/'):])
-            elif src.startswith('/static/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/static/qimage/'):])
-            else:
-                return src
-            if os.path.exists(path):
-                with open(path, 'rb') as f:
-                    data = base64.b64encode(f.read()).decode()
-                return f'data:image/png;base64,{data}'
-        except Exception:
-            pass
-        return src
-
     def get_stem(q):
         stem = q.get('stem', '')
         raw = (stem.get('html') or stem.get('latex', '')) if isinstance(stem, dict) else str(stem)
@@ -429,32 +507,18 @@ def _render_sheet(questions_data):
 
         return '\u2014'
 
-    # Build blocks
-    q_blocks = []
+    # Stream: header, one question block at a time, then the (small) answer key
+    yield _SHEET_HEAD
     ans_blocks = []
     for seq, item in enumerate(questions_data, start=1):
         qid = item['id']
         qtype = item['type']
         q = item['question']
 
-        img_html = ''
-        if q.get('image', {}).get('src'):
-            src = embed_image(q['image']['src'])
-            img_html = f'<div class="q-image"><img src="{src}" alt=""></div>'
-
-        HANDLE = """
-        <div class="insert-handle">
-            <div class="insert-line"></div>
-            <div class="insert-btns">
-                <button class="ins-btn" onclick="insertSpacer(this)">+ Space</button>
-                <button class="ins-btn ins-pb" onclick="insertPageBreak(this)">&#8676; Page Break</button>
-            </div>
-        </div>"""
-
         # Insert handle between questions (not before the first one)
-        prefix = '' if seq == 1 else HANDLE
+        prefix = '' if seq == 1 else _SHEET_INSERT_HANDLE
 
-        q_blocks.append(prefix + f"""
+        yield prefix + f"""
         <div class="question-block">
             <div class="q-row">
                 <div class="q-label">
@@ -463,11 +527,16 @@ def _render_sheet(questions_data):
                 </div>
                 <div class="q-content" contenteditable="true">
                     <div class="q-stem">{get_stem(q)}</div>
-                    {img_html}
+                    """
+        if q.get('image', {}).get('src'):
+            yield '<div class="q-image"><img src="'
+            yield from stream_image(q['image']['src'])
+            yield '" alt=""></div>'
+        yield f"""
                     <div class="q-options">{options_html(q, qtype)}</div>
                 </div>
             </div>
-        </div>""")
+        </div>"""
 
         ans_blocks.append(
             f'<div class="ans-row">'
@@ -475,116 +544,9 @@ def _render_sheet(questions_data):
             f'<span class="ans-val" contenteditable="true">{answer_html(q, qtype)}</span></div>'
         )
 
-    return f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>Question Sheet</title>
-<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css">
-<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.js"></script>
-<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/contrib/auto-render.min.js"
-    onload="renderMathInElement(document.body, {{delimiters:[{{left:'$',right:'$',display:false}},{{left:'\\\\(',right:'\\\\)',display:false}},{{left:'\\\\[',right:'\\\\]',display:true}}]}})"></script>
-<style>
-  body {{ font-family: 'Georgia', serif; max-width: 820px; margin: 40px auto; padding: 0 24px; color: #111; line-height: 1.7; }}
-  /* Toolbar */
-  #toolbar {{ position: fixed; top: 0; left: 0; right: 0; background: #1F6FAE; color: #fff; padding: 8px 24px; display: flex; align-items: center; gap: 14px; font-family: sans-serif; font-size: 0.9rem; z-index: 999; box-shadow: 0 2px 6px rgba(0,0,0,.3); }}
-  #toolbar button {{ background: #fff; color: #1F6FAE; border: none; border-radius: 4px; padding: 6px 16px; font-weight: 700; cursor: pointer; font-size: 0.88rem; }}
-  #toolbar button:hover {{ background: #dceeff; }}
-  #toolbar span {{ opacity: .8; font-size: 0.82rem; }}
-  body {{ padding-top: 56px; }}
-  /* Editable regions */
-  [contenteditable] {{ outline: none; border-radius: 3px; }}
-  [contenteditable]:hover {{ background: #f0f7ff; }}
-  [contenteditable]:focus {{ background: #e8f2ff; box-shadow: inset 0 0 0 1px #1F6FAE; }}
-  /* Insert handles */
-  .insert-handle {{ display: flex; align-items: center; gap: 10px; margin: 4px 0; opacity: 0; transition: opacity .15s; }}
-  .insert-handle:hover {{ opacity: 1; }}
-  .insert-line {{ flex: 1; border-top: 1px dashed #b0c8e0; }}
-  .insert-btns {{ display: flex; gap: 6px; flex-shrink: 0; }}
-  .ins-btn {{ font-size: 0.74rem; padding: 2px 10px; border: 1px solid #1F6FAE; border-radius: 3px; background: #fff; color: #1F6FAE; cursor: pointer; font-family: sans-serif; }}
-  .ins-btn:hover {{ background: #dceeff; }}
-  .ins-pb {{ border-color: #b44; color: #b44; }}
-  .ins-pb:hover {{ background: #ffeaea; }}
-  /* Spacer */
-  .sheet-spacer {{ position: relative; min-height: 60px; background: repeating-linear-gradient(0deg,transparent,transparent 23px,#eef4fb 23px,#eef4fb 24px); border-radius: 3px; margin: 2px 0; resize: vertical; overflow: hidden; }}
-  .sheet-spacer .rm {{ position: absolute; top: 3px; right: 6px; background: none; border: none; color: #bbb; cursor: pointer; font-size: 0.78rem; font-family: sans-serif; }}
-  .sheet-spacer .rm:hover {{ color: #c00; }}
-  /* Page break */
-  .sheet-pb {{ border: 2px dashed #1F6FAE; border-radius: 3px; text-align: center; padding: 3px 0; margin: 4px 0; font-family: sans-serif; font-size: 0.76rem; color: #1F6FAE; position: relative; }}
-  .sheet-pb .rm {{ position: absolute; right: 8px; top: 50%; transform: translateY(-50%); background: none; border: none; color: #1F6FAE; cursor: pointer; font-size: 0.88rem; }}
-  .question-block {{ margin-bottom: 44px; }}
-  .q-row {{ display: grid; grid-template-columns: 68px 1fr; gap: 0 4px; }}
-  .q-label {{ padding-top: 2px; text-align: right; padding-right: 10px; }}
-  .q-num {{ font-size: 1rem; font-weight: 700; display: block; }}
-  .q-id {{ font-size: 0.68rem; color: #aaa; display: block; }}
-  .q-stem {{ font-size: 1rem; margin-bottom: 8px; }}
-  .q-image img {{ max-width: 50%; margin-bottom: 8px; }}
-  .option {{ margin: 4px 0; }}
-  .opt-label {{ font-weight: 600; min-width: 22px; display: inline-block; }}
-  .fill-row {{ display: flex; align-items: baseline; gap: 6px; margin: 6px 0; }}
-  .blank-box {{ display: inline-block; width: 110px; border-bottom: 1.5px solid #333; margin: 0 4px; }}
-  hr.divider {{ border: none; border-top: 2px solid #ccc; margin: 40px 0; }}
-  .answers-section h2 {{ font-size: 1rem; font-weight: 700; margin-bottom: 14px; }}
-  .ans-row {{ margin: 6px 0; font-size: 0.92rem; }}
-  .ans-num {{ font-weight: 700; margin-right: 10px; }}
-  .ans-val {{ color: #1a5c1a; }}
-  #sheet-footer {{ text-align: center; font-size: 0.72rem; color: #bbb; border-top: 1px solid #eee; padding: 12px 0 4px; margin-top: 32px; font-family: sans-serif; }}
-  @media print {{
-    #toolbar, .insert-handle, .rm {{ display: none !important; }}
-    body {{ margin: 20px; padding-top: 0; }}
-    [contenteditable]:hover, [contenteditable]:focus {{ background: none; box-shadow: none; }}
-    .sheet-pb {{ break-before: page; border: none; color: transparent; padding: 0; margin: 0; height: 0; }}
-    .sheet-spacer {{ background: none; }}
-    #sheet-footer {{ position: fixed; bottom: 0; left: 0; right: 0; margin: 0; border-top: 1px solid #ddd; padding: 4px 0; }}
-  }}
-</style>
-</head>
-<body>
-<div id="toolbar">
-  <button onclick="window.print()">&#128438; Print / Save PDF</button>
-  <span>Hover between questions for insert options &nbsp;&bull;&nbsp; Click text to edit &nbsp;&bull;&nbsp; Print when ready</span>
-</div>
-<div id="sheet-footer">MX Learning Inc.</div>
-{''.join(q_blocks)}
-        <div class="insert-handle">
-            <div class="insert-line"></div>
-            <div class="insert-btns">
-                <button class="ins-btn" onclick="insertSpacer(this)">+ Space</button>
-                <button class="ins-btn ins-pb" onclick="insertPageBreak(this)">&#8676; Page Break</button>
-            </div>
-        </div>
-<hr class="divider">
-<div class="answers-section">
-  <h2>Answers</h2>
-  {''.join(ans_blocks)}
-</div>
-<script>
-function insertSpacer(btn) {{
-  var h = btn.closest('.insert-handle');
-  var el = document.createElement('div');
-  el.className = 'sheet-spacer';
-  var rm = document.createElement('button');
-  rm.className = 'rm';
-  rm.textContent = '\u2715 remove';
-  rm.onclick = function() {{ el.remove(); }};
-  el.appendChild(rm);
-  h.insertAdjacentElement('afterend', el);
-}}
-function insertPageBreak(btn) {{
-  var h = btn.closest('.insert-handle');
-  var el = document.createElement('div');
-  el.className = 'sheet-pb';
-  el.appendChild(document.createTextNode('\u21b5 Page Break\u00a0'));
-  var rm = document.createElement('button');
-  rm.className = 'rm';
-  rm.textContent = '\u2715';
-  rm.onclick = function() {{ el.remove(); }};
-  el.appendChild(rm);
-  h.insertAdjacentElement('afterend', el);
-}}
-</script>
-</body>
-</html>"""
+    yield _SHEET_ANSWERS_HEAD
+    yield ''.join(ans_blocks)
+    yield _SHEET_TAIL
 
 
 # ==================== EXPORT ==================== #
@@ -644,9 +606,6 @@ def generate_review_html(*, student_name, quiz_title, score, completed_at, total
                    sequence, question (JSON), qtype, correct_answer, user_answer
     """
     import re
-    import base64
-    import os
-    from config import QIMAGE_PATH
 
     OPTION_LABELS = ['A', 'B', 'C', 'D', 'E', 'F']
 
@@ -656,22 +615,6 @@ def generate_review_html(*, student_name, quiz_title, score, completed_at, total
         s = re.sub(r'(<br\s*/?>\s*)+$', '', s).strip()
         return s
 
-    def embed_image(src):
-        try:
-            if src.startswith('/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/qimage/'):])
-            elif src.startswith('/static/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/static/qimage/'):])
-            else:
-                return src
-            if os.path.exists(path):
-                with open(path, 'rb') as f:
-                    data = base64.b64encode(f.read()).decode()
-                return f'data:image/png;base64,{data}'
-        except Exception:
-            pass
-        return src
-
     def get_stem(q):
         stem = q.get('stem', '')
         raw = (stem.get('html') or stem.get('latex', '')) if isinstance(stem, dict) else str(stem)
@@ -822,7 +765,7 @@ def print_question(question_id):
     handler = get_handler(q.type.lower() if q.type else 'mcq')
     if not handler:
         return jsonify({"ok": False, "errors": [f"Unknown question type: {q.type}"]}), 400
-    question = handler.prepare_html(q.json)
+    question = stored_question_html(handler, q)
     question_data = {
         "question": question, "question_id": q.id,
         "type": q.type, "topic": q.topic, "subtopic": q.subtopic, "level": q.level
@@ -893,15 +836,7 @@ def get_questions_paginated():
         elif topic:
             query = query.filter_by(topic=topic)
         if unused and not ids_param:
-            used_ids = set()
-            for row in Quiz.query.with_entities(Quiz.question_ids).all():
-                if row.question_ids:
-                    for qid in row.question_ids.split(','):
-                        qid = qid.strip()
-                        if qid.isdigit():
-                            used_ids.add(int(qid))
-            if used_ids:
-                query = query.filter(~QBank.id.in_(used_ids))
+            query = query.filter(~QBank.id.in_(used_question_ids_subquery()))
         if id_from is not None:
             query = query.order_by(QBank.id.asc())
         else:
@@ -989,13 +924,18 @@ def delete_questions():
         if existing_count != len(question_ids):
             return jsonify({"ok": False, "error": "One or more questions do not exist"}), 400
 
-        # Block if any selected question is used in a quiz
-        blocked = []
-        for qid in question_ids:
-            quizzes = _quizzes_using_question(qid)
-            if quizzes:
-                names = ', '.join(f"{qz.quiz_code} ({qz.title})" for qz in quizzes)
-                blocked.append(f"Q#{qid} → {names}")
+        # Block if any selected question is used in a quiz (one indexed join for all IDs)
+        usage = (db.session.query(QuizQuestion.question_id, Quiz.quiz_code, Quiz.title)
+                 .join(Quiz, Quiz.id == QuizQuestion.quiz_id)
+                 .filter(QuizQuestion.question_id.in_([int(q) for q in question_ids]))
+                 .distinct()
+                 .order_by(QuizQuestion.question_id, Quiz.quiz_code)
+                 .all())
+        by_question = {}
+        for qid, code, title in usage:
+            by_question.setdefault(qid, []).append(f"{code} ({title})")
+        blocked = [f"Q#{qid} → {', '.join(names)}"
+                   for qid in question_ids if (names := by_question.get(int(qid)))]
         if blocked:
             return jsonify({"ok": False,
                             "error": "Cannot delete — remove from quizzes first:\n" + "\n".join(blocked)}), 400
@@ -1383,6 +1323,13 @@ def upload_mixed():
     if not blocks:
         return jsonify({'ok': False, 'error': 'No question= blocks found in file'}), 400
 
+    # Render all math in the upload in one KaTeX round trip; each save below then hits the cache
+    prerender_math(
+        [b.get('question', '') for b in blocks]
+        + [o.get('latex', '') for b in blocks for o in b.get('options', [])]
+        + [bl.get('label', '') for b in blocks for bl in b.get('blanks', [])]
+    )
+
     results = []
     for n, block in enumerate(blocks, 1):
         q_type   = block.get('type')
@@ -1527,9 +1474,6 @@ def generate_review_set_html(*, student_name, quizzes, n, n_fetched=None):
     n_fetched    : int  — actual number of quizzes scanned (may be < n if student has fewer)
     """
     import re
-    import base64
-    import os
-    from config import QIMAGE_PATH
 
     OPTION_LABELS = ['A', 'B', 'C', 'D', 'E', 'F']
 
@@ -1539,22 +1483,6 @@ def generate_review_set_html(*, student_name, quizzes, n, n_fetched=None):
         s = re.sub(r'(<br\s*/?>\s*)+$', '', s).strip()
         return s
 
-    def embed_image(src):
-        try:
-            if src.startswith('/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/qimage/'):])
-            elif src.startswith('/static/qimage/'):
-                path = os.path.join(QIMAGE_PATH, src[len('/static/qimage/'):])
-            else:
-                return src
-            if os.path.exists(path):
-                with open(path, 'rb') as f:
-                    data = base64.b64encode(f.read()).decode()
-                return f'data:image/png;base64,{data}'
-        except Exception:
-            pass
-        return src
-
     def get_stem(q):
         stem = q.get('stem', '')
         raw = (stem.get('html') or stem.get('latex', '')) if isinstance(stem, dict) else str(stem)
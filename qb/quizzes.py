@@ -3,12 +3,17 @@
 import logging
 
 from flask import render_template, request, jsonify, redirect, url_for
-from flask_login import login_required
+from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, tuple_
 
 from db import db
 from models import AUnit, QBank, Quiz, FormatHelper, MyWorkList
-from qb.db_utils import quiz_code
+from lms.dashboard import invalidate_dashboards
+from qb.db_utils import (quiz_code, set_quiz_question_ids, quizzes_containing, backfill_quiz_questions,
+                         load_questions, DISPLAY_COLUMNS)
+from qb.handlers.common import app_render_cache, prerender_math, question_latex_strings, stored_question_html
 from qb.routes import qb_bp, get_handler
+from qb.jobs import start_job, get_job
 
 logger = logging.getLogger(__name__)
 
@@ -21,41 +26,111 @@ def build_questions_json(question_ids: list) -> list:
     Returns the prepared list suitable for storing in quiz.questions_json
     and passing directly to the execution template.
     """
-    if not question_ids:
-        return []
-    int_ids = [int(i) for i in question_ids]
-    rows = QBank.query.filter(QBank.id.in_(int_ids)).all()
-    by_id = {q.id: q for q in rows}
+    rows = load_questions(question_ids, DISPLAY_COLUMNS)
 
-    result = []
-    for qid in int_ids:
-        q = by_id.get(qid)
-        if not q:
-            continue
-        handler = get_handler(q.type)
-        prepared = handler.prepare_html(q.json) if handler else dict(q.json)
-        prepared['id'] = q.id
-        result.append(prepared)
-    return result
+    # Render every math span of the quiz in one KaTeX round trip before preparing
+    prerender_math(text for q in rows for text in question_latex_strings(q.json))
 
+    return [_prepare_question(q) for q in rows]
 
-def rebuild_quizzes_for_question(question_id: int) -> None:
-    """After a question is edited, rebuild questions_json for every quiz that contains it.
 
-    Uses a simple LIKE scan — acceptable because quiz count is small and
-    this is an admin-only operation.
+def _prepare_question(q) -> dict:
+    handler = get_handler(q.type)
+    prepared = stored_question_html(handler, q) if handler else dict(q.json)
+    prepared['id'] = q.id
+    return prepared
+
+
+def patch_questions_json(quiz, prepared_by_id: dict) -> bool:
+    """Swap the entries for re-prepared questions inside quiz.questions_json.
+
+    Returns False (and leaves the quiz untouched) when the stored snapshot does
+    not line up with question_ids — the caller then does a full rebuild.
     """
-    affected = Quiz.query.filter(
-        Quiz.question_ids.like(f'%{question_id}%'),
-        ~Quiz.title.like('ZZ%')
-    ).all()
-    for quiz in affected:
-        ids = [i.strip() for i in (quiz.question_ids or '').split(',') if i.strip()]
-        # Confirm this quiz actually contains the question (avoid false LIKE matches)
-        if str(question_id) not in ids:
-            continue
-        quiz.questions_json = build_questions_json(ids)
-        logger.info("[QUIZ_REBUILD] quiz=%s after edit of question=%s", quiz.id, question_id)
+    ids = [int(i) for i in (quiz.question_ids or '').split(',') if i.strip().isdigit()]
+    current = quiz.questions_json
+    if not isinstance(current, list) or [e.get('id') if isinstance(e, dict) else None for e in current] != ids:
+        return False
+    # New list object so SQLAlchemy sees the JSON column change
+    quiz.questions_json = [prepared_by_id.get(e['id'], e) for e in current]
+    return True
+
+
+def resync_dirty_questions(job=None) -> dict:
+    """Bring every quiz snapshot up to date with questions flagged sync_required.
+
+    The dirty set is collapsed into the unique set of affected quizzes (one
+    indexed lookup); each dirty question is prepared once, then patched into
+    every quiz that holds it. Quizzes whose snapshot has drifted from
+    question_ids get a full rebuild instead. Each quiz commits on its own, so
+    a failure is logged and skipped. Flags are cleared only for questions
+    whose quizzes all succeeded and that were not edited again meanwhile.
+    """
+    dirty = QBank.query.filter(QBank.sync_required == True).all()
+    if not dirty:
+        return {"message": "Nothing to sync.", "synced": 0, "failed": []}
+    # (id, updated_at) snapshot — a question re-edited during the run keeps its flag
+    snapshot = [(q.id, q.updated_at) for q in dirty]
+    dirty_ids = [q.id for q in dirty]
+
+    prerender_math(text for q in dirty for text in question_latex_strings(q.json))
+    prepared_by_id = {}
+    failed_ids = set()
+    for q in dirty:
+        try:
+            prepared_by_id[q.id] = _prepare_question(q)
+        except Exception as e:
+            failed_ids.add(q.id)
+            logger.error("[RESYNC] prepare failed for question=%s: %s", q.id, e)
+
+    quiz_ids = [qz_id for (qz_id,) in quizzes_containing(dirty_ids)
+                .filter(~Quiz.title.like('ZZ%'))
+                .with_entities(Quiz.id).order_by(Quiz.id).all()]
+    db.session.commit()  # release the read transaction before the long loop
+    if job:
+        job.progress(0, len(quiz_ids), f"{len(dirty_ids)} question(s) in {len(quiz_ids)} quiz(zes)")
+
+    patched = rebuilt = 0
+    for n, qz_id in enumerate(quiz_ids, 1):
+        quiz = Quiz.query.get(qz_id)
+        contained = set()
+        try:
+            if quiz is None:
+                continue
+            ids = [i.strip() for i in (quiz.question_ids or '').split(',') if i.strip()]
+            contained = {int(i) for i in ids if i.isdigit()} & set(dirty_ids)
+            if contained & failed_ids or not patch_questions_json(quiz, prepared_by_id):
+                quiz.questions_json = build_questions_json(ids)
+                rebuilt += 1
+            else:
+                patched += 1
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            failed_ids |= contained
+            logger.error("[RESYNC] failed for quiz=%s: %s", qz_id, e)
+        if job:
+            job.progress(n)
+
+    synced_ids = [qid for qid in dirty_ids if qid not in failed_ids]
+    if synced_ids:
+        done = [(qid, ts) for qid, ts in snapshot if qid not in failed_ids]
+        unchanged = or_(
+            tuple_(QBank.id, QBank.updated_at).in_([d for d in done if d[1] is not None]),
+            and_(QBank.id.in_([qid for qid, ts in done if ts is None]), QBank.updated_at.is_(None)),
+        )
+        (QBank.query
+         .filter(unchanged)
+         .update({QBank.sync_required: False}, synchronize_session=False))
+        db.session.commit()
+    logger.info("[RESYNC] questions=%s quizzes=%s patched=%s rebuilt=%s failed=%s",
+                len(synced_ids), len(quiz_ids), patched, rebuilt, sorted(failed_ids))
+
+    message = f"Synced {len(synced_ids)} question(s) across {len(quiz_ids)} quiz(zes)."
+    if failed_ids:
+        message += f" Failed for question IDs: {sorted(failed_ids)}."
+    return {"message": message, "synced": len(synced_ids), "failed": sorted(failed_ids),
+            "quizzes": len(quiz_ids), "patched": patched, "rebuilt": rebuilt}
 
 
 # ==================== RESYNC ==================== #
@@ -72,37 +147,55 @@ def resync_pending_count():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@qb_bp.route("/api/render-cache/stats", methods=["GET"])
+@login_required
+def render_cache_stats():
+    """Hit/miss counters for this worker's LaTeX render cache (admin only)."""
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    return jsonify({'ok': True, 'stats': app_render_cache().stats()})
+
+
 @qb_bp.route("/api/resync-quizzes", methods=["POST"])
 @login_required
 def resync_quizzes():
-    """Rebuild questions_json for all quizzes affected by dirty questions.
+    """Start (or join) the background resync job; poll /quiz/api/jobs/<job_id> for progress (admin only)."""
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    job = start_job('resync-quizzes', resync_dirty_questions)
+    return jsonify({"ok": True, **job.to_dict()}), 202
 
-    Processes one dirty question at a time: rebuild all its quizzes, clear its
-    flag, commit, then move to the next. A failure on one question is logged
-    and skipped so the rest of the batch still completes.
-    """
-    dirty = QBank.query.filter(QBank.sync_required == True).all()
-    if not dirty:
-        return jsonify({"ok": True, "message": "Nothing to sync.", "synced": 0})
 
-    synced = 0
-    errors = []
-    for q in dirty:
-        try:
-            rebuild_quizzes_for_question(q.id)
-            q.sync_required = False
-            db.session.commit()
-            synced += 1
-            logger.info("[RESYNC] question=%s synced successfully", q.id)
-        except Exception as e:
-            db.session.rollback()
-            errors.append(q.id)
-            logger.error("[RESYNC] failed for question=%s: %s", q.id, e)
+@qb_bp.route("/api/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """Progress and result of a background job started on any worker (admin only)."""
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"ok": False, "error": "Unknown or expired job"}), 404
+    return jsonify({"ok": True, **job.to_dict()})
+
+
+@qb_bp.route("/api/admin/backfill-quiz-questions", methods=["POST"])
+@login_required
+def backfill_quiz_question_index():
+    """Rebuild the quiz_question index from every quiz's question_ids.
 
-    message = f"Synced {synced} question(s)."
-    if errors:
-        message += f" Failed for question IDs: {errors}."
-    return jsonify({"ok": not errors, "message": message, "synced": synced, "failed": errors})
+    Needed once after creating the table (see quiz_question.sql); safe to re-run.
+    """
+    if current_user.user_role not in ('admin', 'admin_new'):
+        return jsonify({'ok': False, 'error': 'Forbidden'}), 403
+    try:
+        rows = backfill_quiz_questions()
+        db.session.commit()
+        logger.info('Backfill quiz_question: rows=%s by admin=%s', rows, current_user.username)
+        return jsonify({'ok': True, 'rows': rows})
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(e)
+        return jsonify({'ok': False, 'error': str(e)}), 500
 
 
 # ==================== QUESTION PREVIEW LOOKUP ==================== #
@@ -189,10 +282,10 @@ def create_quiz():
     quiz = Quiz(
         title=data.get('title', ''), description=data.get('description', ''),
         topic=data.get('topic', ''), subtopic=data.get('subtopic', ''),
-        question_ids=','.join(question_ids),
         questions_json=build_questions_json(question_ids)
     )
     db.session.add(quiz)
+    set_quiz_question_ids(quiz, question_ids)
     db.session.commit()
     quiz.quiz_code = quiz_code(quiz.id)
     db.session.commit()
@@ -219,19 +312,17 @@ def create_quiz_api():
             title=data['title'], description=data.get('description', ''),
             topic=data.get('topic', ''), subtopic=data.get('subtopic', ''),
             level=data.get('level', ''),
-            question_ids=','.join(str_ids),
             questions_json=build_questions_json(str_ids)
         )
         db.session.add(quiz)
+        set_quiz_question_ids(quiz, str_ids)
         db.session.commit()
         quiz.quiz_code = quiz_code(quiz.id)
         if propagate and str_ids:
-            for q_id in [int(i) for i in str_ids]:
-                q = QBank.query.get(q_id)
-                if q:
-                    if quiz.topic:    q.topic    = quiz.topic
-                    if quiz.subtopic: q.subtopic = quiz.subtopic
-                    if quiz.level:    q.level    = quiz.level
+            for q in load_questions(str_ids, ('topic', 'subtopic', 'level')):
+                if quiz.topic:    q.topic    = quiz.topic
+                if quiz.subtopic: q.subtopic = quiz.subtopic
+                if quiz.level:    q.level    = quiz.level
         db.session.commit()
         logger.info(f"Quiz created: ID={quiz.id}, quiz_code={quiz.quiz_code}, title={quiz.title}")
         return jsonify({"ok": True, "quiz_id": quiz.id,
@@ -329,12 +420,10 @@ def update_quizzes():
             if subtopic is not None: quiz.subtopic = subtopic
             if quiz.question_ids:
                 ids = [i.strip() for i in quiz.question_ids.split(',') if i.strip()]
-                for q_id in [int(i) for i in ids]:
-                    q = QBank.query.get(q_id)
-                    if q:
-                        if topic is not None:    q.topic = topic
-                        if subtopic is not None: q.subtopic = subtopic
-                        if level:                q.level = level
+                for q in load_questions(ids, ('topic', 'subtopic', 'level')):
+                    if topic is not None:    q.topic = topic
+                    if subtopic is not None: q.subtopic = subtopic
+                    if level:                q.level = level
                 # Rebuild cached HTML since question metadata may have changed
                 quiz.questions_json = build_questions_json(ids)
             updated_count += 1
@@ -411,6 +500,7 @@ def edit_quiz(quiz_id):
             if not title:
                 return jsonify({'ok': False, 'error': 'Title cannot be empty'}), 400
             quiz.title = title
+            invalidate_dashboards(item_codes=[quiz.quiz_code])
 
         if data.get('description') is not None: quiz.description = data['description']
         if data.get('topic')       is not None: quiz.topic       = data['topic']
@@ -423,16 +513,14 @@ def edit_quiz(quiz_id):
         # Handle question reordering / deletion
         if 'question_ids' in data:
             new_ids = [str(i) for i in data['question_ids'] if str(i).strip()]
-            quiz.question_ids = ','.join(new_ids)
+            set_quiz_question_ids(quiz, new_ids)
 
         if propagate and quiz.question_ids:
             ids = [i.strip() for i in quiz.question_ids.split(',') if i.strip()]
-            for q_id in [int(i) for i in ids]:
-                q = QBank.query.get(q_id)
-                if q:
-                    if quiz.topic    is not None: q.topic    = quiz.topic
-                    if quiz.subtopic is not None: q.subtopic = quiz.subtopic
-                    if quiz.level    is not None: q.level    = quiz.level
+            for q in load_questions(ids, ('topic', 'subtopic', 'level')):
+                if quiz.topic    is not None: q.topic    = quiz.topic
+                if quiz.subtopic is not None: q.subtopic = quiz.subtopic
+                if quiz.level    is not None: q.level    = quiz.level
             quiz.questions_json = build_questions_json(ids)
         elif 'question_ids' in data:
             ids = [i.strip() for i in quiz.question_ids.split(',') if i.strip()]
@@ -494,6 +582,7 @@ def delete_quizzes():
             )
             db.session.delete(q)
             deleted_count += 1
+        invalidate_dashboards(item_codes=[q.quiz_code for q in quizzes])
 
         db.session.commit()
         return jsonify({'ok': True, 'deleted_count': deleted_count,
@@ -532,10 +621,10 @@ def merge_quizzes():
             description='',
             topic=ordered[0].topic or '',
             subtopic=ordered[0].subtopic or '',
-            question_ids=','.join(merged_ids),
             questions_json=build_questions_json(merged_ids)
         )
         db.session.add(new_quiz)
+        set_quiz_question_ids(new_quiz, merged_ids)
         db.session.commit()
         new_quiz.quiz_code = quiz_code(new_quiz.id)
         db.session.commit()
@@ -572,13 +661,11 @@ def preview_quiz(quiz_id):
         return "Quiz not found", 404
     question_ids = [int(qid.strip()) for qid in quiz.question_ids.split(',') if qid.strip()] if quiz.question_ids else []
     questions = []
-    for qid in question_ids:
-        q = QBank.query.get(qid)
-        if q:
-            handler = get_handler(q.type.lower() if q.type else 'mcq')
-            prepared = handler.prepare_html(q.json) if handler else q.json
-            prepared['id'] = q.id
-            questions.append(prepared)
+    for q in load_questions(question_ids, DISPLAY_COLUMNS):
+        handler = get_handler(q.type.lower() if q.type else 'mcq')
+        prepared = stored_question_html(handler, q) if handler else q.json
+        prepared['id'] = q.id
+        questions.append(prepared)
     return render_template("quiz_preview.html", quiz=quiz, questions=questions)
 
 
@@ -589,7 +676,7 @@ def get_quiz_questions(quiz_id):
     if not quiz:
         return jsonify({'ok': False, 'error': 'Quiz not found'}), 404
     question_ids = [int(qid.strip()) for qid in quiz.question_ids.split(',') if qid.strip()] if quiz.question_ids else []
-    questions = [{'id': q.id, 'json': q.json} for qid in question_ids if (q := QBank.query.get(qid))]
+    questions = [{'id': q.id, 'json': q.json} for q in load_questions(question_ids, ('json',))]
     return jsonify({
         'ok': True,
         'quiz': {'id': quiz.id, 'title': quiz.title, 'description': quiz.description,
@@ -625,7 +712,7 @@ def append_question_to_quiz(quiz_id):
         return jsonify({'ok': False, 'error': 'Quiz not found'}), 404
     existing_ids = [qid.strip() for qid in quiz.question_ids.split(',') if qid.strip()] if quiz.question_ids else []
     existing_ids.append(str(question_obj.id))
-    quiz.question_ids = ','.join(existing_ids)
+    set_quiz_question_ids(quiz, existing_ids)
     quiz.updated_at = db.func.now()
     db.session.commit()
     return jsonify({'ok': True, 'question_id': question_obj.id, 'quiz_id': quiz_id,
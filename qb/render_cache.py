@@ -0,0 +1,197 @@
+"""Content-addressed cache for rendered math spans (LaTeX → HTML).
+
+Two tiers:
+  1. In-process LRU (bounded by RENDER_CACHE_SIZE entries) — no locking across workers.
+  2. SQLite file at RENDER_CACHE_PATH (WAL mode) — shared by every gunicorn
+     worker on the box and survives restarts/deploys.
+
+Keys are sha256 over (latex, displayMode, renderer, renderer version), so a
+KaTeX upgrade or a switch to the mathml renderer never serves stale markup.
+Every cache failure degrades to a plain miss — rendering must never break
+because the cache file is locked, missing or corrupt.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from qb.cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(__file__))
+
+
+def _katex_version():
+    """Installed KaTeX version from node_modules, or 'unknown'."""
+    try:
+        with open(os.path.join(_ROOT, 'node_modules', 'katex', 'package.json'), encoding='utf-8') as f:
+            return json.load(f).get('version', 'unknown')
+    except Exception:
+        return 'unknown'
+
+
+def _mathml_version():
+    try:
+        from importlib.metadata import version
+        return version('latex2mathml')
+    except Exception:
+        return 'unknown'
+
+
+RENDERER_VERSIONS = {
+    'katex': _katex_version(),
+    'mathml': _mathml_version(),
+}
+
+
+def render_key(latex, display_mode, renderer):
+    """Content address for one rendered span."""
+    raw = '\x00'.join([
+        renderer,
+        RENDERER_VERSIONS.get(renderer, 'unknown'),
+        '1' if display_mode else '0',
+        latex,
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """LRU in front of a shared SQLite store, with hit/miss counters."""
+
+    def __init__(self, path=None, maxsize=4096):
+        self.path = path
+        self.memory = LRUCache(maxsize=maxsize)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._disk_ok = bool(path)
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+        self.stores = 0
+
+    # ── SQLite tier ─────────────────────────────────────────────────────────
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS render_cache ("
+                " key TEXT PRIMARY KEY,"
+                " html TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _disk_failed(self, e):
+        with self._lock:
+            self.disk_errors += 1
+        logger.warning("[RENDER_CACHE] sqlite error on %s: %s", self.path, e)
+        self._local.conn = None
+
+    def _disk_get(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT html FROM render_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            self._disk_failed(e)
+            return None
+        with self._lock:
+            if row:
+                self.disk_hits += 1
+            else:
+                self.disk_misses += 1
+        return row[0] if row else None
+
+    def _disk_set(self, key, html):
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO render_cache (key, html, created_at) VALUES (?, ?, ?)",
+                (key, html, time.time()),
+            )
+        except Exception as e:
+            self._disk_failed(e)
+
+    # ── Public API ──────────────────────────────────────────────────────────
+
+    def get(self, key):
+        html = self.memory.get(key)
+        if html is not None:
+            return html
+        if self._disk_ok:
+            html = self._disk_get(key)
+            if html is not None:
+                self.memory.set(key, html)
+        return html
+
+    def set(self, key, html):
+        self.memory.set(key, html)
+        with self._lock:
+            self.stores += 1
+        if self._disk_ok:
+            self._disk_set(key, html)
+
+    def disk_entries(self):
+        if not self._disk_ok:
+            return 0
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM render_cache").fetchone()[0]
+        except Exception as e:
+            self._disk_failed(e)
+            return None
+
+    def stats(self):
+        """Counters for this process (each gunicorn worker keeps its own)."""
+        memory = self.memory.stats()
+        entries = self.disk_entries()
+        with self._lock:
+            disk = {
+                "path": self.path,
+                "entries": entries,
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "errors": self.disk_errors,
+            }
+            stores = self.stores
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + disk["hits"]
+        return {
+            "pid": os.getpid(),
+            "renderer_versions": RENDERER_VERSIONS,
+            "memory": memory,
+            "disk": disk,
+            "stores": stores,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+# ── Per-process singleton ──────────────────────────────────────────────────────
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache(path=None, maxsize=4096):
+    """Return this process's render cache, creating it on first use (fork-safe)."""
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = RenderCache(path=path, maxsize=maxsize)
+                _cache_pid = pid
+    return _cache
@@ -0,0 +1,313 @@
+"""Pool of pre-warmed Python worker processes with hard timeouts and backpressure.
+
+For CPU-heavy work that must not run on a request thread (sympy equivalence,
+FEVAL rule evaluation). Each worker is a separate interpreter running a
+*worker module* — a plain .py file loaded by path, so the child never imports
+the Flask app or the qb package. The module defines:
+
+    HANDLERS = {'op_name': function}     # called as function(**args), result must be JSON-serialisable
+    def warmup(): ...                     # optional — runs once before the worker reports ready
+
+and the parent talks to it over line-delimited JSON on stdin/stdout through
+LineWorker, the process wrapper the KaTeX pool uses too:
+
+    pool = get_worker_pool('equiv', script=EQUIV_WORKER, size=2, timeout=5, max_queue=8)
+    result = pool.call('equiv', user_expr='2x', correct_expr='x+x', variables=['x'])
+
+Per-pool settings for the child (e.g. its rlimits) go in ``env=``, which is
+merged over the parent's environment; the worker module applies them itself,
+typically in warmup().
+
+Guarantees:
+  * a call that exceeds its timeout kills the worker process and a fresh one
+    is started in its place (WorkerTimeout is raised);
+  * at most size + max_queue calls are admitted at once — beyond that, or if
+    no worker frees up in time, PoolBusy is raised so the caller can answer 503;
+  * a worker that crashes is replaced and the call raises WorkerError.
+"""
+
+import atexit
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# A fresh worker must import its libraries and report ready within this long
+_STARTUP_TIMEOUT = 60  # seconds
+
+
+class WorkerError(Exception):
+    """A worker died, answered with garbage, or the handler raised."""
+
+
+class WorkerTimeout(WorkerError):
+    """A call ran past its timeout; the worker was killed."""
+
+
+class PoolBusy(Exception):
+    """Too many calls in flight; try again shortly."""
+
+
+class LineWorker:
+    """One long-lived child process speaking line-delimited JSON on stdin/stdout.
+
+    Every request is sent with a fresh ``id`` and only the response carrying
+    that id is returned; answers to requests abandoned after a timeout are
+    skipped. Shared by this module's pool and the KaTeX pool (qb/katex_pool.py).
+    """
+
+    def __init__(self, argv, env=None, stderr=None):
+        self.proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+            env={**os.environ, **env} if env else None,
+        )
+        self._lines = queue.Queue()
+        self._ids = itertools.count(1)
+        self.last_used = time.monotonic()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+
+    def _read_stdout(self):
+        """Forward stdout lines to the response queue; None marks EOF."""
+        try:
+            for line in self.proc.stdout:
+                self._lines.put(line)
+        except Exception:
+            pass
+        self._lines.put(None)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def _next(self, deadline, timeout_error):
+        remaining = deadline - time.monotonic()
+        try:
+            line = self._lines.get(timeout=max(remaining, 0))
+        except queue.Empty:
+            raise timeout_error
+        if line is None:
+            raise WorkerError("worker exited")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise WorkerError(f"bad response: {line[:200]!r}")
+
+    def request(self, payload, timeout):
+        """Send ``payload`` and return the matching response dict.
+
+        Raises WorkerTimeout after ``timeout`` seconds, WorkerError if the
+        process exits, can't be written to or answers garbage.
+        """
+        req_id = next(self._ids)
+        try:
+            self.proc.stdin.write(json.dumps(dict(payload, id=req_id)) + '\n')
+            self.proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise WorkerError(f"write failed: {e}")
+        deadline = time.monotonic() + timeout
+        while True:
+            response = self._next(deadline, WorkerTimeout(f"timed out after {timeout}s"))
+            if response.get('id') == req_id:
+                self.last_used = time.monotonic()
+                return response
+
+    def close(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=2)
+        except Exception:
+            pass
+
+
+class _Worker(LineWorker):
+    """One long-lived ``python worker_pool.py <script>`` process."""
+
+    def __init__(self, script, env=None):
+        super().__init__([sys.executable, os.path.abspath(__file__), script], env=env)
+        self.ready = False
+
+    def wait_ready(self, timeout=_STARTUP_TIMEOUT):
+        if self.ready:
+            return
+        deadline = time.monotonic() + timeout
+        while not self.ready:
+            if self._next(deadline, WorkerError("worker did not start in time")).get('ready'):
+                self.ready = True
+
+
+class WorkerPool:
+    """Fixed-size pool of warm worker processes (see module docstring)."""
+
+    def __init__(self, script, size=2, timeout=5, max_queue=8, env=None, name='pool'):
+        self.script = script
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.max_queue = max(int(max_queue), 0)
+        self.env = env
+        self.name = name
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size + self.max_queue)
+        self._closed = False
+        self.calls = 0
+        self.timeouts = 0
+        self.busy_rejections = 0
+        self.restarts = 0
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = _Worker(self.script, self.env)
+        logger.info("[WORKER_POOL:%s] started worker pid=%s", self.name, worker.proc.pid)
+        return worker
+
+    def _replace(self, worker, reason):
+        logger.warning("[WORKER_POOL:%s] replacing worker pid=%s (%s)", self.name, worker.proc.pid, reason)
+        worker.close()
+        self.restarts += 1
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def _checkout(self, wait):
+        try:
+            worker = self._idle.get(timeout=wait)
+        except queue.Empty:
+            raise PoolBusy(f"{self.name}: no worker free within {wait}s")
+        if not worker.alive():
+            self._replace(worker, "died while idle")
+            return self._checkout(wait)
+        try:
+            worker.wait_ready()
+        except WorkerError as e:
+            self._replace(worker, e)
+            raise
+        return worker
+
+    def call(self, op, timeout=None, **args):
+        """Run HANDLERS[op](**args) in a worker and return its result.
+
+        Raises PoolBusy (over capacity), WorkerTimeout (killed after ``timeout``)
+        or WorkerError (crash / handler exception).
+        """
+        timeout = timeout or self.timeout
+        if self._closed:
+            raise WorkerError(f"{self.name}: pool closed")
+        if not self._slots.acquire(blocking=False):
+            self.busy_rejections += 1
+            raise PoolBusy(f"{self.name}: {self.size + self.max_queue} calls already in flight")
+        try:
+            worker = self._checkout(wait=timeout)
+            self.calls += 1
+            try:
+                response = worker.request({'op': op, 'args': args}, timeout)
+            except WorkerTimeout:
+                self.timeouts += 1
+                self._replace(worker, "timeout")
+                raise
+            except WorkerError as e:
+                self._replace(worker, e)
+                raise
+            self._idle.put(worker)
+            if not response.get('ok'):
+                raise WorkerError(response.get('error') or 'handler failed')
+            return response.get('result')
+        except PoolBusy:
+            self.busy_rejections += 1
+            raise
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "pid": os.getpid(),
+            "size": self.size,
+            "max_queue": self.max_queue,
+            "idle": self._idle.qsize(),
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "busy_rejections": self.busy_rejections,
+            "restarts": self.restarts,
+        }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ── Per-process registry ───────────────────────────────────────────────────────
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(name, script, **kwargs):
+    """Return this process's pool called ``name``, creating (and warming) it on first use."""
+    global _pools, _pools_pid
+    pid = os.getpid()
+    with _pools_lock:
+        if _pools_pid != pid:
+            _pools, _pools_pid = {}, pid   # forked: the parent's workers are not ours
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = WorkerPool(script, name=name, **kwargs)
+    return pool
+
+
+@atexit.register
+def _shutdown_pools():
+    if _pools_pid == os.getpid():
+        for pool in _pools.values():
+            pool.close()
+
+
+# ── Worker side ────────────────────────────────────────────────────────────────
+
+def _serve(script):
+    """Child main loop: load the worker module, warm it up, answer requests."""
+    spec = importlib.util.spec_from_file_location('_pool_worker', script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, 'warmup'):
+        module.warmup()
+    handlers = module.HANDLERS
+
+    # Protocol goes to the real stdout; stray prints from libraries go to stderr
+    out, sys.stdout = sys.stdout, sys.stderr
+    out.write(json.dumps({'ready': True}) + '\n')
+    out.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get('id')
+            result = handlers[req['op']](**(req.get('args') or {}))
+            response = {'id': req_id, 'ok': True, 'result': result}
+        except Exception as e:
+            response = {'id': req_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        out.write(json.dumps(response) + '\n')
+        out.flush()
+
+
+if __name__ == '__main__':
+    sys.path.pop(0)  # don't let qb/*.py shadow top-level modules in the child
+    _serve(sys.argv[1])
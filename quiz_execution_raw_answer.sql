@@ -0,0 +1,7 @@
+-- DDL for prod.quiz_execution.raw_answer
+-- The answer exactly as the quiz page sent it (option id, id list, blank map,
+-- expression, ...). qb/grading.py grades from this column, so submissions can
+-- be regraded after an answer-key fix. Rows written before this column
+-- existed keep raw_answer NULL and only have the display string in user_answer.
+
+ALTER TABLE prod.quiz_execution ADD COLUMN raw_answer JSON;
@@ -0,0 +1,22 @@
+-- DDL for prod.quiz_question
+-- Reverse index of quiz.question_ids (comma-separated, still the source of truth).
+-- Kept in sync by qb.db_utils.set_quiz_question_ids(); lets "which quizzes use
+-- question X" be an indexed lookup instead of a LIKE scan over quiz.question_ids.
+
+CREATE TABLE prod.quiz_question (
+    quiz_id     INTEGER NOT NULL REFERENCES prod.quiz(id) ON DELETE CASCADE,
+    position    INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    PRIMARY KEY (quiz_id, position)
+);
+
+CREATE INDEX ix_quiz_question_question_id ON prod.quiz_question (question_id);
+
+-- Backfill from existing quizzes (safe to re-run; same statement as
+-- POST /quiz/api/admin/backfill-quiz-questions)
+DELETE FROM prod.quiz_question;
+INSERT INTO prod.quiz_question (quiz_id, position, question_id)
+SELECT q.id, t.ord - 1, trim(t.qid)::int
+FROM prod.quiz q
+CROSS JOIN LATERAL unnest(string_to_array(q.question_ids, ',')) WITH ORDINALITY AS t(qid, ord)
+WHERE trim(t.qid) ~ '^[0-9]+$';
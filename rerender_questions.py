@@ -0,0 +1,94 @@
+"""
+Re-render the stored HTML of every question bank entry whose render stamp is stale.
+
+Read paths serve q_bank.json's stored html only while q_bank.render_version
+matches the running app (see qb.handlers.common.render_version); after a
+KaTeX upgrade, a LATEX_RENDERER switch or an HTML_VERSION bump, run this once
+so they stop rendering on every request:
+
+    python rerender_questions.py               # stale rows only
+    python rerender_questions.py --all         # every row
+    python rerender_questions.py --workers 4 --batch 200 --dry-run
+
+Rows are split into batches rendered by parallel threads; each batch renders
+its math spans in one KaTeX round trip, then commits. Re-rendered questions
+are flagged sync_required, so the next quiz sync refreshes quiz snapshots.
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import or_
+
+from app import app
+from db import db
+from models import QBank
+from qb.handlers.common import prerender_math, question_latex_strings, render_version, rerender_question_html
+
+
+def stale_question_ids(version, everything=False):
+    query = db.session.query(QBank.id)
+    if not everything:
+        query = query.filter(or_(QBank.render_version.is_(None), QBank.render_version != version))
+    return [qid for (qid,) in query.order_by(QBank.id).all()]
+
+
+def rerender_batch(ids, version):
+    """Re-render one batch in its own app context and session. Returns the number of rows written."""
+    with app.app_context():
+        try:
+            rows = QBank.query.filter(QBank.id.in_(ids)).all()
+            prerender_math(text for q in rows for text in question_latex_strings(q.json))
+            for q in rows:
+                q.json = rerender_question_html(q.json)
+                q.render_version = version
+                q.sync_required = True
+            db.session.commit()
+            return len(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--all', action='store_true', help='re-render every question, not just stale ones')
+    parser.add_argument('--workers', type=int, default=None, help='parallel batches (default: KATEX_POOL_SIZE)')
+    parser.add_argument('--batch', type=int, default=100, help='questions per batch (default: 100)')
+    parser.add_argument('--dry-run', action='store_true', help='only count the questions that would be re-rendered')
+    args = parser.parse_args()
+
+    with app.app_context():
+        version = render_version()
+        ids = stale_question_ids(version, everything=args.all)
+        workers = args.workers or app.config.get("KATEX_POOL_SIZE", 2)
+    print(f"Render version {version}: {len(ids)} question(s) to re-render")
+    if args.dry_run or not ids:
+        return 0
+
+    batches = [ids[i:i + args.batch] for i in range(0, len(ids), args.batch)]
+    started = time.time()
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {executor.submit(rerender_batch, batch, version): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                done += future.result()
+            except Exception as e:
+                failed += len(batch)
+                print(f"  batch {batch[0]}..{batch[-1]} failed: {e}")
+            print(f"  {done}/{len(ids)} re-rendered")
+
+    print(f"Done in {time.time() - started:.1f}s: {done} re-rendered, {failed} failed")
+    if done:
+        print("Run the quiz sync to refresh quiz snapshots.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+/**
+ * Background job polling
+ * Shared by the question and quiz lists for resync and regrade jobs
+ * (see qb/jobs.py and GET /quiz/api/jobs/<job_id>).
+ */
+
+// Poll a background job until it finishes; resolves with its result
+function waitForJob(jobId, onProgress) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(`/quiz/api/jobs/${jobId}`)
+                .then(r => r.json())
+                .then(j => {
+                    if (!j.ok) return reject(new Error(j.error));
+                    if (j.status === 'done') return resolve(j.result);
+                    if (j.status === 'failed') return reject(new Error(j.error));
+                    onProgress(j);
+                    setTimeout(poll, 1000);
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
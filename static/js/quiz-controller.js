@@ -214,6 +214,7 @@ class QuizController {
                 user_answer:       userAnswerStr,
                 correct_answer:    correctAnswerStr,
                 is_correct:        isCorrect,
+                answer:            answer,   // raw — the server regrades from this
             };
             const res = await fetch('/quiz/api/submit-answer', {
                 method:  'POST',
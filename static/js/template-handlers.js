@@ -624,15 +624,24 @@ class TemplateHandlerALGEBRA extends TemplateHandler {
         }
 
         try {
-            const res = await fetch('/quiz/api/check-expr-equiv', {
-                method:  'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    user_expr:    answer,
-                    correct_expr: this.question.answer?.canonical || '',
-                    variables:    this.question.answer?.variables || [],
-                }),
+            const body = JSON.stringify({
+                question_id:  this.question.id,
+                user_expr:    answer,
+                correct_expr: this.question.answer?.canonical || '',
+                variables:    this.question.answer?.variables || [],
             });
+            let res;
+            // 503 = server's sympy pool is busy; back off and retry a few times
+            for (let attempt = 0; attempt < 4; attempt++) {
+                res = await fetch('/quiz/api/check-expr-equiv', {
+                    method:  'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body,
+                });
+                if (res.status !== 503) break;
+                const wait = (parseFloat(res.headers.get('Retry-After')) || 1) * 1000 * (attempt + 1);
+                await new Promise(resolve => setTimeout(resolve, wait));
+            }
             if (!res.ok) { console.log('[ALGEBRA] fetch not ok:', res.status); return false; }
             const data = await res.json();
             console.log('[ALGEBRA] sympy result:', data);
@@ -0,0 +1,12 @@
+-- DDL for prod.student_dashboard
+-- One stored /student-new snapshot per student (lms/dashboard.py). A NULL
+-- data column means stale: the next page load rebuilds it. Writers bump
+-- generation when they invalidate, so a snapshot built from older data is
+-- not stored over a newer change.
+
+CREATE TABLE prod.student_dashboard (
+    user_id    INTEGER PRIMARY KEY REFERENCES prod.user_table(id) ON DELETE CASCADE,
+    data       JSON,
+    generation INTEGER NOT NULL DEFAULT 0,
+    built_at   TIMESTAMP
+);
@@ -0,0 +1,43 @@
+"""Micro-benchmark: latex_to_html against the scanner at another git revision.
+
+    python tests/bench_latex_to_html.py              # compare with b02fb2c (the char-by-char scanner)
+    python tests/bench_latex_to_html.py HEAD~5 2000  # revision, repetitions
+
+Math rendering is replaced by the golden test's marker, so the numbers are
+for the scanner alone. Stems are built from the sample corpus at increasing
+lengths, with nested formatting commands, to show how each scales.
+"""
+
+import os
+import sys
+import timeit
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_latex_to_html import common, corpus_strings, reference_latex_to_html, render_marker  # noqa: E402
+
+NESTED = r'\textbf{Find $x$ if \textit{both $x^2 = 4$ and \underline{$x > 0$}}} \\ '
+
+
+def stems():
+    corpus = ' '.join(s for s in corpus_strings() if '$' in s or '\\' in s)
+    yield 'corpus', corpus
+    for repeat in (10, 100, 1000):
+        yield f'nested x{repeat}', NESTED * repeat
+
+
+def main(rev='b02fb2c', number=200):
+    reference = reference_latex_to_html(rev)
+    print(f"{'stem':<14} {'chars':>8} {rev:>12} {'current':>12} {'speedup':>8}")
+    with mock.patch.object(common, '_render_math', render_marker):
+        for name, stem in stems():
+            assert common.latex_to_html(stem) == reference(stem), name
+            n = max(number * 1000 // max(len(stem), 1), 1)
+            old = min(timeit.repeat(lambda: reference(stem), number=n, repeat=3)) / n
+            new = min(timeit.repeat(lambda: common.latex_to_html(stem), number=n, repeat=3)) / n
+            print(f"{name:<14} {len(stem):>8} {old * 1e6:>10.1f}us {new * 1e6:>10.1f}us {old / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(sys.argv[1:2] or ['b02fb2c']), *[int(a) for a in sys.argv[2:3]])
@@ -0,0 +1,108 @@
+"""Tests for the FEVAL vector path (qb/feval_rules.py).
+
+The sandbox is replaced by qb.feval_sandbox.evaluate called directly, so
+these run without a worker pool or an app context.
+
+    python -m pytest tests/test_feval_rules.py
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/test")
+
+from qb import feval_rules, feval_sandbox  # noqa: E402
+
+
+def sandbox_run(expressions, rows):
+    return feval_sandbox.evaluate(expressions, rows)
+
+
+@unittest.skipIf(feval_rules.np is None, "numpy is not installed")
+class ConstantSubtreeTest(unittest.TestCase):
+    """Big constant powers must never be computed in the web process."""
+
+    RULES = {
+        'a > 0 and 9**9**9 > 0': False,     # the sandbox's size guard refuses 9**9**9
+        '7**7**7 > a': False,
+        'a * 9**9**9 == 0': False,
+        'max(a, 10**400) > 0': True,        # fine as a Python int, too big for float64
+    }
+
+    def test_goes_to_sandbox(self):
+        columns = {'a': ['1', '2', '3']}
+        for rule, expected in self.RULES.items():
+            with self.subTest(rule=rule), \
+                    mock.patch.object(feval_rules, '_run', side_effect=sandbox_run) as run:
+                started = time.monotonic()
+                self.assertIsNotNone(feval_rules.compile_rule(rule).vector_code)
+                _, per_rule = feval_rules.evaluate_batch([rule], columns)
+                self.assertLess(time.monotonic() - started, 1)
+                run.assert_called_once()
+                self.assertEqual(per_rule, [[expected] * 3])
+
+    def test_small_constants_stay_vectorised(self):
+        with mock.patch.object(feval_rules, '_run', side_effect=sandbox_run) as run:
+            _, per_rule = feval_rules.evaluate_batch(
+                ['a**2 + 3 == 7', 'round(a / 3, 2) == 0.67'], {'a': ['2', '-2', '1']})
+        run.assert_not_called()
+        self.assertEqual(per_rule, [[True, True, False], [True, False, False]])
+
+
+
+@unittest.skipIf(feval_rules.np is None, "numpy is not installed")
+class PathParityTest(unittest.TestCase):
+    """Wherever the vector path answers, it agrees with the sandbox."""
+
+    COLUMNS = {
+        'a': ['9007199254740992', '-9007199254740992', '94906267', '67108865', '3', '0.1', '0', '-7'],
+        'b': ['1', '-1', '94906267', '67108863', '0', '0.2', '2', '-10'],
+    }
+    RULES = [
+        'a + 1 == 9007199254740992',
+        'a - 1 == -9007199254740992',
+        'a * a == 9007199136250225 + 64',
+        'a * b - 1 == 4503599761588224',
+        'a * a > 9007199254740991',
+        'a ** 2 == a * a',
+        'a == 9007199254740993',
+        '2 ** 53 + 1 == 2 ** 53',
+        'a / b > 1',
+        'a // b == 0 or a % b == 0',
+        'abs(a + b) == 0.3',
+        'round(a + b, 1) == 0.3',
+        'max(a, b) - min(a, b) >= 2',
+        'a + b == -17 and not a > 0',
+        '0 < a < b',
+    ]
+
+    def test_same_verdicts(self):
+        n = len(self.COLUMNS['a'])
+        rows = [{name: vals[k] for name, vals in self.COLUMNS.items()} for k in range(n)]
+        converted = {name: [feval_sandbox.rule_value(v) for v in vals] for name, vals in self.COLUMNS.items()}
+        vectorised = 0
+        for rule in self.RULES:
+            with self.subTest(rule=rule):
+                expected = feval_sandbox.evaluate([rule], rows)[0]
+                vector = feval_rules._evaluate_vector(feval_rules.compile_rule(rule), converted, n)
+                if vector is not None:
+                    vectorised += 1
+                    self.assertEqual(vector, expected)
+                with mock.patch.object(feval_rules, '_run', side_effect=sandbox_run):
+                    _, per_rule = feval_rules.evaluate_batch([rule], self.COLUMNS)
+                self.assertEqual(per_rule, [expected])
+        self.assertGreater(vectorised, 0)
+
+    def test_rounded_intermediate_goes_to_sandbox(self):
+        rule = feval_rules.compile_rule('a + 1 == 9007199254740992')
+        self.assertIsNone(feval_rules._evaluate_vector(rule, {'a': [2 ** 53]}, 1))
+        self.assertEqual(feval_sandbox.evaluate([rule.expression], [{'a': str(2 ** 53)}]), [[False]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Golden-file test for latex_to_html.
+
+tests/golden/latex_to_html.json holds every distinct string in
+questions.json, questions2.json and fromDB.json, plus a few hand-written
+edge cases, with the HTML the original character-by-character scanner
+produced for it. The tokenizer must reproduce that output byte for byte.
+
+Math spans are rendered with a deterministic marker instead of KaTeX or
+latex2mathml, so the test checks the scanner (which spans are found, in
+which mode, and everything around them) without node or an app context.
+
+    python -m pytest tests/test_latex_to_html.py
+    python tests/test_latex_to_html.py --regenerate b02fb2c   # rebuild from that revision's scanner
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/test")
+
+from qb.handlers import common  # noqa: E402
+
+GOLDEN = os.path.join(ROOT, 'tests', 'golden', 'latex_to_html.json')
+SOURCES = ('questions.json', 'questions2.json', 'fromDB.json')
+
+EDGE_CASES = [
+    '',
+    '$',
+    '$$',
+    '$$$',
+    'a $x',
+    'a $$x$ b',
+    r'\$5 and $x$ and \$',
+    r'\\\\',
+    'line one\nline two\\\\three',
+    r'\textbf{bold $x^{2}$ \textit{both \underline{all \texttt{four}}}} after',
+    r'\textbf{unclosed $x$',
+    r'\textbf{a}\textit{b}\underline{}\texttt{{nested} braces}',
+    r'\textbf{$}$ inside}',
+    r'\textit{\[ x \] and \( y \)} \[ open',
+    r'\( unclosed paren',
+    r'$$\frac{1}{2}$$ then $\sqrt{2}$',
+    r'\textbf{\textbf{\textbf{deep}}}',
+    r'\textbf {space before brace}',
+    r'\textbfx{not a command}',
+]
+
+
+def render_marker(inner, display_mode):
+    return f'<math mode="{"block" if display_mode else "inline"}">{inner}</math>'
+
+
+def corpus_strings():
+    """Distinct strings of the sample question files plus EDGE_CASES, sorted."""
+    found = set(EDGE_CASES)
+
+    def walk(node):
+        if isinstance(node, dict):
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+        elif isinstance(node, str):
+            found.add(node)
+
+    for name in SOURCES:
+        with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+            walk(json.load(f))
+    return sorted(found)
+
+
+def reference_latex_to_html(rev):
+    """latex_to_html as implemented in qb/handlers/common.py at git revision ``rev``."""
+    source = subprocess.run(['git', 'show', f'{rev}:qb/handlers/common.py'], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    namespace = {'__name__': f'common_{rev}',
+                 '__file__': os.path.join(ROOT, 'qb', 'handlers', 'common.py')}
+    exec(compile(source, f'{rev}:qb/handlers/common.py', 'exec'), namespace)
+    namespace['_render_math'] = render_marker
+    return namespace['latex_to_html']
+
+
+def regenerate(rev):
+    latex_to_html = reference_latex_to_html(rev)
+    cases = [{'latex': s, 'html': latex_to_html(s)} for s in corpus_strings()]
+    with open(GOLDEN, 'w', encoding='utf-8') as f:
+        json.dump({'revision': rev, 'cases': cases}, f, ensure_ascii=False, indent=1)
+        f.write('\n')
+    print(f"wrote {len(cases)} cases from {rev} to {GOLDEN}")
+
+
+class LatexToHtmlGoldenTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(GOLDEN, encoding='utf-8') as f:
+            cls.cases = json.load(f)['cases']
+
+    def test_matches_golden_output(self):
+        with mock.patch.object(common, '_render_math', render_marker):
+            for case in self.cases:
+                with self.subTest(latex=case['latex'][:60]):
+                    self.assertEqual(common.latex_to_html(case['latex']), case['html'])
+
+    def test_golden_covers_corpus(self):
+        self.assertEqual([c['latex'] for c in self.cases], corpus_strings())
+
+    def test_non_string_passthrough(self):
+        self.assertIsNone(common.latex_to_html(None))
+        self.assertEqual(common.latex_to_html(5), 5)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--regenerate':
+        regenerate(sys.argv[2])
+    else:
+        unittest.main()
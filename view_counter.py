@@ -0,0 +1,192 @@
+"""Write-behind buffer for view counters.
+
+Page views used to run an UPDATE + commit on every click. Instead, increments
+are coalesced in memory per (user, item) and flushed every VIEW_FLUSH_SECONDS
+with one multi-row UPDATE per table, plus a final flush at process exit.
+
+    from view_counter import view_counter
+    view_counter.init_app(app)                              # in app.py
+    view_counter.hit_work_item(username, 'Q-0012')          # my_work_list.views
+    view_counter.hit_user_work(username, pack_id, work_id)  # user_works.work_views
+
+Counts are at-least-once per flush window: a failed flush puts its increments
+back in the buffer. A hard kill loses at most one window of views.
+VIEW_FLUSH_SECONDS = 0 writes through on every hit (handy locally).
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from db import db
+from models import MyWorkList, UserWorks
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 5.0
+        self._work_items = {}   # (username, item_code)        -> increments
+        self._user_works = {}   # (username, pack_id, work_id) -> increments
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread_pid = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.merged = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(app.config.get("VIEW_FLUSH_SECONDS", 5))
+        app.extensions["view_counter"] = self
+        atexit.register(self._shutdown)
+
+    # ── Recording ───────────────────────────────────────────────────────────
+
+    def hit_work_item(self, username, item_code):
+        """Count one view of a my_work_list item (quiz, video, interaction)."""
+        self._add(self._work_items, (username, item_code))
+
+    def hit_user_work(self, username, pack_id, work_id):
+        """Count one click on a legacy pack work (user_works)."""
+        self._add(self._user_works, (username, int(pack_id), int(work_id)))
+
+    def _add(self, bucket, key):
+        with self._lock:
+            bucket[key] = bucket.get(key, 0) + 1
+            self.hits += 1
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    # ── Flushing ────────────────────────────────────────────────────────────
+
+    def _ensure_thread(self):
+        """Start the flusher lazily, once per process (gunicorn forks after import)."""
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+            self._stop.clear()
+            threading.Thread(target=self._run, name="view-counter-flush", daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            work_items, self._work_items = self._work_items, {}
+            user_works, self._user_works = self._user_works, {}
+        return work_items, user_works
+
+    def _restore(self, work_items, user_works):
+        with self._lock:
+            for key, n in work_items.items():
+                self._work_items[key] = self._work_items.get(key, 0) + n
+            for key, n in user_works.items():
+                self._user_works[key] = self._user_works.get(key, 0) + n
+
+    def flush(self):
+        """Write all buffered increments now. Returns the number of increments written."""
+        with self._flush_lock:
+            work_items, user_works = self._take()
+            if not work_items and not user_works:
+                return 0
+            increments = sum(work_items.values()) + sum(user_works.values())
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        if work_items:
+                            self._flush_work_items(conn, work_items)
+                        if user_works:
+                            self._flush_user_works(conn, user_works)
+            except Exception as e:
+                self._restore(work_items, user_works)
+                self.failures += 1
+                logger.warning("[VIEW_COUNTER] flush of %d increments failed, will retry: %s", increments, e)
+                return 0
+
+            rows = len(work_items) + len(user_works)
+            self.flushes += 1
+            self.rows_flushed += rows
+            self.merged += increments - rows
+            self.last_flush = time.time()
+            logger.info("[VIEW_COUNTER] flushed %d increments into %d rows (%d merged)",
+                        increments, rows, increments - rows)
+            return increments
+
+    @staticmethod
+    def _flush_work_items(conn, pending):
+        # One row per (user, item_code): the lowest id, same row .first() used to pick
+        users, codes, counts = zip(*[(u, c, n) for (u, c), n in pending.items()])
+        conn.execute(text(f"""
+            UPDATE {MyWorkList.__table__.fullname} m
+            SET views        = coalesce(m.views, 0) + v.n,
+                last_updated = now()
+            FROM (
+                SELECT DISTINCT ON (w."user", w.item_code) w.id, p.n
+                FROM unnest(CAST(:users AS text[]), CAST(:codes AS text[]), CAST(:counts AS int[]))
+                     AS p(username, item_code, n)
+                JOIN {MyWorkList.__table__.fullname} w
+                  ON w."user" = p.username AND w.item_code = p.item_code
+                ORDER BY w."user", w.item_code, w.id
+            ) v
+            WHERE m.id = v.id
+        """), {'users': list(users), 'codes': list(codes), 'counts': list(counts)})
+        # Views drive the dashboard's unread markers (imported here: lms.routes imports this module)
+        from lms.dashboard import invalidate_dashboards
+        invalidate_dashboards(usernames=set(users), conn=conn)
+
+    @staticmethod
+    def _flush_user_works(conn, pending):
+        users, packs, works, counts = zip(*[(u, p, w, n) for (u, p, w), n in pending.items()])
+        conn.execute(text(f"""
+            UPDATE {UserWorks.__table__.fullname} uw
+            SET work_views   = coalesce(uw.work_views, 0) + v.n,
+                last_updated = CURRENT_TIMESTAMP
+            FROM unnest(CAST(:users AS text[]), CAST(:packs AS int[]), CAST(:works AS int[]),
+                        CAST(:counts AS int[])) AS v(username, pack_id, work_id, n)
+            WHERE uw.username = v.username
+              AND uw.pack_id  = v.pack_id
+              AND uw.work_id  = v.work_id
+        """), {'users': list(users), 'packs': list(packs), 'works': list(works), 'counts': list(counts)})
+
+    def _shutdown(self):
+        self._stop.set()
+        if self.app is not None and self._thread_pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = sum(self._work_items.values()) + sum(self._user_works.values())
+        return {
+            "pid": os.getpid(),
+            "interval": self.interval,
+            "hits": self.hits,
+            "pending": pending,
+            "merged": self.merged,
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_flush": self.last_flush,
+        }
+
+
+view_counter = ViewCounter()